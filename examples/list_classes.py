@@ -18,7 +18,10 @@
 #
 # You should have received a copy of the GNU Library General Public 
 # along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
-"""This script list classes and optionally attributes from UML model created with Gaphor."""
+"""This script list classes and optionally attributes from UML model created with Gaphor.
+
+If the model has an element index (see gaphor.storage.index), only the
+classes and their attributes are read from the model file."""
 
 from __future__ import absolute_import
 from __future__ import print_function
@@ -28,6 +31,7 @@ import sys
 
 from gaphor.UML import uml2
 from gaphor import Application
+from gaphor.storage import index
 
 # Setup command line options.
 usage = 'usage: %prog [options] file.gaphor'
@@ -52,11 +56,18 @@ Application.init()
 element_factory = Application.get_service('element_factory')
 file_manager = Application.get_service('file_manager')
 
-# Load model from file.
-file_manager.load(model)
+if index.exists(model):
+    # Load just the classes, and the attributes they own.
+    with index.ModelIndex(model) as model_index:
+        classes = model_index.load(element_factory, model_index.select(uml2.Class))
+else:
+    # Load model from file.
+    file_manager.load(model)
+
+    # Find all classes using factory select.
+    classes = element_factory.select(lambda e: e.isKindOf(uml2.Class))
 
-# Find all classes using factory select.
-for cls in element_factory.select(lambda e: e.isKindOf(uml2.Class)):
+for cls in classes:
 
     print('Found class %s' % cls.name)
 
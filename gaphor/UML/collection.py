@@ -71,16 +71,69 @@ class collectionlist(recursemixin, querymixin, getslicefix, list):
 class collection(object):
     """
     Collection (set-like) for model elements' 1:n and n:m relationships.
+
+    The items are kept in order in a list. A dictionary maps each item to
+    its position in the list, so membership tests and removal of items
+    are O(1). Removed items leave a hole (None) in the list, the holes are
+    cleaned up as soon as the items are requested in order (``items``).
     """
 
     def __init__(self, property, object, type):
         self.property = property
         self.object = object
         self.type = type
-        self.items = collectionlist()
+        self._items = collectionlist()
+        self._positions = {}
+        self._holes = 0
+
+    def _compact(self):
+        """
+        Remove the holes left by removed items, so the positions are
+        those of the items in order. This is O(n) if there are holes.
+        """
+        if self._holes:
+            items = self._items
+            items[:] = [v for v in items if v is not None]
+            self._positions = dict((v, i) for i, v in enumerate(items))
+            self._holes = 0
+
+    def _get_items(self):
+        self._compact()
+        return self._items
+
+    items = property(_get_items, doc="""
+        The items in the collection, as collectionlist.
+        The list should not be modified directly, use _add() and _remove().
+        """)
+
+    def _add(self, value):
+        """
+        Add value to the end of the collection. No events are sent.
+        """
+        self._positions[value] = len(self._items)
+        self._items.append(value)
+
+    def _remove(self, value):
+        """
+        Remove value from the collection. No events are sent.
+        Raises ValueError if the value is not in the collection.
+        """
+        try:
+            pos = self._positions.pop(value)
+        except KeyError:
+            raise ValueError('%s not in collection' % value)
+        items = self._items
+        if pos == len(items) - 1:
+            items.pop()
+            while items and items[-1] is None:
+                items.pop()
+                self._holes -= 1
+        else:
+            items[pos] = None
+            self._holes += 1
 
     def __len__(self):
-        return len(self.items)
+        return len(self._positions)
 
     def __setitem__(self, key, value):
         raise RuntimeError('items should not be overwritten.')
@@ -92,7 +145,10 @@ class collection(object):
         return self.items.__getitem__(key)
 
     def __contains__(self, obj):
-        return self.items.__contains__(obj)
+        try:
+            return obj in self._positions
+        except TypeError:
+            return False
 
     def __iter__(self):
         return iter(self.items)
@@ -103,7 +159,7 @@ class collection(object):
     __repr__ = __str__
 
     def __nonzero__(self):
-        return self.items != []
+        return bool(self._positions)
 
     def append(self, value):
         if isinstance(value, self.type):
@@ -112,7 +168,7 @@ class collection(object):
             raise TypeError('Object is not of type %s' % self.type.__name__)
 
     def remove(self, value):
-        if value in self.items:
+        if value in self:
             self.property.__delete__(self.object, value)
         else:
             raise ValueError('%s not in collection' % value)
@@ -120,17 +176,22 @@ class collection(object):
     def index(self, key):
         """
         Given an object, return the position of that object in the
-        collection.
+        collection. The first call after items have been removed is O(n),
+        following calls are O(1).
         """
-        return self.items.index(key)
+        self._compact()
+        try:
+            return self._positions[key]
+        except (KeyError, TypeError):
+            raise ValueError('%s not in collection' % key)
 
     # OCL members (from SMW by Ivan Porres, http://www.abo.fi/~iporres/smw)
 
     def size(self):
-        return len(self.items)
+        return len(self)
 
     def includes(self, o):
-        return o in self.items
+        return o in self
 
     def excludes(self, o):
         return not self.includes(o)
@@ -144,13 +205,13 @@ class collection(object):
 
     def includesAll(self, c):
         for o in c:
-            if o not in self.items:
+            if o not in self:
                 return 0
         return 1
 
     def excludesAll(self, c):
         for o in c:
-            if o in self.items:
+            if o in self:
                 return 0
         return 1
 
@@ -175,7 +236,7 @@ class collection(object):
         return result
 
     def isEmpty(self):
-        return len(self.items) == 0
+        return len(self) == 0
 
     def nonEmpty(self):
         return not self.isEmpty()
@@ -252,18 +313,92 @@ class collection(object):
         Swap two elements. Return true if swap was successful.
         """
         try:
-            i1 = self.items.index(item1)
-            i2 = self.items.index(item2)
-            self.items[i1], self.items[i2] = self.items[i2], self.items[i1]
+            positions = self._positions
+            i1 = positions[item1]
+            i2 = positions[item2]
+            items = self._items
+            items[i1], items[i2] = items[i2], items[i1]
+            positions[item1], positions[item2] = i2, i1
 
             # send a notification that this list has changed
             factory = self.object.factory
             if factory:
                 factory._handle(AssociationChangeEvent(self.object, self.property))
             return True
-        except IndexError as ex:
+        except KeyError as ex:
             return False
-        except ValueError as ex:
+        except TypeError as ex:
             return False
 
+
+class lazycollection(collection):
+    """
+    A collection of which some items have not been created yet, for example
+    the presentation of an element on diagrams that have not been shown.
+
+    ``load()`` is called as soon as the collection as a whole is used. It
+    should create the missing items, which are added to this collection.
+    After that the collection is an ordinary collection.
+
+    Membership tests, adding and removing items do not need to load: an
+    item that already exists is never one of the items still to be created.
+    Neither does a truth test if items have been created already.
+
+    ``refids()``, if given, returns the ids of the items still to be
+    created, so the collection can be saved (see ids()) and truth-tested
+    without loading.
+    """
+
+    def __init__(self, property, object, type, load, refids=None):
+        super(lazycollection, self).__init__(property, object, type)
+        self._load = load
+        self._refids = refids
+
+    def _resolve(self):
+        load = self._load
+        del self._load
+        self.__class__ = collection
+        load()
+
+    def loaded(self):
+        """
+        Return the items created so far, without creating the others.
+        """
+        return [v for v in self._items if v is not None]
+
+    def ids(self):
+        """
+        Return the ids of the items, without creating the missing ones.
+        """
+        if self._refids is None:
+            self._resolve()
+            return [v.id for v in self if v.id]
+        return [v.id for v in self.loaded() if v.id] + self._refids()
+
+    def _get_items(self):
+        self._resolve()
+        return self.items
+
+    items = property(_get_items)
+
+    def __len__(self):
+        self._resolve()
+        return len(self)
+
+    def __nonzero__(self):
+        if self._positions:
+            return True
+        if self._refids is not None:
+            return bool(self._refids())
+        self._resolve()
+        return bool(self)
+
+    def index(self, key):
+        self._resolve()
+        return self.index(key)
+
+    def swap(self, item1, item2):
+        self._resolve()
+        return self.swap(item1, item2)
+
 # vi:sw=4:et:ai
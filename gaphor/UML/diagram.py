@@ -39,7 +39,8 @@ class DiagramCanvas(gaphas.Canvas):
     """DiagramCanvas extends the gaphas.Canvas class.  Updates to the canvas
     can be blocked by setting the block_updates property to true.  A save
     function can be applied to all root canvas items.  Canvas items can be
-    selected with an optional expression filter."""
+    selected with an optional expression filter.  The modified flag is set
+    whenever an item is added, changed or removed."""
 
     def __init__(self, diagram):
         """Initialize the diagram canvas with the supplied diagram.  By default,
@@ -48,6 +49,7 @@ class DiagramCanvas(gaphas.Canvas):
         super(DiagramCanvas, self).__init__()
         self._diagram = diagram
         self._block_updates = False
+        self.modified = False
 
     diagram = property(lambda s: s._diagram)
 
@@ -68,6 +70,18 @@ class DiagramCanvas(gaphas.Canvas):
             return
         super(DiagramCanvas, self).update_now()
 
+    def request_update(self, item, update=True, matrix=True):
+        """Request an update of the item and mark the canvas modified."""
+
+        self.modified = True
+        super(DiagramCanvas, self).request_update(item, update, matrix)
+
+    def remove(self, item):
+        """Remove the item from the canvas and mark the canvas modified."""
+
+        self.modified = True
+        super(DiagramCanvas, self).remove(item)
+
     def save(self, save_func):
         """Apply the supplied save function to all root diagram items."""
 
@@ -87,14 +101,48 @@ class DiagramCanvas(gaphas.Canvas):
 
 class Diagram(Namespace, PackageableElement):
     """Diagrams may contain model elements and can be owned by a Package.
-    A diagram is a Namespace and a PackageableElement."""
+    A diagram is a Namespace and a PackageableElement.
+
+    Creation of the canvas items can be deferred until the canvas is
+    used, see defer_canvas()."""
 
     def __init__(self, id=None, factory=None):
         """Initialize the diagram with an optional id and element factory.
         The diagram also has a canvas."""
 
         super(Diagram, self).__init__(id, factory)
-        self.canvas = DiagramCanvas(self)
+        self._canvas = DiagramCanvas(self)
+        self._canvas_loader = None
+
+    def _get_canvas(self):
+        """Return the canvas.  Deferred canvas items are created first."""
+
+        if self._canvas_loader is not None:
+            self.load_canvas()
+        return self._canvas
+
+    canvas = property(_get_canvas)
+
+    def defer_canvas(self, loader):
+        """Defer the creation of the canvas items.  The supplied loader is
+        called with the diagram as argument as soon as the canvas is used.
+        The loader should add the items to the canvas.  If loader is None,
+        items that have not been created yet are discarded."""
+
+        self._canvas_loader = loader
+
+    def load_canvas(self):
+        """Create the deferred canvas items, if any."""
+
+        loader = self._canvas_loader
+        if loader is not None:
+            self._canvas_loader = None
+            loader(self)
+
+    canvas_deferred = property(lambda s: s._canvas_loader is not None)
+
+    canvas_loader = property(lambda s: s._canvas_loader,
+                             doc="The loader of the deferred canvas items, if any")
 
     def save(self, save_func):
         """Apply the supplied save function to this diagram and the canvas."""
@@ -103,9 +151,11 @@ class Diagram(Namespace, PackageableElement):
         save_func('canvas', self.canvas)
 
     def postload(self):
-        """Handle post-load functionality for the diagram canvas."""
+        """Handle post-load functionality for the diagram canvas.  A deferred
+        canvas is handled by its loader."""
         super(Diagram, self).postload()
-        self.canvas.postload()
+        if self._canvas_loader is None:
+            self._canvas.postload()
 
     def create(self, type, parent=None, subject=None):
         """Create a new canvas item on the canvas. It is created with
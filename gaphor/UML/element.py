@@ -25,19 +25,106 @@ Base class for UML model elements.
 
 from __future__ import absolute_import
 
-import threading
 import uuid
 
-from .properties import umlproperty
+import six
 
-__all__ = ['Element']
+from .properties import umlproperty, attribute, enumeration, association, \
+                        derived, redefine
 
+__all__ = ['Element', 'ElementMeta', 'PropertyTable', 'property_table']
 
+
+class PropertyTable(object):
+    """
+    The UML properties of an Element class, computed once per class.
+
+    all
+        all UML properties, used for postload() and unlink()
+    persistent
+        properties that write a value on save()
+    derived
+        derived properties (derived unions and custom derived properties)
+    associations
+        persistent properties that refer to other elements
+    """
+
+    __slots__ = ('all', 'persistent', 'derived', 'associations')
+
+    def __init__(self, class_):
+        all, persistent, derived_, associations = [], [], [], []
+        for propname in dir(class_):
+            if not propname.startswith('_'):
+                prop = getattr(class_, propname)
+                if not isinstance(prop, umlproperty):
+                    continue
+                all.append(prop)
+
+                # A redefine that eclipses its original is saved as the original
+                orig = prop
+                while isinstance(orig, redefine) and orig.original.name == orig.name:
+                    orig = orig.original
+
+                if isinstance(orig, derived):
+                    derived_.append(prop)
+                elif isinstance(orig, association):
+                    persistent.append(prop)
+                    associations.append(prop)
+                elif isinstance(orig, (attribute, enumeration)):
+                    persistent.append(prop)
+        self.all = tuple(all)
+        self.persistent = tuple(persistent)
+        self.derived = tuple(derived_)
+        self.associations = tuple(associations)
+
+
+# class -> PropertyTable
+_property_tables = {}
+
+
+def property_table(class_):
+    """
+    Return the PropertyTable for an Element class.
+    """
+    try:
+        return _property_tables[class_]
+    except KeyError:
+        table = _property_tables[class_] = PropertyTable(class_)
+        return table
+
+
+class ElementMeta(type):
+    """
+    Metaclass for Element.
+
+    UML properties are assigned to classes after the classes have been
+    created (see the generated gaphor.UML.uml2 module and associationstub).
+    Any such change invalidates the cached property tables.
+    """
+
+    def __setattr__(self, key, value):
+        if isinstance(value, umlproperty) or isinstance(self.__dict__.get(key), umlproperty):
+            _property_tables.clear()
+        type.__setattr__(self, key, value)
+
+    def __delattr__(self, key):
+        if isinstance(self.__dict__.get(key), umlproperty):
+            _property_tables.clear()
+        type.__delattr__(self, key)
+
+
+@six.add_metaclass(ElementMeta)
 class Element(object):
     """
     Base class for UML data classes.
+
+    The id, factory and unlink state are stored in slots. The values of the
+    UML properties are stored in the instance dictionary, which is only
+    created once a value is set.
     """
 
+    __slots__ = ('_id', '_factory', '_unlinking', '__dict__', '__weakref__')
+
     def __init__(self, id=None, factory=None):
         """
         Create an element. As optional parameters an id and factory can be
@@ -54,7 +141,7 @@ class Element(object):
         self._id = id or (id is not False and str(uuid.uuid1()) or False)
         # The factory this element belongs to.
         self._factory = factory
-        self._unlink_lock = threading.Lock()
+        self._unlinking = False
 
     id = property(lambda self: self._id, doc='Id')
 
@@ -65,19 +152,13 @@ class Element(object):
         """
         Iterate over all UML properties 
         """
-        umlprop = umlproperty
-        class_ = type(self)
-        for propname in dir(class_):
-            if not propname.startswith('_'):
-                prop = getattr(class_, propname)
-                if isinstance(prop, umlprop):
-                    yield prop
+        return iter(property_table(type(self)).all)
 
     def save(self, save_func):
         """
         Save the state by calling save_func(name, value).
         """
-        for prop in self.umlproperties():
+        for prop in property_table(type(self)).persistent:
             prop.save(self, save_func)
 
     def load(self, name, value):
@@ -96,26 +177,29 @@ class Element(object):
         """
         Fix up the odds and ends.
         """
-        for prop in self.umlproperties():
+        for prop in property_table(type(self)).all:
             prop.postload(self)
 
     def unlink(self):
 
         """Unlink the element. All the elements references are destroyed.
         
-        The unlink lock is acquired while unlinking this elements properties
-        to avoid recursion problems."""
+        The element is marked as unlinking while its properties are
+        unlinked to avoid recursion problems."""
 
-        if self._unlink_lock.locked():
+        if self._unlinking:
             return
 
-        with self._unlink_lock:
+        self._unlinking = True
+        try:
 
-            for prop in self.umlproperties():
+            for prop in property_table(type(self)).all:
                 prop.unlink(self)
 
             if self._factory:
                 self._factory._unlink_element(self)
+        finally:
+            self._unlinking = False
 
     # OCL methods: (from SMW by Ivan Porres (http://www.abo.fi/~iporres/smw))
 
@@ -133,14 +217,16 @@ class Element(object):
 
     def __getstate__(self):
         d = dict(self.__dict__)
-        try:
-            del d['_factory']
-        except KeyError:
-            pass
+        d['_id'] = self._id
         return d
 
     def __setstate__(self, state):
+        state = dict(state)
+        self._id = state.pop('_id', None)
         self._factory = None
+        self._unlinking = False
+        state.pop('_factory', None)
+        state.pop('_unlink_lock', None)
         self.__dict__.update(state)
 
 
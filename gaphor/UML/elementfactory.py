@@ -26,21 +26,68 @@ Factory for and registration of model elements.
 
 from __future__ import absolute_import
 
+import heapq
+import itertools
 import uuid
 from zope import component
 from zope import interface
 
 import six
 
-from gaphor.UML.element import Element
+from gaphor.UML.collection import lazycollection
+from gaphor.UML.element import Element, property_table
 from gaphor.UML.event import ElementCreateEvent, ElementDeleteEvent, FlushFactoryEvent, ModelFactoryEvent
 from gaphor.UML.interfaces import IElementChangeEvent
-from gaphor.UML.uml2 import Diagram
+from gaphor.UML.properties import association, redefine
+from gaphor.UML.uml2 import Diagram, NamedElement, InstanceSpecification
 from gaphor.core import inject
 from gaphor.interfaces import IService, IEventFilter
 from gaphor.misc import odict
 
 
+def _original(prop):
+    """
+    Redefined properties store their values in the original property.
+    """
+    while isinstance(prop, redefine):
+        prop = prop.original
+    return prop
+
+
+def _property_values(element, prop):
+    """
+    Return the values of property ``prop`` of element as a sequence. If
+    the element does not have the property an empty sequence is returned.
+    """
+    if _original(getattr(type(element), prop.name, None)) is not prop:
+        return ()
+    if isinstance(prop, association):
+        # Do not use _get(), it creates empty collections
+        value = getattr(element, prop._name, None)
+        if value is None:
+            return ()
+        if prop.upper == 1:
+            return (value,)
+        if isinstance(value, lazycollection):
+            # Do not create the items that are not loaded yet
+            return value.loaded()
+        return value.items
+    value = prop._get(element)
+    if value is None:
+        return ()
+    return (value,)
+
+
+def _references(element):
+    """
+    Iterate (property, value) pairs for the elements referred to by element.
+    """
+    for prop in property_table(type(element)).associations:
+        prop = _original(prop)
+        for value in _property_values(element, prop):
+            yield prop, value
+
+
 class ElementFactory(object):
     """
     The ElementFactory is used to create elements and do lookups to
@@ -57,8 +104,164 @@ class ElementFactory(object):
 
     def __init__(self):
         self._elements = odict.odict()
+        # id -> position of the element in self._elements
+        self._sequence = {}
+        self._counter = itertools.count()
+        # concrete class -> odict(id -> (position, element)), by position
+        self._types = {}
+        # class -> concrete classes in self._types that are a kind of class
+        self._kinds = {}
+        # property -> {value: odict(id -> element)}, see create_index()
+        self._indexes = {}
+        # referred element -> set((referrer, property), ...)
+        self._referrers = {}
         self._observers = list()
 
+    def _add_element(self, element):
+        """
+        Add element to the factory.
+        """
+        old = self._elements.get(element.id)
+        if old is not None:
+            self._unindex(old)
+        self._elements[element.id] = element
+        self._index(element)
+        self._index_values(element)
+        self._index_references(element)
+
+    def _remove_element(self, element):
+        """
+        Remove element from the factory.
+        Raises KeyError if the element is not in the factory.
+        """
+        del self._elements[element.id]
+        del self._sequence[element.id]
+        self._unindex(element)
+        self._unindex_values(element)
+        self._unindex_references(element)
+
+    def _index(self, element):
+        cls = type(element)
+        try:
+            seq = self._sequence[element.id]
+        except KeyError:
+            seq = self._sequence[element.id] = next(self._counter)
+        try:
+            elements = self._types[cls]
+        except KeyError:
+            elements = self._types[cls] = odict.odict()
+            for c in cls.__mro__:
+                self._kinds.setdefault(c, []).append(cls)
+        if elements and seq < elements[next(reversed(elements))][0]:
+            # An element changed class (swap_element()), keep the order
+            entries = sorted(elements.values() + [(seq, element)])
+            elements.clear()
+            for entry in entries:
+                elements[entry[1].id] = entry
+        else:
+            elements[element.id] = (seq, element)
+
+    def _unindex(self, element):
+        try:
+            del self._types[type(element)][element.id]
+        except KeyError:
+            pass
+
+    def _index_values(self, element):
+        for prop, index in six.iteritems(self._indexes):
+            for value in _property_values(element, prop):
+                self._index_value(index, value, element)
+
+    def _unindex_values(self, element):
+        for prop, index in six.iteritems(self._indexes):
+            for value in _property_values(element, prop):
+                self._unindex_value(index, value, element)
+
+    def _index_value(self, index, value, element):
+        if value is not None:
+            try:
+                elements = index[value]
+            except KeyError:
+                elements = index[value] = odict.odict()
+            elements[element.id] = element
+
+    def _unindex_value(self, index, value, element):
+        try:
+            elements = index[value]
+            del elements[element.id]
+        except KeyError:
+            pass
+        else:
+            if not elements:
+                del index[value]
+
+    def _index_references(self, element):
+        for prop, value in _references(element):
+            self._index_reference(element, prop, value)
+
+    def _unindex_references(self, element):
+        for prop, value in _references(element):
+            self._unindex_reference(element, prop, value)
+
+    def _index_reference(self, element, prop, value):
+        try:
+            self._referrers[value].add((element, prop))
+        except KeyError:
+            self._referrers[value] = set(((element, prop),))
+
+    def _unindex_reference(self, element, prop, value):
+        try:
+            refs = self._referrers[value]
+            refs.remove((element, prop))
+        except KeyError:
+            pass
+        else:
+            if not refs:
+                del self._referrers[value]
+
+    def _update_indexes(self, event):
+        """
+        Keep the indexes up to date with the changes of attribute and
+        association values.
+        """
+        prop = event.property
+        index = self._indexes.get(prop)
+        is_association = isinstance(prop, association)
+        if index is None and not is_association:
+            return
+        element = event.element
+        if self._elements.get(element.id) is not element:
+            return
+        old_value = getattr(event, 'old_value', None)
+        new_value = getattr(event, 'new_value', None)
+        if index is not None:
+            if old_value is not None:
+                self._unindex_value(index, old_value, element)
+            if new_value is not None:
+                self._index_value(index, new_value, element)
+        if is_association:
+            if old_value is not None:
+                self._unindex_reference(element, prop, old_value)
+            if new_value is not None:
+                self._index_reference(element, prop, new_value)
+
+    def create_index(self, prop):
+        """
+        Maintain an index on the values of property ``prop`` (an attribute
+        or association, e.g. NamedElement.name), so lookup_by() does not
+        have to check all elements.
+        """
+        prop = _original(prop)
+        if prop not in self._indexes:
+            self._indexes[prop] = {}
+            self._rebuild_index(prop)
+
+    def _rebuild_index(self, prop):
+        index = self._indexes[prop] = {}
+        for element in six.itervalues(self._elements):
+            for value in _property_values(element, prop):
+                self._index_value(index, value, element)
+
     def create(self, type):
         """
         Create a new model element of type ``type``.
@@ -74,7 +277,13 @@ class ElementFactory(object):
         """
         assert issubclass(type, Element)
         obj = type(id, self)
+        old = self._elements.get(id)
+        if old is not None:
+            self._remove_element(old)
+        # A new element does not refer to other elements
         self._elements[id] = obj
+        self._index(obj)
+        self._index_values(obj)
         return obj
 
     def bind(self, element):
@@ -88,7 +297,7 @@ class ElementFactory(object):
             raise AttributeError("an element already exists with the same id")
 
         element._factory = self
-        self._elements[element.id] = element
+        self._add_element(element)
 
     def size(self):
         """
@@ -125,6 +334,59 @@ class ElementFactory(object):
         """
         return list(self.select(expression))
 
+    def lookup_by(self, prop, value):
+        """
+        Return a list of elements that have ``value`` as value of property
+        ``prop``. For properties with multiplicity [0..*] the elements that
+        contain value are returned.
+
+        This is fast for properties for which an index has been created
+        with create_index(). Otherwise all elements are checked.
+        """
+        prop = _original(prop)
+        try:
+            index = self._indexes[prop]
+        except KeyError:
+            return [e for e in six.itervalues(self._elements)
+                    if value in _property_values(e, prop)]
+        else:
+            try:
+                return index[value].values()
+            except KeyError:
+                return []
+
+    def referrers(self, element):
+        """
+        Return a set of (referrer, property) tuples for the elements in the
+        factory that refer to ``element`` through an association.
+        """
+        return set(self._referrers.get(element, ()))
+
+    def referenced(self):
+        """
+        Iterate the elements that are referred to by elements in the
+        factory. This may include elements that are not in the factory
+        (anymore).
+        """
+        return six.iterkeys(self._referrers)
+
+    def select_type(self, type, expression=None):
+        """
+        Iterate elements that are an instance of ``type`` (or a subclass)
+        and comply with expression. Only the elements of the requested
+        types are visited. Elements are returned in the same order as
+        select() does.
+        """
+        types = self._types
+        kinds = self._kinds.get(type, ())
+        if len(kinds) == 1:
+            entries = types[kinds[0]].values()
+        else:
+            entries = heapq.merge(*[types[cls].values() for cls in kinds])
+        for seq, e in entries:
+            if expression is None or expression(e):
+                yield e
+
     def keys(self):
         """
         Return a list with all id's in the factory.
@@ -163,7 +425,9 @@ class ElementFactory(object):
         """
 
         flush_element = self._flush_element
-        for element in self.lselect(lambda e: isinstance(e, Diagram)):
+        for element in list(self.select_type(Diagram)):
+            # No need to create canvas items to flush them
+            element.defer_canvas(None)
             element.canvas.block_updates = True
             flush_element(element)
 
@@ -178,19 +442,37 @@ class ElementFactory(object):
         NOTE: Invoked from Element.unlink() to perform an element unlink.
         """
         try:
-            del self._elements[element.id]
+            self._remove_element(element)
         except KeyError:
             pass
 
     def swap_element(self, element, new_class):
-        assert element in list(self._elements.values())
+        assert self._elements.get(element.id) is element
         if element.__class__ is not new_class:
+            self._unindex(element)
+            self._unindex_values(element)
+            self._unindex_references(element)
             element.__class__ = new_class
+            self._index(element)
+            self._index_values(element)
+            self._index_references(element)
+
+    def notify_model(self):
+        """
+        A new model has been loaded. Since values are loaded without
+        sending change events, the indexes are rebuilt.
+        """
+        for prop in self._indexes:
+            self._rebuild_index(prop)
+        self._referrers = {}
+        for element in six.itervalues(self._elements):
+            self._index_references(element)
 
     def _handle(self, event):
         """
         Handle events coming from elements.
         """
+        self._update_indexes(event)
         # Invoke default handler, so properties get updated.
         component.handle(event)
 
@@ -204,7 +486,8 @@ class ElementFactoryService(ElementFactory):
     component_registry = inject('component_registry')
 
     def init(self, app):
-        pass
+        self.create_index(NamedElement.name)
+        self.create_index(InstanceSpecification.classifier)
 
     def shutdown(self):
         self.flush()
@@ -229,18 +512,19 @@ class ElementFactoryService(ElementFactory):
         has an application instance."""
 
         self.component_registry.handle(FlushFactoryEvent(self))
-        self.component_registry.register_subscription_adapter(ElementChangedEventBlocker)
+        ElementChangedEventBlocker.block(self.component_registry)
 
         try:
             super(ElementFactoryService, self).flush()
         finally:
-            self.component_registry.unregister_subscription_adapter(ElementChangedEventBlocker)
+            ElementChangedEventBlocker.unblock(self.component_registry)
 
     def notify_model(self):
         """
         Send notification that a new model has been loaded by means of the
         ModelFactoryEvent event from gaphor.UML.event.
         """
+        super(ElementFactoryService, self).notify_model()
         self.component_registry.handle(ModelFactoryEvent(self))
 
     def _unlink_element(self, element):
@@ -254,6 +538,7 @@ class ElementFactoryService(ElementFactory):
         """
         Handle events coming from elements (used internally).
         """
+        self._update_indexes(event)
         self.component_registry.handle(event)
 
 
@@ -269,10 +554,36 @@ class ElementChangedEventBlocker(object):
     def __init__(self, event):
         self._event = event
 
+    # component registry -> number of block() calls not undone yet
+    _blocked = {}
+
     def filter(self):
         """
         Returns something that evaluates to `True` so events are blocked.
         """
         return 'Blocked by ElementFactory.flush()'
 
+    @classmethod
+    def block(cls, component_registry):
+        """
+        Register the blocker with ``component_registry``, unless it has
+        been registered already. Calls can be nested: the blocker is
+        unregistered by the unblock() call that matches the first block().
+        """
+        count = cls._blocked.get(component_registry, 0)
+        if not count:
+            component_registry.register_subscription_adapter(cls)
+        cls._blocked[component_registry] = count + 1
+
+    @classmethod
+    def unblock(cls, component_registry):
+        """
+        Undo a block() call.
+        """
+        count = cls._blocked.pop(component_registry) - 1
+        if count:
+            cls._blocked[component_registry] = count
+        else:
+            component_registry.unregister_subscription_adapter(cls)
+
 # vim:sw=4:et
@@ -97,8 +97,8 @@ def find_instances(factory, element):
     """
     Find instance specification which extend classifier `element`.
     """
-    return factory.select(lambda e: e.isKindOf(InstanceSpecification) \
-            and e.classifier and e.classifier[0] == element)
+    return (e for e in factory.lookup_by(InstanceSpecification.classifier, element)
+            if e.classifier[0] == element)
 
 
 def remove_stereotype(element, stereotype):
@@ -132,7 +132,9 @@ def get_stereotypes(factory, element):
     names = set(c.__name__ for c in cls.__mro__ if issubclass(c, Element))
 
     # find stereotypes that extend element class
-    classes = factory.select(lambda e: e.isKindOf(Class) and e.name in names)
+    classes = (e for name in names
+               for e in factory.lookup_by(NamedElement.name, name)
+               if isinstance(e, Class))
     
     stereotypes = set(ext.ownedEnd.type for cls in classes for ext in cls.extension)
     return sorted(stereotypes, key=lambda st: st.name)
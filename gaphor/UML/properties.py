@@ -50,7 +50,7 @@ from six.moves import map
 __all__ = [ 'attribute', 'enumeration', 'association', 'derivedunion', 'redefine' ]
 
 from zope import component
-from .collection import collection, collectionlist
+from .collection import collection, collectionlist, lazycollection
 from .event import AttributeChangeEvent, AssociationSetEvent, \
                   AssociationAddEvent, AssociationDeleteEvent
 from .event import DerivedChangeEvent, DerivedSetEvent, \
@@ -269,7 +269,10 @@ class association(umlproperty):
         In the postload step, ensure that bi-directional associations
         are bi-directional.
         """
-        values = self._get(obj)
+        values = getattr(obj, self._name, None)
+        if isinstance(values, lazycollection):
+            # Items that are not created yet are checked when they are loaded
+            values = values.loaded()
         if not values:
             return
         if self.upper == 1:
@@ -338,13 +341,10 @@ class association(umlproperty):
         else:
             # Set the actual value
             c = self._get(obj)
-            if not c:
-                c = collection(self, obj, self.type)
-                setattr(obj, self._name, c)
-            elif value in c:
+            if value in c:
                 return
 
-            c.items.append(value)
+            c._add(value)
             if do_notify:
                 event = AssociationAddEvent(obj, self, value)
 
@@ -393,25 +393,26 @@ class association(umlproperty):
                     event = AssociationSetEvent(obj, self, value, None)
         else:
             c = self._get(obj)
-            if c:
-                items = c.items
+            # Do not truth-test c: that creates the missing items of a
+            # lazy collection. Those never include value.
+            if c._positions:
                 try:
-                    items.remove(value)
-                except:
+                    c._remove(value)
+                except ValueError:
                     pass
                 else:
                     if do_notify:
                         event = AssociationDeleteEvent(obj, self, value)
 
                 # Remove items collection if empty
-                if not items:
+                if not c._positions and not isinstance(c, lazycollection):
                     delattr(obj, self._name)
 
         if do_notify and event:
             self.handle(event)
 
     def unlink(self, obj):
-        values = self._get(obj)
+        values = getattr(obj, self._name, None)
         composite = self.composite
         if values:
             if self.upper == 1:
@@ -481,6 +482,30 @@ class associationstub(umlproperty):
             c.discard(value)
 
 
+# Derived and redefined properties that should be notified when the value
+# of a property changes: property -> (derived|redefine, ...)
+_dependents = {}
+
+
+def _add_dependent(prop, dependent):
+    _dependents[prop] = _dependents.get(prop, ()) + (dependent,)
+
+
+@component.adapter(IElementChangeEvent)
+def _property_changed(event):
+    """
+    Dispatch change events to the derived and redefined properties that
+    depend on the changed property.
+
+    This is one handler for all properties, so the component registry does
+    not have to hand each event to every derived property in the model.
+    """
+    for dependent in _dependents.get(event.property, ()):
+        dependent._association_changed(event)
+
+component.provideHandler(_property_changed)
+
+
 class unioncache(object):
     """
     Small cache helper object for derivedunions.
@@ -512,7 +537,8 @@ class derived(umlproperty):
         self.subsets = set(subsets)
         self.single = len(subsets) == 1
 
-        component.provideHandler(self._association_changed)
+        for s in self.subsets:
+            _add_dependent(s, self)
 
 
     def load(self, obj, value):
@@ -520,7 +546,7 @@ class derived(umlproperty):
 
 
     def postload(self, obj):
-        self.version += 1
+        self._invalidate_element(obj)
 
     def save(self, obj, save_func):
         pass
@@ -573,7 +599,30 @@ class derived(umlproperty):
     def _del(self, obj, value=None):
         raise AttributeError('Can not delete values on a union')
 
-    @component.adapter(IElementChangeEvent)
+    def _invalidate_element(self, obj):
+        try:
+            delattr(obj, self._name)
+        except AttributeError:
+            pass
+
+    def _invalidate(self, element):
+        """
+        Make sure the union is created again for ``element``, the element
+        a subset changed on.
+
+        If ``element`` does not have this property, the change was made on
+        another element the values are derived from (e.g.
+        Association.endType is derived from Property.type). In that case
+        the cached unions of all elements are invalidated.
+        """
+        prop = getattr(type(element), self.name, None)
+        while isinstance(prop, redefine):
+            prop = prop.original
+        if prop is self:
+            self._invalidate_element(element)
+        else:
+            self.version += 1
+
     def _association_changed(self, event):
         """
         Re-emit state change for the derived properties as Derived*Event's.
@@ -589,7 +638,7 @@ class derived(umlproperty):
         """
         if event.property in self.subsets:
             # Make sure unions are created again
-            self.version += 1
+            self._invalidate(event.element)
             
             if not IAssociationChangeEvent.providedBy(event):
                 return
@@ -642,7 +691,11 @@ class derivedunion(derived):
             for s in self.subsets:
                 if s is exclude:
                     continue
-                tmp = s.__get__(obj)
+                if isinstance(s, association):
+                    # Do not create empty collections on obj
+                    tmp = getattr(obj, s._name, None)
+                else:
+                    tmp = s.__get__(obj)
                 if tmp:
                     try:
                         u.update(tmp)
@@ -653,8 +706,18 @@ class derivedunion(derived):
 
     # Filter is our default filter
     filter = _union
+
+    def _invalidate(self, element):
+        """
+        The default filter only looks at the subsets of the element itself,
+        so only the union of ``element`` has to be created again.
+        """
+        if 'filter' in self.__dict__:
+            # A custom filter may depend on other elements
+            super(derivedunion, self)._invalidate(element)
+        else:
+            self._invalidate_element(element)
     
-    @component.adapter(IElementChangeEvent)
     def _association_changed(self, event):
         """
         Re-emit state change for the derived union (as Derived*Event's).
@@ -670,7 +733,7 @@ class derivedunion(derived):
         """
         if event.property in self.subsets:
             # Make sure unions are created again
-            self.version += 1
+            self._invalidate(event.element)
             
             if not IAssociationChangeEvent.providedBy(event):
                 return
@@ -735,7 +798,7 @@ class redefine(umlproperty):
         self.type = type
         self.original = original
 
-        component.provideHandler(self._association_changed)
+        _add_dependent(original, self)
 
     upper = property(lambda s: s.original.upper)
     lower = property(lambda s: s.original.lower)
@@ -796,9 +859,9 @@ class redefine(umlproperty):
         return self.original._del(obj, value, from_opposite)
 
 
-    @component.adapter(IAssociationChangeEvent)
     def _association_changed(self, event):
-        if event.property is self.original and isinstance(event.element, self.decl_class):
+        if IAssociationChangeEvent.providedBy(event) and \
+                isinstance(event.element, self.decl_class):
             # mimic the events for Set/Add/Delete
             if IAssociationSetEvent.providedBy(event):
                 self.handle(RedefineSetEvent(event.element, self, event.old_value, event.new_value))
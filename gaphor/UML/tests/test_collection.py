@@ -23,7 +23,9 @@ Test if the collection's list supports all trickery.
 
 from __future__ import absolute_import
 import unittest
-from gaphor.UML.collection import collectionlist
+from gaphor.UML.collection import collection, collectionlist, lazycollection
+from gaphor.UML.element import Element
+from gaphor.UML.properties import association
 
 class CollectionlistTestCase(unittest.TestCase):
 
@@ -34,4 +36,100 @@ class CollectionlistTestCase(unittest.TestCase):
         c.append('c')
         assert str(c) == "['a', 'b', 'c']"
 
+
+class CollectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        class A(Element): pass
+        A.a = association('a', A)
+        self.a = A()
+        self.items = [A() for i in range(5)]
+        for i in self.items:
+            self.a.a = i
+
+    def test_order(self):
+        a, items = self.a, self.items
+        assert list(a.a) == items
+        assert len(a.a) == 5
+
+    def test_remove(self):
+        a, items = self.a, self.items
+        del a.a[items[1]]
+        del a.a[items[3]]
+        assert items[1] not in a.a
+        assert items[2] in a.a
+        assert len(a.a) == 3
+        assert a.a.index(items[2]) == 1
+        assert list(a.a) == [items[0], items[2], items[4]]
+        assert a.a[-1] is items[4]
+
+        # Holes at the end are removed right away
+        del a.a[items[2]]
+        del a.a[items[4]]
+        assert list(a.a) == [items[0]]
+
+        a.a = items[1]
+        assert list(a.a) == [items[0], items[1]]
+        assert a.a.index(items[1]) == 1
+        self.assertRaises(ValueError, a.a.index, items[2])
+
+    def test_swap(self):
+        a, items = self.a, self.items
+        del a.a[items[2]]
+        assert a.a.swap(items[0], items[4])
+        assert list(a.a) == [items[4], items[1], items[3], items[0]]
+        assert a.a.index(items[0]) == 3
+        assert not a.a.swap(items[0], items[2])
+
+    def test_unlink(self):
+        a, items = self.a, self.items
+        a.unlink()
+        assert not hasattr(a, '_a')
+
+
+class LazyCollectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        class A(Element): pass
+        A.a = association('a', A, opposite='b')
+        A.b = association('b', A, upper=1, opposite='a')
+        self.a = A()
+        self.items = [A() for i in range(3)]
+        self.loads = []
+
+        def load():
+            self.loads.append(True)
+            for i in self.items[1:]:
+                i.b = self.a
+
+        self.a._a = lazycollection(A.a, self.a, A, load)
+        self.a.a = self.items[0]
+
+    def test_no_load(self):
+        a, items = self.a, self.items
+        assert items[0] in a.a
+        assert a.a
+        extra = type(a)()
+        extra.b = a
+        assert extra in a.a
+        del a.a[items[0]]
+        assert items[0] not in a.a
+        assert not self.loads
+        assert type(a.a) is lazycollection
+
+    def test_load(self):
+        a, items = self.a, self.items
+        assert len(a.a) == 3
+        assert list(a.a) == items
+        assert type(a.a) is collection
+        assert len(self.loads) == 1
+        assert items[2].b is a
+
+    def test_load_on_empty(self):
+        a, items = self.a, self.items
+        del a.a[items[0]]
+        assert a.a
+        assert list(a.a) == items[1:]
+        assert len(self.loads) == 1
+
 # vim:sw=4:et:ai
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+from __future__ import absolute_import
+import pickle
+import unittest
+from gaphor.UML.element import Element, property_table
+from gaphor.UML.properties import association, attribute, derivedunion, redefine
+
+
+def own(props):
+    """
+    Filter out the properties Element itself already has.
+    """
+    base = property_table(Element).all
+    return set(p for p in props if p not in base)
+
+
+class PropertyTableTestCase(unittest.TestCase):
+
+    def test_table(self):
+        class A(Element): pass
+
+        A.name = attribute('name', str)
+        A.a = association('a', A)
+        A.u = derivedunion('u', A, 0, '*', A.a)
+
+        table = property_table(A)
+        assert own(table.all) == set([A.name, A.a, A.u])
+        assert own(table.persistent) == set([A.name, A.a])
+        assert own(table.derived) == set([A.u])
+        assert own(table.associations) == set([A.a])
+        assert property_table(A) is table
+
+    def test_redefine(self):
+        class A(Element): pass
+        class B(A): pass
+
+        A.a = association('a', A, upper=1)
+        B.a = redefine(B, 'a', B, A.a)
+        B.b = redefine(B, 'b', B, A.a)
+
+        table = property_table(B)
+        assert B.a in table.persistent
+        assert B.a in table.associations
+        assert B.b in table.all
+        assert B.b not in table.persistent
+
+    def test_invalidate(self):
+        class A(Element): pass
+        class B(A): pass
+
+        A.a = association('a', A)
+        table = property_table(B)
+        assert own(table.all) == set([A.a])
+
+        A.b = association('b', A)
+        assert own(property_table(B).all) == set([A.a, A.b])
+
+        del A.a
+        assert own(property_table(B).all) == set([A.b])
+
+    def test_invalidate_on_stub(self):
+        class A(Element): pass
+        class B(Element): pass
+
+        A.b = association('b', B)
+        assert own(property_table(B).all) == set()
+
+        a = A()
+        a.b = B()
+        stubs = list(own(property_table(B).all))
+        assert len(stubs) == 1
+        assert stubs[0].association is A.b
+        assert own(property_table(B).persistent) == set()
+
+
+class ElementStorageTestCase(unittest.TestCase):
+
+    def test_pickle(self):
+        from gaphor.UML import uml2
+
+        c = uml2.Class()
+        c.name = 'c'
+        c.ownedAttribute = uml2.Property()
+        p = pickle.loads(pickle.dumps(c))
+        assert p.id == c.id
+        assert p.name == 'c'
+        assert len(p.ownedAttribute) == 1
+        assert p.ownedAttribute[0].id == c.ownedAttribute[0].id
+        assert p._factory is None
+        assert not p._unlinking
+
+    def test_unlink_recursion(self):
+        class A(Element): pass
+
+        A.a = association('a', A, opposite='b')
+        A.b = association('b', A, opposite='a')
+
+        a = A()
+        b = A()
+        a.a = b
+        a.unlink()
+        assert not a._unlinking
+        assert len(b.b) == 0
+
+    def test_union_read_keeps_dict_small(self):
+        class A(Element): pass
+
+        A.a = association('a', A)
+        A.b = association('b', A)
+        A.u = derivedunion('u', A, 0, '*', A.a, A.b)
+
+        a = A()
+        a.a = A()
+        assert len(a.u) == 1
+        assert '_b' not in a.__dict__
+
+
+# vim:sw=4:et:ai
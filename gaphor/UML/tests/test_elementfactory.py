@@ -91,6 +91,134 @@ class ElementFactoryTestCase(unittest.TestCase):
         assert len(list(ef.values())) == 0, list(ef.values())
 
 
+    def testSelectType(self):
+        ef = self.factory
+        c = ef.create(uml2.Class)
+        s = ef.create(uml2.Stereotype)
+        p = ef.create(uml2.Package)
+        c.name = 'c'
+
+        assert list(ef.select_type(uml2.Class)) == [c, s]
+        assert list(ef.select_type(uml2.Stereotype)) == [s]
+        assert list(ef.select_type(uml2.Namespace)) == [c, s, p]
+        assert list(ef.select_type(uml2.Class, lambda e: e.name == 'c')) == [c]
+        assert list(ef.select_type(uml2.Diagram)) == []
+
+        s.unlink()
+        assert list(ef.select_type(uml2.Class)) == [c]
+
+        ef.swap_element(c, uml2.Stereotype)
+        assert list(ef.select_type(uml2.Stereotype)) == [c]
+        assert list(ef.select_type(uml2.Class)) == [c]
+
+        ef.flush()
+        assert list(ef.select_type(uml2.Element)) == []
+
+    def testSelectTypeOrder(self):
+        """
+        Elements of different classes are returned in the order of select().
+        """
+        ef = self.factory
+        p1 = ef.create(uml2.Package)
+        c1 = ef.create(uml2.Class)
+        p2 = ef.create(uml2.Package)
+        c2 = ef.create(uml2.Class)
+        c3 = ef.create(uml2.Class)
+        assert list(ef.select_type(uml2.Namespace)) == [p1, c1, p2, c2, c3]
+
+        ef.swap_element(c1, uml2.Package)
+        assert list(ef.select_type(uml2.Package)) == [p1, c1, p2]
+        assert list(ef.select_type(uml2.Namespace)) == list(ef.select()) == [p1, c1, p2, c2, c3]
+
+    def testLookupBy(self):
+        ef = self.factory
+        c = ef.create(uml2.Class)
+        c.name = 'a'
+        i = ef.create(uml2.InstanceSpecification)
+        i.classifier = c
+
+        # Without index
+        assert ef.lookup_by(uml2.NamedElement.name, 'a') == [c]
+        assert ef.lookup_by(uml2.InstanceSpecification.classifier, c) == [i]
+
+        ef.create_index(uml2.NamedElement.name)
+        ef.create_index(uml2.InstanceSpecification.classifier)
+        assert ef.lookup_by(uml2.NamedElement.name, 'a') == [c]
+        assert ef.lookup_by(uml2.InstanceSpecification.classifier, c) == [i]
+
+        c.name = 'b'
+        assert ef.lookup_by(uml2.NamedElement.name, 'a') == []
+        assert ef.lookup_by(uml2.NamedElement.name, 'b') == [c]
+
+        del i.classifier[c]
+        assert ef.lookup_by(uml2.InstanceSpecification.classifier, c) == []
+        i.classifier = c
+        assert ef.lookup_by(uml2.InstanceSpecification.classifier, c) == [i]
+
+        p = ef.create(uml2.Package)
+        p.name = 'b'
+        assert ef.lookup_by(uml2.NamedElement.name, 'b') == [c, p]
+
+        c.unlink()
+        assert ef.lookup_by(uml2.NamedElement.name, 'b') == [p]
+        assert ef.lookup_by(uml2.InstanceSpecification.classifier, c) == []
+
+        # Elements stay in creation order when others are removed
+        q = ef.create(uml2.Package)
+        q.name = 'b'
+        r = ef.create(uml2.Package)
+        r.name = 'b'
+        q.name = 'c'
+        assert ef.lookup_by(uml2.NamedElement.name, 'b') == [p, r]
+        q.name = 'b'
+        assert ef.lookup_by(uml2.NamedElement.name, 'b') == [p, r, q]
+
+    def testReferrers(self):
+        ef = self.factory
+        c = ef.create(uml2.Class)
+        p = ef.create(uml2.Property)
+        c.ownedAttribute = p
+
+        assert ef.referrers(p) == set([(c, uml2.Class.ownedAttribute)])
+        assert ef.referrers(c) == set([(p, uml2.Property.class_)])
+
+        # Elements that are not part of the factory are not registered
+        m = uml2.Comment(id='acd123')
+        m.annotatedElement = c
+        assert ef.referrers(c) == set([(p, uml2.Property.class_)])
+        assert ef.referrers(m) == set([(c, uml2.Element.ownedComment)])
+        assert m in ef.referenced()
+
+        del c.ownedAttribute[p]
+        assert ef.referrers(p) == set()
+        assert ef.referrers(c) == set()
+
+        m.unlink()
+        c.unlink()
+        assert list(ef.referenced()) == []
+
+    def testReferrersAfterLoad(self):
+        ef = self.factory
+        c = ef.create(uml2.Class)
+        p = ef.create(uml2.Property)
+        c.load('ownedAttribute', p)
+        assert ef.referrers(p) == set()
+
+        ef.notify_model()
+        assert ef.referrers(p) == set([(c, uml2.Class.ownedAttribute)])
+        assert ef.referrers(c) == set([(p, uml2.Property.class_)])
+
+    def testLookupByAfterLoad(self):
+        ef = self.factory
+        ef.create_index(uml2.NamedElement.name)
+        c = ef.create(uml2.Class)
+        c.load('name', 'a')
+        assert ef.lookup_by(uml2.NamedElement.name, 'a') == []
+
+        ef.notify_model()
+        assert ef.lookup_by(uml2.NamedElement.name, 'a') == [c]
+
+
 
 
 from zope import component
@@ -22,6 +22,8 @@ import unittest
 from zope import component
 from gaphor.application import Application
 from gaphor.UML.properties import *
+from gaphor.UML.properties import derived
+from gaphor.UML.event import AssociationAddEvent
 from gaphor.UML.element import Element
 from gaphor.UML.interfaces import IAssociationChangeEvent
 
@@ -444,6 +446,66 @@ class PropertiesTestCase(unittest.TestCase):
         assert c in a.u
         assert d in a.u
 
+    def test_derivedunion_invalidation(self):
+        class A(Element): pass
+        class B(Element): pass
+
+        A.a = association('a', A)
+        A.u = derivedunion('u', A, 0, '*', A.a)
+        B.a = association('a', A, upper=1)
+        A.d = derived('d', A, 0, '*', A.a, B.a)
+        A.d.filter = lambda obj: [b.a for b in bs if b.a in obj.a]
+
+        a1, a2 = A(), A()
+        a1.a = A()
+        assert len(a1.u) == 1
+        assert len(a2.u) == 0
+        cache = a1._u
+
+        # Only the cache of the element that changed is dropped
+        a2.a = A()
+        assert a1._u is cache
+        assert len(a1.u) == 1
+        assert len(a2.u) == 1
+
+        # Changes to other elements invalidate all derived values
+        bs = [B()]
+        assert a1.d == []
+        bs[0].a = a1.a[0]
+        assert a1.d == [a1.a[0]]
+
+    def test_derived_and_redefine_events(self):
+        from gaphor.UML.event import DerivedAddEvent, RedefineAddEvent
+
+        class A(Element): pass
+        class B(A): pass
+
+        A.a = association('a', A)
+        A.b = association('b', A)
+        A.u = derivedunion('u', A, 0, '*', A.a, A.b)
+        B.c = redefine(B, 'c', A, A.a)
+
+        events = []
+        @component.adapter(IAssociationChangeEvent)
+        def handler(event, events=events):
+            events.append(event)
+
+        component.provideHandler(handler)
+        try:
+            a = A()
+            a.a = A()
+            assert [(type(e), e.property) for e in events] == \
+                    [(DerivedAddEvent, A.u), (AssociationAddEvent, A.a)], events
+
+            del events[:]
+            b = B()
+            b.a = A()
+            assert [(type(e), e.property) for e in events] == \
+                    [(DerivedAddEvent, A.u), (RedefineAddEvent, B.c),
+                     (AssociationAddEvent, A.a)], events
+        finally:
+            component.getGlobalSiteManager().unregisterHandler(handler)
+
     def skiptest_deriveduntion_notify(self):
         class A(Element): pass
         class E(Element):
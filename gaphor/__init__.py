@@ -47,6 +47,11 @@ def launch(model=None):
     specified on the command line.  Otherwise, a new model is created and
     the Gaphor GUI is started."""
 
+    # Let other threads (see gaphor.misc.gidlethread.WorkerThread) run
+    # while the main loop waits for events.
+    import gobject
+    gobject.threads_init()
+
     # Make sure gui is loaded ASAP.
     # This prevents menu items from appearing at unwanted places.
     Application.essential_services.append('main_window')
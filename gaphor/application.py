@@ -170,6 +170,8 @@ class inject(object):
     """
     Simple descriptor for dependency injection.
     This is technically a wrapper around Application.get_service().
+    Services are not cached by the descriptor: the component registry
+    caches them, and knows when a service is replaced.
 
     Usage::
 
@@ -179,17 +181,13 @@ class inject(object):
 
     def __init__(self, name):
         self._name = name
-        # self._s = None
 
     def __get__(self, obj, class_=None):
         """
         Resolve a dependency, but only if we're called from an object instance.
         """
-        if not obj:
+        if obj is None:
             return self
         return Application.get_service(self._name)
-        # if self._s is None:
-        #    self._s = _Application.get_service(self._name)
-        # return self._s
 
 # vim:sw=4:et:ai
@@ -30,6 +30,7 @@ import inspect
 import gobject
 import uuid
 
+from gaphor.UML.element import ElementMeta
 from gaphor.diagram.style import Style
 import six
 
@@ -72,13 +73,16 @@ def uml(uml_class, stereotype=None):
 
 
 
-class DiagramItemMeta(type):
+class DiagramItemMeta(ElementMeta):
     """
     Initialize a new diagram item.
     1. Register UML.Elements by means of the __uml__ attribute (see
        map_uml_class method).
     2. Set items style information.
 
+    Diagram items are UML Presentation elements, hence the metaclass
+    derives from the Element metaclass.
+
     @ivar style: style information
     """
 
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Event handler profiling.
+
+The component registry and the element dispatcher can record how often
+each event handler is called and how long it takes. Profiling is off by
+default; it is started with start_profiling() on the services, or from
+the Python console:
+
+    >>> profile = start_profiling()                   # doctest: +SKIP
+    >>> # ... edit the model ...
+    >>> print(profile.report())                       # doctest: +SKIP
+    >>> profile.dump('handlers.json')                 # doctest: +SKIP
+    >>> stop_profiling()                              # doctest: +SKIP
+
+Handlers are identified by their qualified name, so the handlers of all
+instances of a class (e.g. all diagram items) are counted together. The
+time of a handler includes the time of the handlers it triggers, such as
+the element dispatcher handlers called from the component registry.
+"""
+
+from __future__ import absolute_import
+
+import json
+from timeit import default_timer
+
+__all__ = ['HandlerProfile', 'handler_name', 'start', 'stop']
+
+
+def handler_name(handler):
+    """
+    Return a name for ``handler``: module, class and function name.
+    """
+    func = getattr(handler, 'im_func', handler)
+    owner = getattr(handler, 'im_class', None)
+    name = getattr(func, '__name__', None)
+    if name is None:
+        # Some callable object
+        owner, name = type(handler), '__call__'
+    if owner is not None:
+        return '%s.%s.%s' % (owner.__module__, owner.__name__, name)
+    return '%s.%s' % (getattr(func, '__module__', None), name)
+
+
+class HandlerProfile(object):
+    """
+    Statistics of event handler calls: per handler the number of calls
+    and the total and maximum time (in seconds), and per source (the
+    service that dispatches the events) and event type the number of
+    events and the number of handlers they were dispatched to.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # handler name: [calls, total time, max time]
+        self.handlers = {}
+        # (source, event type): [events, handlers, max handlers]
+        self.events = {}
+        self._names = {}
+
+    def call(self, handler, event):
+        """
+        Call ``handler(event)`` and record the time it takes.
+        """
+        start = default_timer()
+        try:
+            handler(event)
+        finally:
+            elapsed = default_timer() - start
+            # Bound methods are keyed by function and class, so no
+            # instances are kept alive
+            key = getattr(handler, 'im_func', handler), getattr(handler, 'im_class', None)
+            try:
+                name = self._names[key]
+            except (KeyError, TypeError):
+                name = handler_name(handler)
+                try:
+                    self._names[key] = name
+                except TypeError:
+                    pass
+            try:
+                stat = self.handlers[name]
+            except KeyError:
+                stat = self.handlers[name] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += elapsed
+            if elapsed > stat[2]:
+                stat[2] = elapsed
+
+    def dispatched(self, source, event, fanout):
+        """
+        Record that ``source`` dispatches ``event`` to ``fanout`` handlers.
+        """
+        key = source, type(event).__name__
+        try:
+            stat = self.events[key]
+        except KeyError:
+            stat = self.events[key] = [0, 0, 0]
+        stat[0] += 1
+        stat[1] += fanout
+        if fanout > stat[2]:
+            stat[2] = fanout
+
+    def stats(self):
+        """
+        Return the statistics as a dictionary, ready to be dumped as JSON.
+        """
+        handlers = dict((name, {'calls': calls, 'total': total, 'max': max_})
+                        for name, (calls, total, max_) in self.handlers.items())
+        events = {}
+        for (source, event_type), (count, fanout, max_) in self.events.items():
+            events.setdefault(source, {})[event_type] = {
+                'events': count, 'handlers': fanout, 'max_handlers': max_}
+        return {'handlers': handlers, 'events': events}
+
+    def dump(self, filename):
+        """
+        Write the statistics to file ``filename`` as JSON.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.stats(), f, indent=2, sort_keys=True)
+
+    def report(self, limit=20, key='total'):
+        """
+        Return a table of the ``limit`` handlers that take the most time
+        (``key`` is 'total', 'max' or 'calls'), followed by the fan-out of
+        the event types.
+        """
+        column = {'calls': 0, 'total': 1, 'max': 2}[key]
+        handlers = sorted(self.handlers.items(), key=lambda i: i[1][column],
+                          reverse=True)
+        lines = ['%8s %10s %10s  %s' % ('calls', 'total (s)', 'max (s)', 'handler')]
+        for name, (calls, total, max_) in handlers[:limit]:
+            lines.append('%8d %10.4f %10.4f  %s' % (calls, total, max_, name))
+        lines.append('')
+        lines.append('%8s %10s %10s  %s' % ('events', 'handlers', 'max', 'event'))
+        for (source, event_type), (count, fanout, max_) in sorted(self.events.items()):
+            lines.append('%8d %10d %10d  %s: %s' % (count, fanout, max_, source, event_type))
+        return '\n'.join(lines)
+
+
+def start(*services):
+    """
+    Start profiling the event handlers of ``services`` (the component
+    registry and/or the element dispatcher). The services share one
+    HandlerProfile, which is returned.
+    """
+    profile = HandlerProfile()
+    for service in services:
+        service.start_profiling(profile)
+    return profile
+
+
+def stop(*services):
+    """
+    Stop profiling the event handlers of ``services``.
+    """
+    for service in services:
+        service.stop_profiling()
+
+
+# vim:sw=4:et:ai
@@ -23,6 +23,7 @@ functions in the GObject main loop.
 
 This module provided the following classes:
 GIdleThread - Thread like behavior for generators in a main loop
+WorkerThread - Run a generator in a real thread, wait for it in a main loop
 Queue - A simple queue implementation suitable for use with GIdleThread
 
 Exceptions:
@@ -35,6 +36,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 import sys
 import gobject
+import threading
 import time
 import traceback
 import six
@@ -148,6 +150,89 @@ class GIdleThread(object):
             return False
 
 
+class WorkerThread(object):
+    """Run a generator in a thread of its own.
+
+    WorkerThread has the same interface as GIdleThread, but the generator
+    is executed in a separate thread, so the main loop is not held up by
+    it. The values yielded are put on the queue. wait() runs the GTK+ main
+    loop until the generator is finished.
+
+    The generator should not touch anything the main thread may change
+    while it is running. gobject.threads_init() should have been called
+    (gaphor.launch() does), or the thread hardly runs while the main loop
+    is waiting for events.
+    """
+
+    def __init__(self, generator, queue=None):
+        assert hasattr(generator, 'next'), 'The generator should be an iterator'
+        self._generator = generator
+        self._queue = queue
+        self._thread = None
+        self._interrupted = False
+        self._exc_info = (None, None, None)
+
+    def start(self):
+        """Start the generator in a new thread.
+        """
+        self._thread = threading.Thread(target=self.__generator_executer,
+                                        name='WorkerThread')
+        self._thread.start()
+
+    def wait(self, timeout=0):
+        """Wait until the generator is finished or return after timeout
+        seconds. The GTK+ main loop is run while waiting.
+        """
+        clock = time.time
+        start_time = clock()
+        main = gobject.main_context_default()
+        while self.is_alive():
+            if main.pending():
+                main.iteration(False)
+            else:
+                self._thread.join(0.01)
+            if timeout and (clock() - start_time >= timeout):
+                return
+
+    def interrupt(self):
+        """Stop the generator at the next value it yields.
+        """
+        self._interrupted = True
+
+    def is_alive(self):
+        """Returns True if the generator is still running.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    error = property(lambda self: self._exc_info[0],
+                     doc="Return a possible exception that had occured "\
+                         "during execution of the generator")
+
+    exc_info = property(lambda self: self._exc_info,
+                     doc="Return a exception information as provided by "\
+                         "sys.exc_info()")
+
+    def reraise(self):
+        """Rethrow the error that occured during execution of the generator.
+        """
+        exc_info = self._exc_info
+        if exc_info[0]:
+            six.reraise(exc_info[0], exc_info[1], exc_info[2])
+
+    def __generator_executer(self):
+        try:
+            for result in self._generator:
+                if self._interrupted:
+                    break
+                if self._queue:
+                    try:
+                        self._queue.put(result)
+                    except QueueFull:
+                        pass
+        except:
+            self._exc_info = sys.exc_info()
+
+
 class QueueEmpty(Exception):
     """Exception raised whenever the queue is empty and someone tries to fetch
     a value.
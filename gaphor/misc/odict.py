@@ -1,69 +1,129 @@
 # from http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/107747
+"""
+Ordered dictionary.
+
+Keys are kept in insertion order by means of a doubly linked list. Each
+link is a list ``[previous, next, key]``. A dictionary maps the keys to
+their link, so insertion, deletion, lookup and swapping of keys are
+all O(1) operations.
+"""
+
 from __future__ import absolute_import
-from six.moves import map
-from six.moves import zip
+
+__all__ = ['odict']
+
+
 class odict(dict):
 
-    def __init__(self, dict=()):
-        self._keys = []
-        super(odict, self).__init__(dict)
+    def __init__(self, items=()):
+        super(odict, self).__init__()
+        self._root = root = []
+        root[:] = [root, root, None]
+        self._map = {}
+        self.update(items)
+
+    def __setitem__(self, key, item):
+        if key not in self._map:
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = self._map[key] = [last, root, key]
+        dict.__setitem__(self, key, item)
 
     def __delitem__(self, key):
         dict.__delitem__(self, key)
-        self._keys.remove(key)
+        prev, next, _ = self._map.pop(key)
+        prev[1] = next
+        next[0] = prev
 
-    def __setitem__(self, key, item):
-        dict.__setitem__(self, key, item)
-        if key not in self._keys: self._keys.append(key)
+    def __iter__(self):
+        root = self._root
+        link = root[1]
+        while link is not root:
+            yield link[2]
+            link = link[1]
+
+    def __reversed__(self):
+        root = self._root
+        link = root[0]
+        while link is not root:
+            yield link[2]
+            link = link[0]
+
+    def __reduce__(self):
+        return self.__class__, (self.items(),)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.items())
 
     def clear(self):
         dict.clear(self)
-        self._keys = []
+        root = self._root
+        root[:] = [root, root, None]
+        self._map.clear()
 
     def copy(self):
-        dict = dict.copy(self)
-        dict._keys = self._keys[:]
-        return dict
+        return self.__class__(self.items())
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[k] for k in self]
 
     def items(self):
-        return list(zip(self._keys, list(self.values())))
+        return [(k, self[k]) for k in self]
 
-    def keys(self):
-        return self._keys
+    iterkeys = __iter__
+
+    def itervalues(self):
+        for k in self:
+            yield self[k]
+
+    def iteritems(self):
+        for k in self:
+            yield (k, self[k])
+
+    def pop(self, key, *default):
+        if key in self._map:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
 
     def popitem(self):
-        try:
-            key = self._keys[-1]
-        except IndexError:
+        if not self:
             raise KeyError('dictionary is empty')
-
+        key = self._root[0][2]
         val = self[key]
         del self[key]
 
         return (key, val)
 
     def setdefault(self, key, failobj=None):
-        dict.setdefault(self, key, failobj)
-        if key not in self._keys: self._keys.append(key)
-
-    def update(self, dict):
-        dict.update(self, dict)
-        for key in dict.keys():
-            if key not in self._keys: self._keys.append(key)
-
-    def values(self):
-        return list(map(self.get, self._keys))
-    
+        if key not in self._map:
+            self[key] = failobj
+        return self[key]
+
+    def update(self, items=(), **kwargs):
+        if hasattr(items, 'keys'):
+            for key in items.keys():
+                self[key] = items[key]
+        else:
+            for key, value in items:
+                self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
 
     def swap(self, k1, k2):
         """
         Swap two elements using their keys.
         """
-        i1 = self._keys.index(k1)
-        i2 = self._keys.index(k2)
-        self._keys[i1], self._keys[i2] = self._keys[i2], self._keys[i1]
-
+        map = self._map
+        l1 = map[k1]
+        l2 = map[k2]
+        l1[2], l2[2] = k2, k1
+        map[k1], map[k2] = l2, l1
 
-    def __iter__(self):
-        for k in self._keys:
-            yield k
+# vim:sw=4:et:ai
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import json
+import os
+import tempfile
+import unittest
+
+from gaphor.misc.eventprofile import HandlerProfile, handler_name
+
+
+class Event(object):
+    pass
+
+
+class Watcher(object):
+
+    def __init__(self):
+        self.events = []
+
+    def handler(self, event):
+        self.events.append(event)
+
+    def failing(self, event):
+        raise ValueError(event)
+
+
+class Callable(object):
+
+    def __call__(self, event):
+        pass
+
+
+def handler(event):
+    pass
+
+
+class HandlerProfileTestCase(unittest.TestCase):
+
+    def test_handler_name(self):
+        self.assertEquals(__name__ + '.handler', handler_name(handler))
+        self.assertEquals(__name__ + '.Watcher.handler', handler_name(Watcher().handler))
+        self.assertEquals(__name__ + '.Callable.__call__', handler_name(Callable()))
+
+    def test_call(self):
+        profile = HandlerProfile()
+        watchers = Watcher(), Watcher()
+        event = Event()
+        for w in watchers:
+            profile.call(w.handler, event)
+        profile.call(handler, event)
+        self.assertRaises(ValueError, profile.call, watchers[0].failing, event)
+
+        self.assertEquals([event], watchers[0].events)
+        stats = profile.stats()['handlers']
+        self.assertEquals(2, stats[__name__ + '.Watcher.handler']['calls'])
+        self.assertEquals(1, stats[__name__ + '.handler']['calls'])
+        self.assertEquals(1, stats[__name__ + '.Watcher.failing']['calls'])
+        for stat in stats.values():
+            assert 0 <= stat['max'] <= stat['total']
+
+    def test_dispatched(self):
+        profile = HandlerProfile()
+        profile.dispatched('registry', Event(), 3)
+        profile.dispatched('registry', Event(), 1)
+        self.assertEquals({'Event': {'events': 2, 'handlers': 4, 'max_handlers': 3}},
+                          profile.stats()['events']['registry'])
+        assert 'registry: Event' in profile.report()
+
+        profile.reset()
+        self.assertEquals({'handlers': {}, 'events': {}}, profile.stats())
+
+    def test_dump(self):
+        profile = HandlerProfile()
+        profile.call(handler, Event())
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            profile.dump(filename)
+            with open(filename) as f:
+                self.assertEquals(1, json.load(f)['handlers'][__name__ + '.handler']['calls'])
+        finally:
+            os.remove(filename)
+
+
+# vim:sw=4:et:ai
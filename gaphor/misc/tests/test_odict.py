@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+from __future__ import absolute_import
+import pickle
+import unittest
+from gaphor.misc.odict import odict
+
+
+class OdictTestCase(unittest.TestCase):
+
+    def test_insertion_order(self):
+        d = odict()
+        for k in 'dbca':
+            d[k] = k.upper()
+        assert d.keys() == list('dbca')
+        assert d.values() == list('DBCA')
+        assert d.items() == [('d', 'D'), ('b', 'B'), ('c', 'C'), ('a', 'A')]
+        assert list(d.itervalues()) == list('DBCA')
+
+    def test_overwrite_keeps_position(self):
+        d = odict([('a', 1), ('b', 2)])
+        d['a'] = 3
+        assert d.items() == [('a', 3), ('b', 2)]
+
+    def test_delete(self):
+        d = odict([('a', 1), ('b', 2), ('c', 3)])
+        del d['b']
+        assert d.keys() == ['a', 'c']
+        assert 'b' not in d
+        d['b'] = 4
+        assert d.keys() == ['a', 'c', 'b']
+        self.assertRaises(KeyError, d.__delitem__, 'x')
+
+    def test_swap(self):
+        d = odict([('a', 1), ('b', 2), ('c', 3)])
+        d.swap('a', 'c')
+        assert d.keys() == ['c', 'b', 'a']
+        assert d['a'] == 1
+        del d['a']
+        assert d.keys() == ['c', 'b']
+
+    def test_popitem_and_clear(self):
+        d = odict([('a', 1), ('b', 2)])
+        assert d.popitem() == ('b', 2)
+        d.clear()
+        assert d.keys() == []
+        self.assertRaises(KeyError, d.popitem)
+
+    def test_pickle(self):
+        d = odict([('b', 1), ('a', 2)])
+        c = pickle.loads(pickle.dumps(d))
+        assert c.items() == d.items()
+
+
+# vim:sw=4:et:ai
@@ -20,6 +20,7 @@
 from __future__ import absolute_import
 import sys
 import unittest
+from cStringIO import StringIO
 from gaphor.misc.xmlwriter import XMLWriter
 
 class Writer:
@@ -89,5 +90,98 @@ class XMLWriterTestCase(unittest.TestCase):
         xml = """<?xml version="1.0" encoding="%s"?>\n<g:foo xmlns:g="http://gaphor.devjavu.com/schema"/>""" % sys.getdefaultencoding()
         assert w.s == xml, w.s
 
+    def test_write_value(self):
+        w = Writer()
+        xml_w = XMLWriter(w)
+        xml_w.startElement('foo', {})
+        xml_w.startElement('bar', {})
+        xml_w.startElement('val', {})
+        xml_w.characters('a < b')
+        xml_w.endElement('val')
+        xml_w.endElement('bar')
+        xml_w.startElement('baz', {})
+        xml_w.startElement('ref', {'refid': '1'})
+        xml_w.endElement('ref')
+        xml_w.endElement('baz')
+        xml_w.startElement('refs', {})
+        xml_w.startElement('reflist', {})
+        for refid in ('2', '3'):
+            xml_w.startElement('ref', {'refid': refid})
+            xml_w.endElement('ref')
+        xml_w.endElement('reflist')
+        xml_w.endElement('refs')
+        xml_w.startElement('none', {})
+        xml_w.startElement('reflist', {})
+        xml_w.endElement('reflist')
+        xml_w.endElement('none')
+        xml_w.endElement('foo')
+
+        w2 = Writer()
+        xml_w = XMLWriter(w2)
+        xml_w.startElement('foo', {})
+        xml_w.write_value('bar', 'a < b')
+        xml_w.write_ref('baz', '1')
+        xml_w.write_refs('refs', ['2', '3'])
+        xml_w.write_refs('none', [])
+        xml_w.endElement('foo')
+
+        assert w.s == w2.s, w2.s + ' != ' + w.s
+
+    def test_buffered(self):
+        def write(xml_w):
+            xml_w.startDocument()
+            xml_w.startElement('foo', {'a': 'b&c'})
+            xml_w.write_value('bar', 'a < b & c > d')
+            xml_w.write_value('nul', 'a\0 <')
+            xml_w.write_value('text', u'caf\xe9 &')
+            xml_w.startElement('baz', {})
+            xml_w.characters('x & y')
+            xml_w.endElement('baz')
+            xml_w.endElement('foo')
+            xml_w.endDocument()
+
+        w = Writer()
+        write(XMLWriter(w, encoding='ascii'))
+        w2 = Writer()
+        write(XMLWriter(w2, encoding='ascii', buffered=True))
+
+        assert w.s == w2.s, w2.s + ' != ' + w.s
+
+    def test_buffered_tell(self):
+        """
+        The position of a buffered writer is that of the escaped output,
+        without flushing the buffer.
+        """
+        out = StringIO()
+        xml_w = XMLWriter(out, buffered=True)
+        xml_w.startElement('foo', {})
+        positions = []
+        for text in ('a < b & c > d', 'plain', 'a\0 <'):
+            xml_w.write_value('bar', text)
+            positions.append(xml_w.tell())
+        assert out.tell() == 0
+        xml_w.flush()
+        data = out.getvalue()
+        self.assertEquals([data.index('</bar>', p - 6) + 6 for p in positions], positions)
+        self.assertEquals(len(data), positions[-1])
+
+    def test_write_xml(self):
+        w = Writer()
+        xml_w = XMLWriter(w)
+        xml_w.startElement('foo', {})
+        xml_w.startElement('bar', {})
+        xml_w.endElement('bar')
+        xml_w.write_value('baz', 'a < b')
+        xml_w.endElement('foo')
+
+        w2 = Writer()
+        xml_w = XMLWriter(w2)
+        xml_w.startElement('foo', {})
+        xml_w.write_xml('<bar/>')
+        xml_w.write_xml('<baz>\n<val>a &lt; b</val>\n</baz>')
+        xml_w.endElement('foo')
+
+        assert w.s == w2.s, w2.s + ' != ' + w.s
+
 
 # vim:sw=4:et:ai
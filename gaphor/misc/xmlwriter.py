@@ -31,12 +31,88 @@ try:
 except ImportError:
     _error_handling = "strict"
 
+# Size of the output buffer of a buffered XMLWriter
+BUFFER_SIZE = 64 * 1024
+
+
+class _Buffer(object):
+    """
+    Output buffer of a buffered XMLWriter. Data is collected in memory and
+    written to ``out`` in large chunks. Text that still has to be escaped
+    is added by write_text(); it is escaped in one go when the buffer is
+    flushed.
+    """
+
+    def __init__(self, out, size=BUFFER_SIZE):
+        self._out = out
+        self._size = size
+        self._parts = []
+        self._text = []
+        self._length = 0
+        # Number of characters escaping adds to the queued text
+        self._growth = 0
+
+    def write(self, data):
+        if not isinstance(data, str):
+            # Like file.write() does for unicode strings
+            data = str(data)
+        self._parts.append(data)
+        self._length += len(data)
+        if self._length >= self._size:
+            self.flush()
+
+    def write_text(self, text):
+        """Write str ``text``, which is escaped when the buffer is flushed.
+        """
+        self._text.append(len(self._parts))
+        self._growth += 4 * text.count('&') + 3 * (text.count('<') + text.count('>'))
+        self.write(text)
+
+    def flush(self):
+        parts = self._parts
+        if self._text:
+            texts = [parts[i] for i in self._text]
+            escaped = escape('\0'.join(texts)).split('\0')
+            if len(escaped) != len(texts):
+                # Some text contains a NUL character itself
+                escaped = [escape(t) for t in texts]
+            for i, text in zip(self._text, escaped):
+                parts[i] = text
+            self._text = []
+            self._growth = 0
+        if parts:
+            self._out.write(''.join(parts))
+            self._parts = []
+            self._length = 0
+
+    def tell(self):
+        """
+        Return the position in the output, as if the buffer had been
+        flushed. The buffer is not flushed.
+        """
+        return self._out.tell() + self._length + self._growth
+
+
 class XMLWriter(xml.sax.handler.ContentHandler):
+    """
+    Write SAX events as XML to ``out``.
+
+    If ``buffered`` is set, the output is collected in memory and written
+    to ``out`` in large chunks. The output is only complete after
+    endDocument() or flush() has been called.
+
+    Besides the ContentHandler methods, write_value(), write_ref() and
+    write_refs() write the value and reference elements of Gaphor model
+    files directly.
+    """
 
-    def __init__(self, out=None, encoding=None):
+    def __init__(self, out=None, encoding=None, buffered=False):
         if out is None:
             out = sys.stdout
         xml.sax.handler.ContentHandler.__init__(self)
+        self._buffered = buffered
+        if buffered:
+            out = _Buffer(out)
         self._out = out
         self._ns_contexts = [{}] # contains uri -> prefix dicts
         self._current_context = self._ns_contexts[-1]
@@ -86,6 +162,30 @@ class XMLWriter(xml.sax.handler.ContentHandler):
         else:
             self._out.write(text.encode(self._encoding, _error_handling))
 
+    def _write_text(self, text):
+        """
+        Write character data. The start tag must have been closed already.
+        """
+        if self._buffered and isinstance(text, str):
+            self._out.write_text(text)
+        else:
+            self._write(escape(text))
+
+    def flush(self):
+        """
+        Write the buffered output, if the writer is buffered.
+        """
+        if self._buffered:
+            self._out.flush()
+
+    def tell(self):
+        """
+        Return the current position in the output. The end of the last
+        start tag (or a newline) may not have been written yet, so the next
+        tag starts at the first '<' at or after this position.
+        """
+        return self._out.tell()
+
     def _qname(self, name):
         """Builds a qualified name from a (ns_url, localname) pair"""
         if name[0]:
@@ -103,6 +203,9 @@ class XMLWriter(xml.sax.handler.ContentHandler):
         self._write('<?xml version="1.0" encoding="%s"?>\n' %
                         self._encoding)
 
+    def endDocument(self):
+        self.flush()
+
     def startPrefixMapping(self, prefix, uri):
         self._ns_contexts.append(self._current_context.copy())
         self._current_context[uri] = prefix
@@ -140,7 +243,60 @@ class XMLWriter(xml.sax.handler.ContentHandler):
         if self._in_cdata:
             self._write(content.replace(']]>', '] ]>'))
         else:
-            self._write(escape(content))
+            # Close the start tag first
+            self._write('')
+            self._write_text(content)
+
+    def write_value(self, name, text):
+        """
+        Write ``<name><val>text</val></name>``. The output is the same as
+        that of the equivalent startElement(), characters() and
+        endElement() calls.
+        """
+        self._write(name, start_tag=True)
+        self._out.write('>\n<val>')
+        self._in_start_tag = False
+        self._write_text(text)
+        self._out.write('</val>\n</%s>' % name)
+        self._next_newline = True
+
+    def write_ref(self, name, refid):
+        """
+        Write ``<name><ref refid="refid"/></name>``.
+        """
+        self._write(name, start_tag=True)
+        self._out.write('>\n<ref refid=%s/>\n</%s>' % (quoteattr(refid), name))
+        self._in_start_tag = False
+        self._next_newline = True
+
+    def write_refs(self, name, refids):
+        """
+        Write ``<name><reflist>`` with a ``<ref refid="refid"/>`` for each
+        of ``refids`` and the closing tags.
+        """
+        self._write(name, start_tag=True)
+        if refids:
+            self._out.write('>\n<reflist>\n%s\n</reflist>\n</%s>' % (
+                '\n'.join('<ref refid=%s/>' % quoteattr(refid) for refid in refids),
+                name))
+        else:
+            self._out.write('>\n<reflist/>\n</%s>' % name)
+        self._in_start_tag = False
+        self._next_newline = True
+
+    def write_xml(self, data):
+        """
+        Write ``data``, one or more elements that have been serialized
+        already (for instance by another XMLWriter). The output is the same
+        as if the elements had been written by this writer.
+        """
+        if self._in_start_tag:
+            self._out.write('>\n')
+            self._in_start_tag = False
+        elif self._next_newline:
+            self._out.write('\n')
+        self._out.write(data)
+        self._next_newline = True
 
     def ignorableWhitespace(self, content):
         self._write(content)
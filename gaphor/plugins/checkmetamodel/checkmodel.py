@@ -48,7 +48,7 @@ def get_superclasses(class_):
 
 
 def check_classes(element_factory):
-    classes = element_factory.select(lambda e: e.isKindOf(uml2.Class))
+    classes = element_factory.select_type(uml2.Class)
     names = [ c.name for c in classes ]
     for c in classes:
         if names.count(c.name) > 1:
@@ -59,7 +59,7 @@ def check_association_end_subsets(element_factory, end):
     # TODO: don't use Tagged values, use Stereotype values or something
     subsets = get_subsets(end.taggedValue and end.taggedValue[0].value or '')
     opposite_subsets = get_subsets(end.opposite.taggedValue and end.opposite.taggedValue[0].value or '')
-    subset_properties = element_factory.select(lambda e: e.isKindOf(uml2.Property) and e.name in subsets)
+    subset_properties = element_factory.select_type(uml2.Property, lambda e: e.name in subsets)
 
     # TODO: check if properties belong to a superclass of the end's class
 
@@ -84,7 +84,7 @@ def check_association_end(element_factory, end):
     check_association_end_subsets(element_factory, end)
 
 def check_associations(element_factory):
-    for a in element_factory.select(lambda e: e.isKindOf(uml2.Association)):
+    for a in element_factory.select_type(uml2.Association):
         assert len(a.memberEnd) == 2
         head = a.memberEnd[0]
         tail = a.memberEnd[1]
@@ -92,7 +92,7 @@ def check_associations(element_factory):
         check_association_end(element_factory, tail)
 
 def check_attributes(element_factory):
-    for a in element_factory.select(lambda e: e.isKindOf(uml2.Property) and not e.association):
+    for a in element_factory.select_type(uml2.Property, lambda e: not e.association):
         if not a.typeValue or not a.typeValue.value:
             report(a,'Attribute has no type: %s' % a.name)
         elif a.typeValue.value.lower() not in ('string', 'boolean', 'integer', 'unlimitednatural'):
@@ -113,8 +113,8 @@ class Engineer(object):
                     superclass_item = self.parser.classlist[superclassname].gaphor_class_item
                 except KeyError as e:
                     print('No class found named', superclassname)
-                    others = self.element_factory.lselect(
-                        lambda e: isinstance(e, uml2.Class) and e.name == superclassname)
+                    others = [e for e in self.element_factory.lookup_by(uml2.NamedElement.name, superclassname)
+                              if isinstance(e, uml2.Class)]
                     if others:
                         superclass = others[0]
                         print('Found class in factory: %s' % superclass.name)
@@ -177,7 +177,8 @@ class Engineer(object):
             superclass_item = self.parser.classlist[classname].gaphor_class_item
         except KeyError as e:
             print('No class found named', classname)
-            others = self.element_factory.lselect(lambda e: isinstance(e, uml2.Class) and e.name == classname)
+            others = [e for e in self.element_factory.lookup_by(uml2.NamedElement.name, classname)
+                      if isinstance(e, uml2.Class)]
             if others:
                 superclass = others[0]
                 print('Found class in factory: %s' % superclass.name)
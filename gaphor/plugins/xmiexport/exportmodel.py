@@ -21,6 +21,7 @@
 # along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
 from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.UML import uml2
 
 class XMIExport(object):
     
@@ -265,13 +266,13 @@ class XMIExport(object):
         
         xmi.startElement('XMI', attrs=attributes)
         
-        for package in self.element_factory.select(self.select_package):
+        for package in self.element_factory.select_type(uml2.Package, self.select_package):
             self.handle(xmi, package)
             
-        for generalization in self.element_factory.select(self.select_generalization):
+        for generalization in self.element_factory.select_type(uml2.Generalization, self.select_generalization):
             self.handle(xmi, generalization)
             
-        for realization in self.element_factory.select(self.select_realization):
+        for realization in self.element_factory.select_type(uml2.Implementation, self.select_realization):
             self.handle(xmi, realization)
         
         xmi.endElement('XMI')
@@ -285,4 +286,4 @@ class XMIExport(object):
         return element.__class__.__name__ == 'Generalization'
         
     def select_realization(self, element):
-        return element.__class__.name__ == 'Implementation'
+        return element.__class__.__name__ == 'Implementation'
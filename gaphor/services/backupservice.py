@@ -12,70 +12,354 @@
 #
 # Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
 # WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
-# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
 # more details.
 #
-# You should have received a copy of the GNU Library General Public 
+# You should have received a copy of the GNU Library General Public
 # along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Autosave and crash recovery.
+
+The backup service saves the model to a backup file in the user data
+directory, every few minutes and after a number of transactions. The
+first backup is written as a whole, from a snapshot of the model, by a
+worker thread. The snapshot is taken in idle callbacks (see
+storage.freeze_generator()), so the model can be edited meanwhile. Later
+backups append the elements that have changed to the journal of the
+backup file (see gaphor.storage.journal), until the journal has grown
+too large and the backup is written as a whole again. So the cost of a backup depends on
+the number of changes, not on the size of the model.
+
+The backup file is removed when Gaphor shuts down. Backup files left
+behind by a Gaphor that did not shut down properly are offered for
+recovery on the next start.
+"""
+
 from __future__ import absolute_import
-from zope import interface
-from gaphor.UML.uml2 import Element
+
+import errno
+import glob
+import os
+
+import gobject
+from zope import interface, component
+
 from gaphor.interfaces import IService
-from gaphor.core import inject
+from gaphor.core import _, inject
+from gaphor.event import TransactionCommit
+from gaphor.UML.interfaces import IModelFactoryEvent, IFlushFactoryEvent
+from gaphor.storage import storage, journal
+from gaphor.misc import get_user_data_dir
+from gaphor.misc.gidlethread import GIdleThread, WorkerThread
+from gaphor.misc.xmlwriter import XMLWriter
 
-# Register application specific picklers:
-from gaphor.misc.latepickle import LatePickler
+# Default number of seconds between backups
+AUTOSAVE_INTERVAL = 300
 
+# Default number of transactions after which a backup is made
+AUTOSAVE_TRANSACTIONS = 100
 
-import pickle
-from six.moves import map
-class MyPickler(LatePickler):
-    """
-    Customize the pickler to only delay instantiations of Element objects.
+# The backup is written as a whole once its journal exceeds this
+# fraction of the size of the backup file.
+JOURNAL_COMPACT_RATIO = 0.5
+
+BACKUP_PREFIX = 'autosave-'
+BACKUP_EXT = '.gaphor'
+
+
+# Windows process access right, error code and exit code of a running
+# process
+PROCESS_QUERY_INFORMATION = 0x0400
+ERROR_ACCESS_DENIED = 5
+STILL_ACTIVE = 259
+
+
+def _running_nt(pid):
+    """Return True if a Windows process with process id ``pid`` is running.
     """
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(PROCESS_QUERY_INFORMATION, False, pid)
+    if not handle:
+        # No such process, unless we are not allowed to query it
+        return kernel32.GetLastError() == ERROR_ACCESS_DENIED
+    try:
+        code = wintypes.DWORD()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+            return True
+        return code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
 
-    def delay(self, obj):
-        return isinstance(obj, Element)
+
+def _running(pid):
+    """Return True if a process with process id ``pid`` is running.
+    """
+    if os.name == 'nt':
+        # os.kill() would terminate the process
+        return _running_nt(pid)
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
 
 
 class BackupService(object):
     """
-    This service makes backups every *x* minutes.
+    This service makes backups every *x* minutes, or after *n*
+    transactions. The interval and number of transactions are set by the
+    autosave-interval and autosave-transactions properties; 0 disables
+    them.
     """
 
     interface.implements(IService)
 
     element_factory = inject('element_factory')
+    component_registry = inject('component_registry')
+    properties = inject('properties')
+    main_window = inject('main_window')
 
     def __init__(self):
-        self.tempname = '.backup.gaphor.tmp'
-
+        self.datadir = get_user_data_dir()
+        self._changes = None
+        self._complete = False
+        self._worker = None
+        # Incremented when the model is replaced, to detect backups of a
+        # model that is gone by the time they are written
+        self._generation = 0
+        self._written_generation = 0
+        self._transactions = 0
+        self._timeout_id = 0
+        self._recovery_id = 0
 
     def init(self, app):
-        pass
+        self._changes = journal.ChangeTracker(self.element_factory)
+        self._changes.register(self.component_registry)
+        self.component_registry.register_handler(self._transaction_committed)
+        self.component_registry.register_handler(self._model_replaced)
+        self.component_registry.register_handler(self._model_flushed)
 
+        interval = self.get_property('autosave-interval', AUTOSAVE_INTERVAL)
+        if interval:
+            self._timeout_id = gobject.timeout_add(interval * 1000, self._timeout)
+        self._recovery_id = gobject.idle_add(self._offer_recovery)
 
     def shutdown(self):
-        pass
+        for source_id in (self._timeout_id, self._recovery_id):
+            if source_id:
+                gobject.source_remove(source_id)
+        self._timeout_id = self._recovery_id = 0
 
+        self._stop_freeze()
+        self.wait()
+        if self._changes:
+            self._changes.unregister(self.component_registry)
+            self._changes = None
+            self.component_registry.unregister_handler(self._transaction_committed)
+            self.component_registry.unregister_handler(self._model_replaced)
+            self.component_registry.unregister_handler(self._model_flushed)
 
-    def backup(self):
-        f = open(self.tempname, 'w')
+        # A clean shut down, the backup is not needed anymore
+        self.remove(self.filename)
+
+    def get_property(self, name, default):
         try:
-            pickler = MyPickler(f)
-            pickler.dump(self.element_factory.lselect())
-        finally:
-            f.close()
+            return self.properties.get(name, default)
+        except component.interfaces.ComponentLookupError:
+            return default
+
+    filename = property(lambda s: os.path.join(s.datadir,
+                            '%s%d%s' % (BACKUP_PREFIX, os.getpid(), BACKUP_EXT)),
+                        doc="The backup file of this Gaphor process")
+
+    def backup(self):
+        """
+        Make a backup of the model. If the backup file is being written
+        already, nothing is done: the changes are saved by the next backup.
+        """
+        if self._worker:
+            return
 
+        self._transactions = 0
+        filename = self.filename
+        if self._complete and os.path.exists(filename) and \
+                journal.size(filename) < os.path.getsize(filename) * JOURNAL_COMPACT_RATIO:
+            elements, deleted = self._changes.changes()
+            if elements or deleted:
+                journal.append(filename, elements, deleted)
+            self._changes.reset()
+            return
 
-    def restore(self):
-        f = open(self.tempname, 'r')
+        if not os.path.exists(self.datadir):
+            os.mkdir(self.datadir)
+        self._changes.reset()
+        self._complete = False
+        self._worker = GIdleThread(self._freeze(storage.FrozenModel()))
+        self._worker.start()
+        gobject.timeout_add(100, self._poll)
+
+    def _freeze(self, frozen):
+        """
+        Take a snapshot of the model in idle callbacks, so the model can be
+        edited meanwhile. The elements that have been changed while the
+        snapshot was taken are frozen again at the end. Then the snapshot
+        is written by a worker thread.
+        """
+        for x in storage.freeze_generator(self.element_factory, frozen):
+            yield x
+        elements, deleted = self._changes.changes()
+        frozen.update(elements, deleted)
+        self._changes.reset()
+        self._written_generation = self._generation
+        self._worker = WorkerThread(self._write(frozen, self.filename + '.tmp'))
+        self._worker.start()
+
+    def _stop_freeze(self):
+        """
+        Stop taking a snapshot of the model, because the model is replaced.
+        """
+        if isinstance(self._worker, GIdleThread):
+            self._worker.interrupt()
+            self._worker = None
+
+    def _write(self, frozen, filename):
+        with open(filename, 'w') as out:
+            for x in storage.save_frozen_generator(XMLWriter(out, buffered=True), frozen):
+                yield x
+
+    def _poll(self):
+        if self._worker and self._worker.is_alive():
+            return True
+        self._written()
+        return False
+
+    def _written(self):
+        """
+        Called once the worker thread has written the backup file (or
+        taking the snapshot failed). The new backup file replaces the old
+        one and its journal, unless the model has been replaced in the
+        meantime.
+        """
+        worker = self._worker
+        if worker is None:
+            return
+        self._worker = None
+
+        filename = self.filename
+        if worker.error or self._written_generation != self._generation:
+            if worker.error:
+                log.error('Writing backup file %s failed' % filename, exc_info=worker.exc_info)
+            # else the model has been replaced while it was written
+            if os.path.exists(filename + '.tmp'):
+                os.remove(filename + '.tmp')
+            return
+
+        journal.remove(filename)
+        if os.name == 'nt' and os.path.exists(filename):
+            # Windows does not rename to an existing file
+            os.remove(filename)
+        os.rename(filename + '.tmp', filename)
+        self._complete = True
+
+    def wait(self):
+        """
+        Wait until the backup file that is being written is complete.
+        """
+        while self._worker:
+            worker = self._worker
+            worker.wait()
+            if self._worker is worker:
+                self._written()
+
+    def remove(self, filename):
+        """Remove backup file ``filename`` and its journal.
+        """
+        journal.remove(filename)
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    def left_behind(self):
+        """
+        Return the backup files left behind by Gaphor processes that did not
+        shut down properly, most recent first.
+        """
+        backups = []
+        for filename in glob.glob(os.path.join(self.datadir, BACKUP_PREFIX + '*' + BACKUP_EXT)):
+            pid = os.path.basename(filename)[len(BACKUP_PREFIX):-len(BACKUP_EXT)]
+            try:
+                pid = int(pid)
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _running(pid):
+                backups.append(filename)
+        backups.sort(key=os.path.getmtime, reverse=True)
+        return backups
+
+    def restore(self, filename):
+        """
+        Load the model from backup file ``filename``.
+        """
+        storage.load(filename, self.element_factory)
+        self._complete = False
+
+    def _offer_recovery(self):
+        self._recovery_id = 0
+        backups = self.left_behind()
+        if not backups:
+            return False
+
+        from gaphor.ui.questiondialog import QuestionDialog
         try:
-            elements = pickle.Unpickler(f).load()
-        finally:
-            f.close()
-        self.element_factory.flush()
-        list(map(self.element_factory.bind, elements))
+            parent = self.main_window.window
+        except component.interfaces.ComponentLookupError:
+            parent = None
+        dialog = QuestionDialog(_('Gaphor did not shut down properly.'
+                                  ' Do you want to recover the model that'
+                                  ' was saved automatically?'),
+                                parent=parent)
+        answer = dialog.answer
+        dialog.destroy()
+
+        if answer:
+            self.restore(backups[0])
+        for filename in backups:
+            self.remove(filename)
+        return False
+
+    def _timeout(self):
+        if self._changes.changes() != ([], []):
+            self.backup()
+        return True
+
+    @component.adapter(TransactionCommit)
+    def _transaction_committed(self, event):
+        self._transactions += 1
+        transactions = self.get_property('autosave-transactions', AUTOSAVE_TRANSACTIONS)
+        if transactions and self._transactions >= transactions:
+            self.backup()
+
+    @component.adapter(IModelFactoryEvent)
+    def _model_replaced(self, event):
+        """A model has been loaded or created, the backup is out of date.
+        """
+        self._replaced()
+
+    @component.adapter(IFlushFactoryEvent)
+    def _model_flushed(self, event):
+        """The model has been flushed, the backup is out of date.
+        """
+        self._replaced()
+
+    def _replaced(self):
+        """
+        The model has been replaced: a snapshot that is being taken or
+        written is of the old model, so it is discarded.
+        """
+        self._stop_freeze()
+        self._generation += 1
+        self._complete = False
 
 
 # vim: sw=4:et:ai
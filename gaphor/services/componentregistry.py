@@ -24,13 +24,20 @@ zope.component) to this service.
 
 Maybe we should split the ComponentRegistry in a Dispatcher (register_handler,
 unregister_handler, handle), a AdapterRegistry and a Subscription registry.
+
+Events are dispatched by means of a table that maps the interfaces an event
+provides (in practice: its class) to the event filters and handlers
+registered for it. The table is cleared whenever the registry (or the global registry it is based
+on) changes, which is tracked by the generation of the adapter registry.
+Services are cached the same way, by the generation of the utility
+registry.
 """
 
 from __future__ import absolute_import
 from zope import interface, component
+from zope.interface import providedBy
 from zope.component import registry
 from gaphor.interfaces import IService, IEventFilter
-from six.moves import map
 
 
 class ZopeComponentRegistry(object):
@@ -46,12 +53,20 @@ class ZopeComponentRegistry(object):
     interface.implements(IService)
 
     def __init__(self):
-        pass
+        self._dispatch = {}
+        self._generation = None
+        self._services = {}
+        self._services_generation = None
+        self._profile = None
 
     def init(self, app):
         self._components = registry.Components(
                                name='component_registry',
                                bases=(component.getGlobalSiteManager(),))
+        self._dispatch = {}
+        self._generation = self._components.adapters._generation
+        self._services = {}
+        self._services_generation = self._components.utilities._generation
 
         # Make sure component.handle() and query methods works.
         # TODO: eventually all queries should be done through the Application
@@ -76,7 +91,21 @@ class ZopeComponentRegistry(object):
 
 
     def get_service(self, name):
-        return self.get_utility(IService, name)
+        """
+        Return service ``name``. Services are looked up once, as long as
+        no utility is (un)registered, so services can still be replaced.
+        zope.component.ComponentLookupError is thrown if no such service
+        exists.
+        """
+        utilities = self._components.utilities
+        if utilities._generation != self._services_generation:
+            self._services.clear()
+            self._services_generation = utilities._generation
+        try:
+            return self._services[name]
+        except KeyError:
+            srv = self._services[name] = self.get_utility(IService, name)
+            return srv
 
 
     # Wrap zope.component's Components methods
@@ -166,24 +195,78 @@ class ZopeComponentRegistry(object):
         Unregister a previously registered handler.
         """
         self._components.unregisterHandler(factory, required)
- 
-    def _filter(self, objects):
-        filtered = list(objects)
-        for o in objects:
-            for adapter in self._components.subscribers(objects, IEventFilter):
-                if adapter.filter():
-                    # event is blocked
-                    filtered.remove(o)
-                    break
-        return filtered
+
+    def _lookup(self, event):
+        """
+        Return a tuple (filters, handlers) for ``event``: the factories of
+        the IEventFilter adapters and the handlers registered for events
+        like it. They are looked up once for every kind of event, as long
+        as the registry does not change.
+        """
+        adapters = self._components.adapters
+        if adapters._generation != self._generation:
+            # Something has been (un)registered, maybe in the global registry
+            self._dispatch.clear()
+            self._generation = adapters._generation
+        provided = providedBy(event)
+        try:
+            return self._dispatch[provided]
+        except KeyError:
+            entry = self._dispatch[provided] = (
+                    tuple(adapters.subscriptions((provided,), IEventFilter)),
+                    tuple(adapters.subscriptions((provided,), None)))
+            return entry
+
+    def handlers(self, event):
+        """
+        Return the handlers for ``event``, in the order they are called.
+        """
+        return self._lookup(event)[1]
+
+    def filters(self, event):
+        """
+        Return the factories of the IEventFilter adapters for ``event``.
+        """
+        return self._lookup(event)[0]
 
     def handle(self, *events):
         """
-        Send event notifications to registered handlers.
+        Send event notifications to registered handlers. Events blocked by
+        an IEventFilter are not sent. Usually no filters are registered
+        (see ElementChangedEventBlocker), and the check costs nothing.
+        """
+        for event in events:
+            filters, handlers = self._lookup(event)
+            if filters and self._blocked(event, filters):
+                continue
+            if self._profile is not None:
+                self._profiled_handle(event, handlers)
+                continue
+            for handler in handlers:
+                handler(event)
+
+    def start_profiling(self, profile):
+        """
+        Record the calls of event handlers in ``profile``, a
+        gaphor.misc.eventprofile.HandlerProfile.
         """
-        objects = self._filter(events)
-        if objects:
-            list(map(self._components.handle, events))
+        self._profile = profile
+
+    def stop_profiling(self):
+        self._profile = None
+
+    def _profiled_handle(self, event, handlers):
+        profile = self._profile
+        profile.dispatched('component_registry', event, len(handlers))
+        for handler in handlers:
+            profile.call(handler, event)
+
+    def _blocked(self, event, filters):
+        for factory in filters:
+            adapter = factory(event)
+            if adapter is not None and adapter.filter():
+                return True
+        return False
 
 
 # vim:sw=4:et:ai
@@ -32,6 +32,47 @@ from gaphor.core import inject
 from gaphor.interfaces import IService
 
 
+# (class, path): tuple of properties, see compile_path()
+_compiled_paths = {}
+
+
+def compile_path(cls, path):
+    """
+    Return the tuple of UML properties (association, attribute, etc.) that
+    path ``path`` refers to, starting at class ``cls``. A path is a dot
+    separated list of property names; a property name can be followed by
+    a subclass of its type in angle brackets ('guard<Constraint>').
+
+    Paths are compiled once for every class, the properties are shared by
+    all elements of that class. AttributeError or ValueError is raised if
+    the path is not valid.
+    """
+    key = cls, path
+    try:
+        return _compiled_paths[key]
+    except KeyError:
+        pass
+
+    c = cls
+    tpath = []
+    for attr in path.split('.'):
+        cname = ''
+        if '<' in attr:
+            if not attr.endswith('>'):
+                raise ValueError('"%s" should end with ">"' % attr)
+            attr, cname = attr[:-1].split('<')
+        prop = getattr(c, attr)
+        tpath.append(prop)
+        if cname:
+            c = getattr(uml2, cname)
+            if not issubclass(c, prop.type):
+                raise ValueError('%s should be a subclass of %s' % (c, prop.type))
+        else:
+            c = prop.type
+    props = _compiled_paths[key] = tuple(tpath)
+    return props
+
+
 class EventWatcher(object):
     """
     A helper for easy registering and unregistering event handlers.
@@ -44,6 +85,7 @@ class EventWatcher(object):
         super(EventWatcher, self).__init__()
         self.element = element
         self.default_handler = default_handler
+        # path: (handler, properties)
         self._watched_paths = dict()
 
     def watch(self, path, handler=None):
@@ -62,12 +104,17 @@ class EventWatcher(object):
         # self.logger.debug('Path is %s' % path)
         # self.logger.debug('Handler is %s' % handler)
 
-        if handler:
-            self._watched_paths[path] = handler
-        elif self.default_handler:
-            self._watched_paths[path] = self.default_handler
-        else:
+        if not handler:
+            handler = self.default_handler
+        if not handler:
             raise ValueError('No handler provided for path ' + path)
+
+        # Check the path right away, not when the handlers are registered
+        if self.element is not None:
+            props = compile_path(type(self.element), path)
+        else:
+            props = path
+        self._watched_paths[path] = handler, props
         return self
 
     def register_handlers(self):
@@ -77,11 +124,8 @@ class EventWatcher(object):
         dispatcher = self.element_dispatcher
         element = self.element
 
-        for path, handler in six.iteritems(self._watched_paths):
-            # self.logger.debug('Path is %s' % path)
-            # self.logger.debug('Handler is %s' % handler)
-
-            dispatcher.register_handler(handler, element, path)
+        for handler, props in six.itervalues(self._watched_paths):
+            dispatcher.register_handler(handler, element, props)
 
     def unregister_handlers(self, *args):
         """
@@ -93,10 +137,7 @@ class EventWatcher(object):
 
         dispatcher = self.element_dispatcher
 
-        for path, handler in six.iteritems(self._watched_paths):
-            # self.logger.debug('Path is %s' % path)
-            # self.logger.debug('Handler is %s' % handler)
-
+        for handler, props in six.itervalues(self._watched_paths):
             dispatcher.unregister_handler(handler)
 
 
@@ -141,6 +182,9 @@ class ElementDispatcher(object):
         # handler: [(element, property), ..]
         self._reverse = dict()
 
+        # A gaphor.misc.eventprofile.HandlerProfile, while profiling
+        self._profile = None
+
     def init(self, app):
         self.component_registry.register_handler(self.on_model_loaded)
         self.component_registry.register_handler(self.on_element_change_event)
@@ -149,6 +193,16 @@ class ElementDispatcher(object):
         self.component_registry.unregister_handler(self.on_element_change_event)
         self.component_registry.unregister_handler(self.on_model_loaded)
 
+    def start_profiling(self, profile):
+        """
+        Record the calls of handlers in ``profile``, a
+        gaphor.misc.eventprofile.HandlerProfile.
+        """
+        self._profile = profile
+
+    def stop_profiling(self):
+        self._profile = None
+
     def _path_to_properties(self, element, path):
         """
         Given a start element and a path, return a tuple of UML properties
@@ -171,21 +225,7 @@ class ElementDispatcher(object):
         ['<association guard: Constraint[0..1]>',
          "<attribute specification: <type 'str'>[0..1] = None>"]
         """
-        c = type(element)
-        tpath = []
-        for attr in path.split('.'):
-            cname = ''
-            if '<' in attr:
-                assert attr.endswith('>'), '"%s" should end with ">"' % attr
-                attr, cname = attr[:-1].split('<')
-            prop = getattr(c, attr)
-            tpath.append(prop)
-            if cname:
-                c = getattr(uml2, cname)
-                assert issubclass(c, prop.type), '%s should be a subclass of %s' % (c, prop.type)
-            else:
-                c = prop.type
-        return tuple(tpath)
+        return compile_path(type(element), path)
 
     def _add_handlers(self, element, props, handler):
         """
@@ -258,13 +298,15 @@ class ElementDispatcher(object):
             del self._handlers[key]
 
     def register_handler(self, handler, element, path):
-
-        # self.logger.info('Registering handler')
-        # self.logger.debug('Handler is %s' % handler)
-        # self.logger.debug('Element is %s' % element)
-        # self.logger.debug('Path is %s' % path)
-
-        props = self._path_to_properties(element, path)
+        """
+        Register a handler for changes along ``path``, starting at
+        ``element``. The path can also be given as a tuple of properties,
+        as returned by compile_path().
+        """
+        if isinstance(path, tuple):
+            props = path
+        else:
+            props = compile_path(type(element), path)
         self._add_handlers(element, props, handler)
 
     def unregister_handler(self, handler):
@@ -309,9 +351,15 @@ class ElementDispatcher(object):
             #    log.debug('    old value: %s' % (event.old_value))
             # if hasattr(event, 'new_value'):
             #    log.debug('    new value: %s' % (event.new_value))
+            profile = self._profile
+            if profile is not None:
+                profile.dispatched('element_dispatcher', event, len(handlers))
             for handler in six.iterkeys(handlers):
                 try:
-                    handler(event)
+                    if profile is None:
+                        handler(event)
+                    else:
+                        profile.call(handler, event)
                 except Exception as e:
                     self.logger.error("Problem executing handler {0}, {1}".format(handler, e))
 
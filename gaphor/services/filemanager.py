@@ -23,16 +23,18 @@ The file service is responsible for loading and saving the user data.
 """
 
 from __future__ import absolute_import
+import os.path
 from logging import getLogger
 
 import gtk
 from zope import interface, component
 
 from gaphor.interfaces import IService, IActionProvider, IServiceEvent
-from gaphor.core import _, inject, action, build_action_group
-from gaphor.storage import storage, verify
+from gaphor.core import _, inject, action, build_action_group, Application
+from gaphor.storage import storage, snapshot, verify, journal, index, compress
 from gaphor.UML import uml2
-from gaphor.misc.gidlethread import GIdleThread, Queue, QueueEmpty
+from gaphor.UML.interfaces import IFlushFactoryEvent
+from gaphor.misc.gidlethread import GIdleThread, WorkerThread, Queue, QueueEmpty
 from gaphor.misc.errorhandler import error_handler
 from gaphor.misc.xmlwriter import XMLWriter
 from gaphor.ui.statuswindow import StatusWindow
@@ -41,8 +43,13 @@ from gaphor.ui.filedialog import FileDialog
 from six.moves import range
 
 DEFAULT_EXT = '.gaphor'
+COMPRESSED_EXTS = tuple(DEFAULT_EXT + ext for ext in compress.COMPRESSED_EXTS)
 MAX_RECENT = 10
 
+# The model file is saved as a whole (compacted) once the journal
+# exceeds this fraction of the size of the model file.
+JOURNAL_COMPACT_RATIO = 0.5
+
 class FileManagerStateChanged(object):
     """
     Event class used to send state changes on the ndo Manager.
@@ -109,6 +116,10 @@ class FileManager(object):
         """File manager constructor.  There is no current filename yet."""
 
         self._filename = None
+        self._journaled = None
+        self._changes = None
+        self._save_worker = None
+        self._flushed = False
 
     def init(self, app):
         """File manager service initialization.  The app parameter
@@ -131,10 +142,28 @@ class FileManager(object):
             
         self.update_recent_files()
 
+        self._changes = journal.ChangeTracker(self.element_factory)
+        self._changes.register(self.component_registry)
+        self.component_registry.register_handler(self._model_flushed)
+
     def shutdown(self):
         """Called when shutting down the file manager service."""
 
         self.logger.info('Shutting down')
+
+        if self._save_worker:
+            self._save_worker.wait()
+
+        if self._changes:
+            self._changes.unregister(self.component_registry)
+            self._changes = None
+            self.component_registry.unregister_handler(self._model_flushed)
+
+    @component.adapter(IFlushFactoryEvent)
+    def _model_flushed(self, event):
+        """The model has been flushed, e.g. by a model being loaded.
+        """
+        self._flushed = True
         
     def get_filename(self):
         """Return the current file name.  This method is used by the filename
@@ -178,6 +207,17 @@ class FileManager(object):
         
     recent_files = property(get_recent_files, set_recent_files)
 
+    def get_model_index(self):
+        """Returns True if an element index should be written next to
+        saved model files (the model-index property)."""
+
+        try:
+            return self.properties.get('model-index', False)
+        except component.interfaces.ComponentLookupError:
+            return False
+
+    model_index = property(get_model_index)
+
     def update_recent_files(self, new_filename=None):
         """Updates the list of recent files.  If the new_filename
         parameter is supplied, it is added to the list of recent files.
@@ -225,7 +265,8 @@ class FileManager(object):
         """Load the Gaphor model from the supplied file name.  A status window
         displays the loading progress.  The load generator updates the progress
         queue.  The loader is passed to a GIdleThread which executes the load
-        generator.  If loading is successful, the filename is set."""
+        generator.  If loading is successful, the filename is set.  If the
+        model file has a journal, later saves append to that journal."""
 
         self.logger.info('Loading file')
         self.logger.debug('Path is %s' % filename)
@@ -242,7 +283,10 @@ class FileManager(object):
             status_window = None
 
         try:
-            loader = storage.load_generator(filename.encode('utf-8'), self.element_factory)
+            journaled = journal.exists(filename.encode('utf-8'))
+            self._journaled = None
+            self._flushed = False
+            loader = storage.load_generator(filename.encode('utf-8'), self.element_factory, lazy=True)
             worker = GIdleThread(loader, queue)
 
             worker.start()
@@ -252,7 +296,14 @@ class FileManager(object):
                 worker.reraise()
 
             self.filename = filename
+            if journaled:
+                self._journaled = filename
         except:
+            if self._flushed:
+                # The model that was open is gone, it should not be saved
+                # to (or as) its file
+                self.filename = None
+                self._journaled = None
             error_handler(message=_('Error while loading model from file %s') % filename)
             raise
         finally:
@@ -287,12 +338,13 @@ class FileManager(object):
     def verify_filename(self, filename):
         """Verify that the supplied filename is using the proper default
         extension.  If not, the extension is added to the filename
-        and returned."""
+        and returned.  Snapshot and compressed file names are left as
+        they are."""
         
         self.logger.debug('Verifying file name')
         self.logger.debug('File name is %s' % filename)
         
-        if not filename.endswith(DEFAULT_EXT):
+        if not filename.endswith(COMPRESSED_EXTS + (DEFAULT_EXT, snapshot.SNAPSHOT_EXT)):
             filename = filename + DEFAULT_EXT
             
         return filename
@@ -301,8 +353,19 @@ class FileManager(object):
         """Save the current UML model to the specified file name.  Before
         writing the model file, this will verify that there are no orphan
         references.  It will also verify that the filename has the correct
-        extension.  A status window is displayed while the GIdleThread
-        is executed.  This thread actually saves the model."""
+        extension.  A status window is displayed while the model is saved.
+        Files with the snapshot extension are saved in the binary snapshot
+        format by a GIdleThread.  For XML model files a snapshot of the model
+        is taken by a GIdleThread first (see storage.freeze_generator()),
+        which is saved by a WorkerThread, so the model can be edited while
+        the file is written.  Files with a .gz or .xz
+        extension are compressed.  If the model_index property is set, an
+        element index is written next to uncompressed XML model files.
+
+        Once a model has been saved, the next saves to the same file only
+        append the changes to the journal of the model file, until the
+        journal has grown too large.  Then the whole model is saved and
+        the journal removed."""
         
         self.logger.info('Saving file')
         self.logger.debug('File name is %s' % filename)
@@ -310,33 +373,97 @@ class FileManager(object):
         if not filename or not len(filename):
             return
 
+        if self._save_worker and self._save_worker.is_alive():
+            self.logger.warning('Model is being saved already')
+            return
+
         self.verify_orphans()
         filename = self.verify_filename(filename)
 
+        if self.can_save_journal(filename):
+            try:
+                self.save_journal(filename)
+            except:
+                error_handler(message=_('Error while saving model to file %s') % filename)
+                raise
+            return
+
+        binary = filename.endswith(snapshot.SNAPSHOT_EXT)
+        compressed = compress.compression(filename)
+        entries = [] if self.model_index and not (binary or compressed) else None
+
         main_window = self.main_window
         queue = Queue()
         status_window = StatusWindow(_('Saving...'),\
                                      _('Saving model to %s') % filename,\
                                      parent=main_window.window,\
                                      queue=queue)
+        self.action_group.set_sensitive(False)
         try:
-            with open(filename.encode('utf-8'), 'w') as out:
-                saver = storage.save_generator(XMLWriter(out), self.element_factory)
-                worker = GIdleThread(saver, queue)
+            # Changes made from now on are saved by the next save
+            self._journaled = None
+            if not binary:
+                # The model can not be edited while the snapshot is taken
+                frozen = storage.FrozenModel()
+                freezer = GIdleThread(storage.freeze_generator(self.element_factory, frozen), queue)
+                freezer.start()
+                freezer.wait()
+                if freezer.error:
+                    freezer.reraise()
+                status_window.window.set_modal(False)
+            self._changes.reset()
+
+            with compress.open_file(filename.encode('utf-8'), 'wb') as out:
+                if binary:
+                    saver = snapshot.save_generator(out, self.element_factory)
+                    worker = GIdleThread(saver, queue)
+                else:
+                    saver = storage.save_frozen_generator(XMLWriter(out, buffered=True), frozen, entries)
+                    worker = WorkerThread(saver, queue)
+                self._save_worker = worker
                 worker.start()
                 worker.wait()
             
             if worker.error:
                 worker.reraise()
-                
-            
+
+            if entries is not None:
+                index.save(filename.encode('utf-8'), entries, Application.distribution.version)
+            else:
+                index.remove(filename.encode('utf-8'))
+            journal.remove(filename.encode('utf-8'))
+            self._journaled = filename
             self.filename = filename
         except:
             error_handler(message=_('Error while saving model to file %s') % filename)
             raise
         finally:
+            self._save_worker = None
+            self.action_group.set_sensitive(True)
             status_window.destroy()
 
+    def can_save_journal(self, filename):
+        """Return True if saving to the supplied file name can be done by
+        appending the changes to the journal.  That is possible if the file
+        has been loaded with its journal or has been saved before, and the
+        journal is not too large compared to the model file."""
+
+        path = filename.encode('utf-8')
+        if filename != self._journaled or not os.path.exists(path):
+            return False
+        return journal.size(path) < os.path.getsize(path) * JOURNAL_COMPACT_RATIO
+
+    def save_journal(self, filename):
+        """Append the elements that have changed since the last save to the
+        journal of the supplied model file."""
+
+        self.logger.info('Saving changes to journal')
+
+        elements, deleted = self._changes.changes()
+        if elements or deleted:
+            journal.append(filename.encode('utf-8'), elements, deleted)
+        self._changes.reset()
+
     def _open_dialog(self, title):
         """Open a file chooser dialog to select a model
         file to open."""
@@ -352,6 +479,9 @@ class FileManager(object):
         filter = gtk.FileFilter()
         filter.set_name("Gaphor models")
         filter.add_pattern("*.gaphor")
+        filter.add_pattern("*.gaphorb")
+        filter.add_pattern("*.gaphor.gz")
+        filter.add_pattern("*.gaphor.xz")
         filesel.add_filter(filter)
 
         filter = gtk.FileFilter()
@@ -397,6 +527,7 @@ class FileManager(object):
         diagram.package = model
         diagram.name= _('main')
         self.filename = None
+        self._journaled = None
         element_factory.notify_model()
 
         #main_window.select_element(diagram)
@@ -409,6 +540,9 @@ class FileManager(object):
         """This menu action opens the new model from template dialog."""
 
         filters = [{'name':_('Gaphor Models'), 'pattern':'*.gaphor'},\
+                   {'name':_('Gaphor Snapshots'), 'pattern':'*.gaphorb'},\
+                   {'name':_('Gzip Compressed Gaphor Models'), 'pattern':'*.gaphor.gz'},\
+                   {'name':_('Xz Compressed Gaphor Models'), 'pattern':'*.gaphor.xz'},\
                    {'name':_('All Files'), 'pattern':'*'}]
 
         file_dialog = FileDialog(_('New Gaphor Model From Template'),\
@@ -423,6 +557,7 @@ class FileManager(object):
         if filename:
             self.load(filename)
             self.filename = None
+            self._journaled = None
             self.component_registry.handle(FileManagerStateChanged(self))
 
 
@@ -431,6 +566,9 @@ class FileManager(object):
         """This menu action opens the standard model open dialog."""
 
         filters = [{'name':_('Gaphor Models'), 'pattern':'*.gaphor'},\
+                   {'name':_('Gaphor Snapshots'), 'pattern':'*.gaphorb'},\
+                   {'name':_('Gzip Compressed Gaphor Models'), 'pattern':'*.gaphor.gz'},\
+                   {'name':_('Xz Compressed Gaphor Models'), 'pattern':'*.gaphor.xz'},\
                    {'name':_('All Files'), 'pattern':'*'}]
 
         file_dialog = FileDialog(_('Open Gaphor Model'),\
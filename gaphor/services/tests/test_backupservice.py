@@ -22,79 +22,112 @@ Test the backup service.
 """
 
 from __future__ import absolute_import
-from StringIO import StringIO
-from gaphor.storage import storage
-from gaphor.application import Application
+import os
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+from gaphor.tests.testcase import TestCase
+from gaphor.UML import uml2
+from gaphor.storage import storage, journal
+from gaphor.misc.gidlethread import GIdleThread
 from gaphor.misc.xmlwriter import XMLWriter
-from six.moves import map
+from gaphor.diagram import items
 
-#class BackupServiceTestCase(unittest.TestCase):
-class BackupServiceTestCase:
 
-    services = ['element_factory', 'backup_service']
+class BackupServiceTestCase(TestCase):
+
+    services = TestCase.services + ['backup_service']
 
     def setUp(self):
-        Application.init(services=self.services)
-        self.element_factory = Application.get_service('element_factory')
-        self.backup_service = Application.get_service('backup_service')
+        super(BackupServiceTestCase, self).setUp()
+        self.backup_service = self.get_service('backup_service')
+        self.backup_service.datadir = tempfile.mkdtemp()
 
     def tearDown(self):
-        Application.shutdown()
-        
-    def save_and_load(self, filename):
-        factory = self.element_factory
-
-        f = open(filename, 'r')
-        storage.load(f, factory=self.element_factory)
-        f.close()
-        
-        self.backup_service.backup()
-        
-        elements = list(map(factory.lookup, list(factory.keys())))
+        datadir = self.backup_service.datadir
+        super(BackupServiceTestCase, self).tearDown()
+        shutil.rmtree(datadir)
 
-        orig = StringIO()
-        storage.save(XMLWriter(orig), factory=self.element_factory)
+    def save_xml(self):
+        f = StringIO()
+        storage.save(XMLWriter(f), factory=self.element_factory)
+        return f.getvalue()
 
-        self.backup_service.restore()
+    def test_backup_and_restore(self):
+        klass = self.create(items.ClassItem, uml2.Class)
+        klass.subject.name = 'Class'
+        filename = self.backup_service.filename
 
-        restored = list(map(factory.lookup, list(factory.keys())))
+        self.backup_service.backup()
+        self.backup_service.wait()
+        assert os.path.exists(filename)
+        assert not journal.exists(filename)
 
-        assert len(elements) == len(restored)
-        assert elements != restored
+        # Changes are appended to the journal of the backup
+        klass.subject.name = 'Renamed'
+        self.create(items.CommentItem, uml2.Comment)
+        self.backup_service.backup()
+        assert journal.exists(filename)
 
-        copy = StringIO()
-        storage.save(XMLWriter(copy), factory=self.element_factory)
+        data = self.save_xml()
+        self.element_factory.flush()
+        self.backup_service.restore(filename)
+        self.assertEquals(data, self.save_xml())
 
-        orig = orig.getvalue()
-        copy = copy.getvalue()
-        assert len(orig) == len(copy)
-        #assert orig == copy, orig + ' != ' + copy
+    def test_edit_while_backing_up(self):
+        """Changes made while the snapshot is taken are in the backup.
+        """
+        klass = self.create(items.ClassItem, uml2.Class)
+        klass.subject.name = 'Class'
+        filename = self.backup_service.filename
 
+        self.backup_service.backup()
+        klass.subject.name = 'Renamed'
+        self.create(items.CommentItem, uml2.Comment)
+        self.backup_service.wait()
 
-    def test_simple(self):
-        self.save_and_load('test-diagrams/simple-items.gaphor')
+        data = self.save_xml()
+        self.element_factory.flush()
+        self.backup_service.restore(filename)
+        self.assertEquals(data, self.save_xml())
 
+    def test_flush_while_writing(self):
+        """A backup of a model that has been replaced is discarded.
+        """
+        self.create(items.ClassItem, uml2.Class)
+        filename = self.backup_service.filename
 
-    def test_namespace(self):
-        self.save_and_load('test-diagrams/namespace.gaphor')
+        self.backup_service.backup()
+        # Take the snapshot, so the backup file is being written
+        while isinstance(self.backup_service._worker, GIdleThread):
+            self.backup_service._worker.wait()
+        self.element_factory.flush()
+        self.backup_service.wait()
 
-    def test_association(self):
-        self.save_and_load('test-diagrams/association.gaphor')
+        assert not os.path.exists(filename)
+        assert not os.path.exists(filename + '.tmp')
 
-    def test_interactions(self):
-        self.save_and_load('test-diagrams/interactions.gaphor')
+    def test_left_behind(self):
+        datadir = self.backup_service.datadir
+        self.backup_service.backup()
+        self.backup_service.wait()
 
-    def test_bicycle(self):
-        self.save_and_load('test-diagrams/bicycle.gaphor')
+        # Process id's are at most 2**22 on Linux
+        left = os.path.join(datadir, 'autosave-%d.gaphor' % 2 ** 23)
+        with open(left, 'w') as f:
+            f.write(open(self.backup_service.filename).read())
 
-    def test_line_align(self):
-        self.save_and_load('test-diagrams/line-align.gaphor')
+        self.assertEquals([left], self.backup_service.left_behind())
 
-#    def test_gaphas_canvas(self):
-#        self.save_and_load('../gaphas/gaphor-canvas.gaphor')
+    def test_shutdown_removes_backup(self):
+        filename = self.backup_service.filename
+        self.backup_service.backup()
+        self.backup_service.wait()
+        assert os.path.exists(filename)
 
-    def test_stereotype(self):
-        self.save_and_load('test-diagrams/stereotype.gaphor')
+        self.backup_service.shutdown()
+        assert not os.path.exists(filename)
 
 
 # vim: sw=4:et:ai
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import unittest
+
+from zope import component
+
+from gaphor.interfaces import IService
+from gaphor.misc.eventprofile import HandlerProfile
+from gaphor.UML import uml2
+from gaphor.UML.elementfactory import ElementChangedEventBlocker
+from gaphor.UML.event import AttributeChangeEvent, AssociationSetEvent
+from gaphor.UML.interfaces import IAttributeChangeEvent, IElementChangeEvent
+from gaphor.services.componentregistry import ZopeComponentRegistry
+
+# ZopeComponentRegistry.init() replaces these zope.component functions
+PATCHED = ('handle', 'queryMultiAdapter', 'getAdapters', 'queryUtility')
+
+
+class ComponentRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict((name, getattr(component, name)) for name in PATCHED)
+        self.registry = ZopeComponentRegistry()
+        self.registry.init(None)
+        self.events = []
+
+    def tearDown(self):
+        self.registry.shutdown()
+        for name, func in self.saved.items():
+            setattr(component, name, func)
+
+    def event(self):
+        return AttributeChangeEvent(uml2.Class(), uml2.Class.name, None, 'A')
+
+    def test_handle(self):
+        @component.adapter(IAttributeChangeEvent)
+        def attribute_changed(event):
+            self.events.append(('attribute', event))
+
+        @component.adapter(IElementChangeEvent)
+        def element_changed(event):
+            self.events.append(('element', event))
+
+        self.registry.register_handler(attribute_changed)
+        self.registry.register_handler(element_changed)
+        event = self.event()
+        self.registry.handle(event)
+
+        self.assertEquals([('attribute', event), ('element', event)], sorted(self.events))
+        # Handlers are not called for events they are not registered for.
+        # The derived unions send events of their own, those are ignored.
+        event = AssociationSetEvent(uml2.Class(), uml2.Class.package, None, None)
+        self.registry.handle(event)
+        self.assertEquals([('element', event)], [e for e in self.events if e[1] is event])
+
+    def test_dispatch_table(self):
+        """
+        The handlers are looked up once per kind of event, until a handler
+        is registered or unregistered.
+        """
+        @component.adapter(IAttributeChangeEvent)
+        def handler(event):
+            self.events.append(event)
+
+        event = self.event()
+        assert handler not in self.registry.handlers(event)
+        self.registry.register_handler(handler)
+        handlers = self.registry.handlers(event)
+        assert handler in handlers
+        assert self.registry.handlers(self.event()) is handlers
+
+        self.registry.unregister_handler(handler)
+        self.registry.handle(event)
+        self.assertEquals([], self.events)
+
+    def test_global_handlers(self):
+        """
+        Handlers registered in the global registry are dispatched too.
+        """
+        @component.adapter(IAttributeChangeEvent)
+        def handler(event):
+            self.events.append(event)
+
+        event = self.event()
+        self.registry.handle(event)
+        component.provideHandler(handler)
+        try:
+            self.registry.handle(event)
+        finally:
+            component.getGlobalSiteManager().unregisterHandler(handler)
+        self.registry.handle(event)
+        self.assertEquals([event], self.events)
+
+    def test_filter(self):
+        """
+        Events are not handled while they are blocked by an event filter.
+        """
+        @component.adapter(IAttributeChangeEvent)
+        def handler(event):
+            self.events.append(event)
+
+        self.registry.register_handler(handler)
+        event = self.event()
+        self.assertEquals((), self.registry.filters(event))
+
+        self.registry.register_subscription_adapter(ElementChangedEventBlocker)
+        self.assertEquals((ElementChangedEventBlocker,), self.registry.filters(event))
+        self.registry.handle(event)
+        self.assertEquals([], self.events)
+
+        self.registry.unregister_subscription_adapter(ElementChangedEventBlocker)
+        self.assertEquals((), self.registry.filters(event))
+        self.registry.handle(event)
+        self.assertEquals([event], self.events)
+
+    def test_nested_block(self):
+        """
+        Events stay blocked until the outermost block is undone.
+        """
+        event = self.event()
+        ElementChangedEventBlocker.block(self.registry)
+        ElementChangedEventBlocker.block(self.registry)
+        ElementChangedEventBlocker.unblock(self.registry)
+        self.assertEquals((ElementChangedEventBlocker,), self.registry.filters(event))
+
+        ElementChangedEventBlocker.unblock(self.registry)
+        self.assertEquals((), self.registry.filters(event))
+
+    def test_get_service(self):
+        """
+        Services are cached, but can still be replaced.
+        """
+        first, second = object(), object()
+        self.registry.register_utility(first, IService, 'test_service')
+        assert self.registry.get_service('test_service') is first
+        assert self.registry.get_service('test_service') is first
+
+        self.registry.unregister_utility(first, IService, 'test_service')
+        self.assertRaises(component.ComponentLookupError,
+                          self.registry.get_service, 'test_service')
+
+        self.registry.register_utility(second, IService, 'test_service')
+        assert self.registry.get_service('test_service') is second
+
+    def test_profiling(self):
+        @component.adapter(IAttributeChangeEvent)
+        def handler(event):
+            self.events.append(event)
+
+        self.registry.register_handler(handler)
+        profile = HandlerProfile()
+        self.registry.start_profiling(profile)
+        self.registry.handle(self.event())
+        self.registry.stop_profiling()
+        self.registry.handle(self.event())
+
+        self.assertEquals(2, len(self.events))
+        stats = profile.stats()
+        self.assertEquals(1, stats['handlers'][__name__ + '.handler']['calls'])
+        self.assertEquals(1, stats['events']['component_registry']['AttributeChangeEvent']['events'])
+
+
+# vim:sw=4:et:ai
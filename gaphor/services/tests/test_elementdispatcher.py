@@ -22,7 +22,7 @@ from __future__ import print_function
 from gaphor.tests import TestCase
 from gaphor.UML import uml2
 from gaphor.application import Application
-from gaphor.services.elementdispatcher import ElementDispatcher
+from gaphor.services.elementdispatcher import ElementDispatcher, compile_path
 
 
 class ElementDispatcherTestCase(TestCase):
@@ -61,6 +61,29 @@ class ElementDispatcherTestCase(TestCase):
         self.assertEquals(3, len(dispatcher._handlers))
 
 
+    def test_compile_path(self):
+        """
+        Paths are compiled once per class and checked right away.
+        """
+        props = compile_path(uml2.Class, 'ownedOperation.parameter.name')
+        self.assertEquals((uml2.Class.ownedOperation, uml2.Operation.parameter,
+                           uml2.Parameter.name), props)
+        assert compile_path(uml2.Class, 'ownedOperation.parameter.name') is props
+        assert self.dispatcher._path_to_properties(uml2.Class(), 'ownedOperation.parameter.name') is props
+
+        self.assertEquals((uml2.Transition.guard, uml2.Constraint.specification),
+                          compile_path(uml2.Transition, 'guard<Constraint>.specification'))
+        self.assertRaises(AttributeError, compile_path, uml2.Class, 'ownedOperation.nonexistent')
+        self.assertRaises(ValueError, compile_path, uml2.Class, 'ownedOperation<Operation.name')
+        self.assertRaises(ValueError, compile_path, uml2.Class, 'ownedOperation<Class>.name')
+
+        # Compiled paths can be registered
+        element = uml2.Class()
+        self.dispatcher.register_handler(self._handler, element, props)
+        element.ownedOperation = uml2.Operation()
+        self.assertEquals(1, len(self.events))
+
+
     def test_register_handler_twice(self):
         """
         Multiple registrations have no effect.
@@ -403,6 +426,14 @@ class ElementDispatcherAsServiceTestCase(TestCase):
 
 
 
+    def test_watch_invalid_path(self):
+        """
+        Invalid paths are reported when they are watched.
+        """
+        watcher = EventWatcher(A(), self._handler)
+        self.assertRaises(AttributeError, watcher.watch, 'one.nonexistent')
+
+
     def test_cyclic(self):
         """
         Test cyclic dependency a -> b -> c -> a.
@@ -19,8 +19,12 @@
 # You should have received a copy of the GNU Library General Public
 # along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
+import os
+import tempfile
 import unittest
 from gaphor.application import Application
+from gaphor.services import filemanager
+from gaphor.UML import uml2
 from six.moves import range
 
 
@@ -56,3 +60,31 @@ class FileManagerTestCase(unittest.TestCase):
             assert a
             assert a.get_property('visible') == False
 
+    def test_load_truncated(self):
+        """
+        A file that fails to load leaves an empty model without a file
+        name, so the next save does not overwrite the previous file.
+        """
+        fileman = Application.get_service('file_manager')
+        element_factory = Application.get_service('element_factory')
+        element_factory.create(uml2.Class).name = 'A'
+
+        fd, filename = tempfile.mkstemp(suffix='.gaphor')
+        os.close(fd)
+        error_handler = filemanager.error_handler
+        filemanager.error_handler = lambda message=None, exc_info=None: None
+        try:
+            fileman.save(filename)
+            self.assertEquals(filename, fileman.filename)
+            with open(filename) as f:
+                data = f.read()
+            with open(filename, 'w') as f:
+                f.write(data[:len(data) / 2])
+
+            self.assertRaises(Exception, fileman.load, filename)
+            self.assertEquals([], element_factory.lselect())
+            self.assertEquals(None, fileman.filename)
+        finally:
+            filemanager.error_handler = error_handler
+            os.remove(filename)
+
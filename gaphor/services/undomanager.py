@@ -133,6 +133,7 @@ class UndoManager(object):
         self._redo_stack = []
         self._stack_depth = 20
         self._current_transaction = None
+        self._blocked = 0
         self.action_group = build_action_group(self)
 
     def init(self, app):
@@ -179,11 +180,24 @@ class UndoManager(object):
         assert not self._current_transaction
         self._current_transaction = ActionStack()
 
+    def block(self):
+        """
+        Do not record undo actions until unblock() is called, for changes
+        that should not be undone. Calls can be nested.
+        """
+        self._blocked += 1
+
+    def unblock(self):
+        """
+        Undo a block() call.
+        """
+        self._blocked -= 1
+
     def add_undo_action(self, action):
         """
         Add an action to undo. An action
         """
-        if self._current_transaction:
+        if self._current_transaction and not self._blocked:
             self._current_transaction.add(action)
             self.component_registry.handle(UndoManagerStateChanged(self))
 
@@ -350,7 +364,7 @@ class UndoManager(object):
 
         def _undo_create_event():
             try:
-                del factory._elements[element.id]
+                factory._remove_element(element)
             except KeyError:
                 pass  # Key was probably already removed in an unlink call
             self.component_registry.handle(ElementDeleteEvent(factory, element))
@@ -367,7 +381,7 @@ class UndoManager(object):
         assert factory, 'No factory defined for %s (%s)' % (element, factory)
 
         def _undo_delete_event():
-            factory._elements[element.id] = element
+            factory._add_element(element)
             self.component_registry.handle(ElementCreateEvent(factory, element))
 
         self.add_undo_action(_undo_delete_event)
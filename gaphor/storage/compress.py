@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compressed model files.
+
+Model files can be compressed with gzip (``model.gaphor.gz``) or xz
+(``model.gaphor.xz``). When a file is written, the compression is chosen by
+the file name extension. When a file is read, the compression is detected
+from the first bytes of the file, whatever its name.
+
+Compressed files are decompressed while they are read (see DecompressFile),
+so a model is never decompressed in memory as a whole. xz compression needs
+the lzma module (part of Python 3, backports.lzma for Python 2).
+"""
+
+from __future__ import absolute_import
+
+import gzip
+import zlib
+from cStringIO import InputType
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+__all__ = ['open_file', 'decompress', 'compression', 'is_compressed',
+           'DecompressFile', 'COMPRESSED_EXTS']
+
+GZIP_MAGIC = '\x1f\x8b'
+XZ_MAGIC = '\xfd7zXZ\x00'
+
+# File name extension -> compression
+COMPRESSED_EXTS = {'.gz': 'gzip', '.xz': 'xz'}
+
+GZIP_LEVEL = 6
+
+
+def _lzma():
+    if lzma is None:
+        raise IOError('xz compressed files need the lzma module')
+    return lzma
+
+
+def _decompressor(compression):
+    if compression == 'gzip':
+        # Accept the gzip header and trailer
+        return lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return _lzma().LZMADecompressor
+
+
+def compression(filename):
+    """
+    Return the compression ('gzip' or 'xz') a file with name ``filename``
+    should be written with, None if it should not be compressed.
+    """
+    for ext, kind in COMPRESSED_EXTS.items():
+        if filename.endswith(ext):
+            return kind
+    return None
+
+
+def is_compressed(file_obj):
+    """
+    Return the compression of open file ``file_obj``, detected from its
+    first bytes, or None. The file is read from its current position, which
+    is restored afterwards.
+    """
+    pos = file_obj.tell()
+    magic = file_obj.read(len(XZ_MAGIC))
+    file_obj.seek(pos)
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic == XZ_MAGIC:
+        return 'xz'
+    return None
+
+
+def decompress(file_obj):
+    """
+    Return a file object to read the contents of ``file_obj`` from: a
+    DecompressFile if it is compressed, ``file_obj`` itself otherwise.
+    """
+    kind = is_compressed(file_obj)
+    if kind:
+        return DecompressFile(file_obj, _decompressor(kind))
+    return file_obj
+
+
+def open_file(filename, mode='rb'):
+    """
+    Open model file ``filename``. Files opened for writing are compressed
+    according to their extension, files opened for reading are decompressed
+    if they are compressed.
+    """
+    if 'r' in mode:
+        return decompress(open(filename, 'rb'))
+    kind = compression(filename)
+    if kind == 'gzip':
+        return gzip.GzipFile(filename, 'wb', GZIP_LEVEL)
+    if kind == 'xz':
+        return _lzma().LZMAFile(filename, 'wb')
+    return open(filename, mode)
+
+
+class DecompressFile(object):
+    """
+    A read-only file that decompresses file ``raw`` while it is read.
+    Sizes and positions are in compressed bytes: read(size) reads ``size``
+    bytes from ``raw`` and returns what they decompress to, and tell() is
+    the position in ``raw``. Concatenated streams (as written by
+    ``cat a.gz b.gz``) are read as one.
+
+    The raw file is closed when the DecompressFile is closed.
+    """
+
+    def __init__(self, raw, decompressor):
+        self.raw = raw
+        self._new_decompressor = decompressor
+        self._decompressor = decompressor()
+
+    def size(self):
+        """Return the size of the compressed file.
+        """
+        if isinstance(self.raw, InputType):
+            return len(self.raw.getvalue())
+        pos = self.raw.tell()
+        self.raw.seek(0, 2)
+        size = self.raw.tell()
+        self.raw.seek(pos)
+        return size
+
+    def tell(self):
+        return self.raw.tell()
+
+    def read(self, size=-1):
+        """
+        Read at least ``size`` compressed bytes, until some data has been
+        decompressed or the end of the file is reached.
+        """
+        while True:
+            data = self.raw.read(size)
+            if not data:
+                flush = getattr(self._decompressor, 'flush', None)
+                return flush() if flush else ''
+            data = self._decompress(data)
+            if data:
+                return data
+
+    def _decompress(self, data):
+        out = []
+        while data:
+            if getattr(self._decompressor, 'eof', False):
+                self._decompressor = self._new_decompressor()
+            out.append(self._decompressor.decompress(data))
+            data = self._decompressor.unused_data
+            if data:
+                self._decompressor = self._new_decompressor()
+        return ''.join(out)
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Element index for XML model files.
+
+To load a model, the whole file is parsed and every element is created.
+Tools that need just a few elements can do with less: the index, a file
+next to the model file with INDEX_EXT appended to its name, tells where
+each element is in the model file. ModelIndex uses it to read single
+elements from the (memory mapped) model file.
+
+An index file looks like this (all integers are little endian):
+
+    magic       'GAPHORI\\0'
+    base        int64 size and double modification time of the model file
+    tables      gaphor version, types and ids, string tables as used in
+                gaphor.storage.snapshot
+    entries     for each id: uint32 type, uint64 start and end offset
+
+The index is written by save(), from the positions collected by
+gaphor.storage.storage.save_generator().
+"""
+
+from __future__ import absolute_import
+
+import mmap
+import os
+import struct
+from cStringIO import StringIO
+from xml.sax import make_parser, handler
+
+from gaphor.UML import uml2
+from gaphor.misc.odict import odict
+from gaphor.storage import parser, snapshot, storage, journal
+from gaphor.storage.parser import ParserException
+from gaphor.storage.snapshot import _string_table, _read_strings
+
+__all__ = ['save', 'remove', 'exists', 'ModelIndex', 'INDEX_EXT']
+
+INDEX_EXT = '.index'
+INDEX_MAGIC = 'GAPHORI\0'
+
+_header = struct.Struct('<8sqd')
+_entry = struct.Struct('<IQQ')
+
+
+def index_filename(filename):
+    """Return the name of the index file of model file ``filename``.
+    """
+    return filename + INDEX_EXT
+
+
+def exists(filename):
+    return os.path.exists(index_filename(filename))
+
+
+def remove(filename):
+    """Remove the index of ``filename``, if there is one.
+    """
+    if exists(filename):
+        os.remove(index_filename(filename))
+
+
+def save(filename, entries, gaphor_version):
+    """
+    Write the index of model file ``filename``. ``entries`` is the list of
+    (id, type, start, end) tuples collected while saving the model file.
+    """
+    types = {}
+    for id, type, start, end in entries:
+        types.setdefault(type, len(types))
+
+    ordered = [None] * len(types)
+    for type, i in types.items():
+        ordered[i] = type
+
+    with open(index_filename(filename), 'wb') as f:
+        f.write(_header.pack(INDEX_MAGIC, *journal.stamp(filename)))
+        f.write(_string_table([gaphor_version]))
+        f.write(_string_table(ordered))
+        f.write(_string_table([e[0] for e in entries]))
+        f.write(''.join(_entry.pack(types[type], start, end)
+                        for id, type, start, end in entries))
+
+
+class ModelIndex(object):
+    """
+    Random access to the elements of a model file, by means of its index.
+    Changes saved in the journal of the model file are taken into account.
+
+    >>> index = ModelIndex('model.gaphor')            # doctest: +SKIP
+    >>> classes = index.load(factory, index.select(uml2.Class))  # doctest: +SKIP
+    """
+
+    def __init__(self, filename):
+        with open(index_filename(filename), 'rb') as f:
+            data = f.read()
+
+        try:
+            magic, base_size, base_mtime = _header.unpack_from(data)
+        except struct.error:
+            magic = None
+        if magic != INDEX_MAGIC:
+            raise ParserException('File is not a Gaphor model index')
+        if (base_size, base_mtime) != journal.stamp(filename):
+            raise ParserException('The index of %s is out of date' % filename)
+
+        (self.gaphor_version,), pos = _read_strings(data, _header.size)
+        types, pos = _read_strings(data, pos)
+        ids, pos = _read_strings(data, pos)
+
+        self._entries = entries = odict()
+        unpack = _entry.unpack_from
+        for id in ids:
+            type, start, end = unpack(data, pos)
+            entries[id] = (types[type], start, end)
+            pos += _entry.size
+
+        # Elements changed since the model file was written: id -> (type,
+        # journal entry), None if the element has been deleted
+        self._changed = odict()
+        for entry in journal.entries(filename):
+            loader = snapshot.SnapshotLoader()
+            for x in snapshot.parse_generator(StringIO(entry), loader):
+                pass
+            for id in loader.deleted:
+                self._changed[id] = None
+            for id, elem in loader.elements.items():
+                if isinstance(elem, parser.element):
+                    self._changed[id] = (elem.type, entry)
+
+        with open(filename, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # The XML declaration and the <gaphor> start tag
+        if entries:
+            first = min(start for type, start, end in entries.values())
+            self._head = self._data[:self._data.find('<', first)]
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, id):
+        if id in self._changed:
+            return self._changed[id] is not None
+        return id in self._entries
+
+    def ids(self):
+        """Return the ids of all elements in the model, in file order.
+        """
+        changed = self._changed
+        ids = [id for id in self._entries if changed.get(id, True) is not None]
+        ids.extend(id for id, change in changed.items()
+                   if change is not None and id not in self._entries)
+        return ids
+
+    def type(self, id):
+        """Return the type name of element ``id``.
+        """
+        if id in self._changed:
+            change = self._changed[id]
+            if change is None:
+                raise KeyError(id)
+            return change[0]
+        return self._entries[id][0]
+
+    def select(self, type):
+        """Return the ids of the elements that are instances of ``type``,
+        a class from gaphor.UML.uml2.
+        """
+        kinds = {}
+
+        def kind(t):
+            try:
+                return kinds[t]
+            except KeyError:
+                k = kinds[t] = issubclass(getattr(uml2, t), type)
+                return k
+
+        return [id for id in self.ids() if kind(self.type(id))]
+
+    def element(self, id):
+        """Parse element ``id`` and return its parser.element.
+        """
+        if id in self._changed:
+            change = self._changed[id]
+            if change is None:
+                raise KeyError(id)
+            return snapshot.parse(StringIO(change[1]))[id]
+
+        type, start, end = self._entries[id]
+        data = self._data
+        loader = parser.GaphorLoader()
+        sax = make_parser()
+        sax.setFeature(handler.feature_namespaces, 1)
+        sax.setContentHandler(loader)
+        sax.feed(self._head)
+        sax.feed(data[data.find('<', start):end])
+        sax.feed('</gaphor>')
+        sax.close()
+        return loader.elements[id]
+
+    def load(self, factory, ids):
+        """
+        Create the elements ``ids`` in ``factory``, together with the
+        elements they own (through composite associations) and the elements
+        shown on diagrams. References to elements that are not loaded are
+        left out: most elements are linked to the rest of the model one way
+        or another. The created elements are returned.
+        """
+        def lookup(id):
+            return self.element(id) if id in self else None
+
+        elements = storage.element_closure(ids, lookup)
+        storage.restrict_references(elements)
+
+        for x in storage.load_elements_generator(elements, factory, self.gaphor_version):
+            pass
+        return [elements[id].element for id in ids if id in elements]
+
+
+# vim:sw=4:et:ai
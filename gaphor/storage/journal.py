@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Save journal for Gaphor models.
+
+Saving a model rewrites the whole file, even if just one element has
+changed. Instead, the changed elements can be appended to a journal: a
+file next to the model file, with JOURNAL_EXT appended to its name.
+When the model file is loaded, the journal is replayed on the elements
+read from the model file. Once the journal has grown large, the model
+should be saved as a whole again and the journal removed (compaction).
+
+A journal file looks like this (all integers are little endian):
+
+    magic       'GAPHORJ\\0'
+    base        int64 size and double modification time of the model file
+    entries     ...
+
+Each entry is an uint32 size, followed by a snapshot of that size (see
+gaphor.storage.snapshot.save_elements()), holding the elements that have
+changed and the ids of the elements deleted since the previous entry.
+The base record ties the journal to the model file it was written for;
+a journal for another version of the model file is ignored. So is an
+entry that has not been written completely.
+
+ChangeTracker collects the elements that should go in the next entry.
+"""
+
+from __future__ import absolute_import
+
+import os
+import struct
+from cStringIO import StringIO
+from logging import getLogger
+
+import gaphas
+from zope import component
+
+from gaphor.UML import uml2
+from gaphor.UML.interfaces import IElementChangeEvent, IElementCreateEvent, \
+        IElementDeleteEvent, IModelFactoryEvent, IFlushFactoryEvent
+from gaphor.storage import parser, snapshot
+
+__all__ = ['append', 'replay', 'read', 'entries', 'remove', 'exists', 'size',
+           'ChangeTracker', 'JOURNAL_EXT']
+
+JOURNAL_EXT = '.journal'
+JOURNAL_MAGIC = 'GAPHORJ\0'
+
+_header = struct.Struct('<8sqd')
+_size = struct.Struct('<I')
+
+logger = getLogger('journal')
+
+
+def journal_filename(filename):
+    """Return the name of the journal file of model file ``filename``.
+    """
+    return filename + JOURNAL_EXT
+
+
+def exists(filename):
+    return os.path.exists(journal_filename(filename))
+
+
+def size(filename):
+    """Return the size of the journal of ``filename``, 0 if there is none.
+    """
+    try:
+        return os.path.getsize(journal_filename(filename))
+    except OSError:
+        return 0
+
+
+def remove(filename):
+    """Remove the journal of ``filename``, if there is one.
+    """
+    if exists(filename):
+        os.remove(journal_filename(filename))
+
+
+def stamp(filename):
+    """Return the size and modification time of ``filename``. Files
+    that refer to a model file (journal, index) store this to find out
+    whether the model file has changed since.
+    """
+    st = os.stat(filename)
+    return st.st_size, st.st_mtime
+
+
+def append(filename, elements, deleted=()):
+    """
+    Append an entry with ``elements`` and the ids in ``deleted`` to the
+    journal of model file ``filename``. The journal is created if needed.
+    """
+    out = StringIO()
+    snapshot.save_elements(out, elements, deleted)
+    data = out.getvalue()
+
+    path = journal_filename(filename)
+    create = not os.path.exists(path)
+    with open(path, 'ab') as f:
+        if create:
+            f.write(_header.pack(JOURNAL_MAGIC, *stamp(filename)))
+        f.write(_size.pack(len(data)))
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def entries(filename):
+    """
+    Return the entries in the journal of model file ``filename``, each a
+    string holding a snapshot.
+    """
+    try:
+        with open(journal_filename(filename), 'rb') as f:
+            data = f.read()
+    except IOError:
+        return []
+
+    try:
+        magic, base_size, base_mtime = _header.unpack_from(data)
+    except struct.error:
+        magic = None
+    if magic != JOURNAL_MAGIC:
+        logger.warning('Ignoring journal of %s: not a journal file' % filename)
+        return []
+    if (base_size, base_mtime) != stamp(filename):
+        logger.warning('Ignoring journal of %s: the model file has changed' % filename)
+        return []
+
+    entries = []
+    pos = _header.size
+    while pos + _size.size <= len(data):
+        n, = _size.unpack_from(data, pos)
+        pos += _size.size
+        if pos + n > len(data):
+            break
+        entries.append(data[pos:pos + n])
+        pos += n
+
+    if pos != len(data):
+        logger.warning('Ignoring incomplete entry in journal of %s' % filename)
+    return entries
+
+
+def read(filename):
+    """
+    Read the journal of model file ``filename``. A list of
+    snapshot.SnapshotLoader instances is returned, one per entry.
+    """
+    loaders = []
+    for data in entries(filename):
+        loader = snapshot.SnapshotLoader()
+        for x in snapshot.parse_generator(StringIO(data), loader):
+            pass
+        loaders.append(loader)
+    return loaders
+
+
+def _discard_canvasitems(elements, elem):
+    def discard(canvasitems):
+        for item in canvasitems:
+            elements.pop(item.id, None)
+            discard(item.canvasitems)
+
+    if isinstance(elem, parser.element) and elem.canvas:
+        discard(elem.canvas.canvasitems)
+
+
+def replay(filename, elements):
+    """
+    Apply the journal of model file ``filename`` to ``elements``, the
+    map id: element/canvasitem read from the model file. Changed
+    elements keep their place. The number of entries applied is returned.
+    """
+    entries = read(filename)
+    for loader in entries:
+        for id in loader.deleted:
+            _discard_canvasitems(elements, elements.get(id))
+            elements.pop(id, None)
+        for id, elem in loader.elements.items():
+            _discard_canvasitems(elements, elements.get(id))
+            elements[id] = elem
+    return len(entries)
+
+
+class ChangeTracker(object):
+    """
+    Keep track of the elements that changed since the model was loaded or
+    last saved. Canvas items are not tracked, they are saved as part of
+    their diagram: a diagram is changed if one of its items has changed or
+    if its canvas is modified.
+
+    Several trackers can be registered at the same time (e.g. by the file
+    manager and the backup service). The modified flag of a canvas is
+    shared, so modified diagrams are handed to all registered trackers
+    before the flag is cleared.
+    """
+
+    # The registered trackers
+    _trackers = []
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._changed = set()
+        self._deleted = set()
+
+    def register(self, component_registry):
+        ChangeTracker._trackers.append(self)
+        component_registry.register_handler(self._element_changed)
+        component_registry.register_handler(self._element_created)
+        component_registry.register_handler(self._element_deleted)
+        component_registry.register_handler(self._model_loaded)
+        component_registry.register_handler(self._model_flushed)
+
+    def unregister(self, component_registry):
+        if self in ChangeTracker._trackers:
+            ChangeTracker._trackers.remove(self)
+        component_registry.unregister_handler(self._element_changed)
+        component_registry.unregister_handler(self._element_created)
+        component_registry.unregister_handler(self._element_deleted)
+        component_registry.unregister_handler(self._model_loaded)
+        component_registry.unregister_handler(self._model_flushed)
+
+    def _mark(self, element):
+        if isinstance(element, gaphas.Item):
+            element = getattr(element.canvas, 'diagram', None)
+            if element is None:
+                return
+        self._changed.add(element)
+
+    @component.adapter(IElementChangeEvent)
+    def _element_changed(self, event):
+        self._mark(event.element)
+
+    @component.adapter(IElementCreateEvent)
+    def _element_created(self, event):
+        self._mark(event.element)
+
+    @component.adapter(IElementDeleteEvent)
+    def _element_deleted(self, event):
+        element = event.element
+        if isinstance(element, gaphas.Item):
+            self._mark(element)
+        elif element.id:
+            self._changed.discard(element)
+            self._deleted.add(element.id)
+
+    @component.adapter(IModelFactoryEvent)
+    def _model_loaded(self, event):
+        self.reset()
+
+    @component.adapter(IFlushFactoryEvent)
+    def _model_flushed(self, event):
+        self.reset()
+
+    def changes(self):
+        """
+        Return the elements that have changed and the ids of the elements
+        that have been deleted since the last reset(). Elements are
+        returned in factory order.
+        """
+        self._collect_modified()
+        lookup = self.factory.lookup
+        changed = set(e for e in self._changed if lookup(e.id) is e)
+        elements = [e for e in self.factory.values() if e in changed]
+        deleted = sorted(id for id in self._deleted if lookup(id) is None)
+        return elements, deleted
+
+    def reset(self):
+        """
+        Forget about the changes, for instance because they have been saved.
+        """
+        self._collect_modified()
+        self._changed.clear()
+        self._deleted.clear()
+
+    def _collect_modified(self):
+        """
+        Mark the diagrams with a modified canvas as changed, in this and
+        the other registered trackers, and clear their modified flag.
+        """
+        trackers = [t for t in ChangeTracker._trackers if t.factory is self.factory]
+        if self not in trackers:
+            trackers.append(self)
+        for d in self.factory.select_type(uml2.Diagram):
+            if not d.canvas_deferred and d.canvas.modified:
+                for tracker in trackers:
+                    tracker._changed.add(d)
+                d.canvas.modified = False
+
+
+# vim:sw=4:et:ai
@@ -49,6 +49,9 @@ class name in the gaphor.diagram module.
 
 The generator parse_generator(filename, loader) may be used if the loading
 takes a long time. The yielded values are the percentage of the file read.
+In between, GaphorLoader.pop_completed() can be used to fetch the elements
+that have been parsed completely so far, so they can be handed over (e.g. to
+an element factory) while the rest of the file is still being read.
 """
 
 from __future__ import absolute_import
@@ -61,6 +64,7 @@ from xml.sax import handler
 from cStringIO import InputType
 
 from gaphor.misc.odict import odict
+from gaphor.storage import compress
 
 class base(object):
     """Simple base class for element, canvas and canvasitem.
@@ -106,6 +110,8 @@ class canvasitem(base):
         self.id = id
         self.type = type
         self.canvasitems = []
+        # The names of the values and references, in file order
+        self.names = []
 
 
 XMLNS='http://gaphor.sourceforge.net/model'
@@ -171,14 +177,24 @@ class GaphorLoader(handler.ContentHandler):
         self.gaphor_version = None
         self.elements = odict() # map id: element/canvasitem
         self.__stack = []
-        self.text = ''
+        self.__text = []
+        self.__completed = []
 
     def endDocument(self):
         if len(self.__stack) != 0:
             raise ParserException('Invalid XML document.')
 
+    def pop_completed(self):
+        """Return a list of elements (not canvas items) that have been
+        parsed completely since the last call. For a Diagram this includes
+        its canvas and canvas items.
+        """
+        completed = self.__completed
+        self.__completed = []
+        return completed
+
     def startElement(self, name, attrs):
-        self.text = ''
+        self.__text = []
         
         state = self.state()
 
@@ -186,7 +202,7 @@ class GaphorLoader(handler.ContentHandler):
         if state == GAPHOR:
             id = attrs['id']
             e = element(id, name)
-            assert id not in list(self.elements.keys()), '%s already defined' % (id)#, self.elements[id])
+            assert id not in self.elements, '%s already defined' % (id)#, self.elements[id])
             self.elements[id] = e
             self.push(e, name == 'Diagram' and DIAGRAM or ELEMENT)
 
@@ -200,7 +216,7 @@ class GaphorLoader(handler.ContentHandler):
         elif state in (CANVAS, ITEM) and name == 'item':
             id = attrs['id']
             c = canvasitem(id, attrs['type'])
-            assert id not in list(self.elements.keys()), '%s already defined' % id
+            assert id not in self.elements, '%s already defined' % id
             self.elements[id] = c
             self.peek().canvasitems.append(c)
             self.push(c, ITEM)
@@ -209,6 +225,8 @@ class GaphorLoader(handler.ContentHandler):
         # to store the <ref>, <reflist> or <val> content:
         elif state in (ELEMENT, DIAGRAM, CANVAS, ITEM):
             # handle 'normal' attributes
+            if state == ITEM:
+                self.peek().names.append(name)
             self.push(name, ATTR)
 
         # Reference list:
@@ -251,12 +269,15 @@ class GaphorLoader(handler.ContentHandler):
             raise ParserException('Invalid XML: tag <%s> not known (state = %s)' % (name, state))
 
     def endElement(self, name):
+        state = self.state()
         # Put the text on the value
-        if self.state() == VAL:
+        if state == VAL:
             # Two levels up: the attribute name
             n = self.peek(2)
             # Three levels up: the element instance (element or canvasitem)
-            self.peek(3).values[n] = self.text
+            self.peek(3).values[n] = ''.join(self.__text)
+        elif state in (ELEMENT, DIAGRAM):
+            self.__completed.append(self.peek())
         self.pop()
 
     def startElementNS(self, name, qname, attrs):
@@ -272,7 +293,7 @@ class GaphorLoader(handler.ContentHandler):
 
     def characters(self, content):
         """Read characters."""
-        self.text = self.text + content
+        self.__text.append(content)
 
 
 def parse(filename):
@@ -315,7 +336,9 @@ class ProgressGenerator(object):
         self.input = input
         self.output = output
         self.block_size = block_size
-        if isinstance(self.input, types.FileType):
+        if isinstance(self.input, compress.DecompressFile):
+            self.file_size = self.input.size()
+        elif isinstance(self.input, types.FileType):
             self.file_size = os.fstat(self.input.fileno())[6]
         elif isinstance(self.input, InputType):
             self.file_size = len(self.input.getvalue())
@@ -325,15 +348,20 @@ class ProgressGenerator(object):
         """Return a generator that yields the progress of reading data
         from the input and feeding it into the output.  The progress
         yielded in each iteration is the percentage of data read, relative
-        to the to input file size."""
+        to the to input file size.  For compressed input, this is the
+        percentage of the compressed data read."""
         
+        compressed = isinstance(self.input, compress.DecompressFile)
         block = self.input.read(self.block_size)
         read_size = len(block)
         
         while block:
             self.output.feed(block)
             block = self.input.read(self.block_size)
-            read_size += len(block)
+            if compressed:
+                read_size = self.input.tell()
+            else:
+                read_size += len(block)
             yield (read_size * 100) / self.file_size
 
 
@@ -341,15 +369,16 @@ def parse_file(filename, parser):
     """Parse the supplied file using the supplied parser.  The parser parameter
     should be a GaphorLoader instance.  The filename parameter can be an
     open file descriptor instance or the name of a file.  The progress
-    percentage of the parser is yielded."""
+    percentage of the parser is yielded.  Compressed files (see
+    gaphor.storage.compress) are decompressed while they are parsed."""
     
     is_fd = True
     
     if isinstance(filename, (types.FileType, InputType)):
-        file_obj = filename
+        file_obj = compress.decompress(filename)
     else:
         is_fd = False
-        file_obj = open(filename, 'rb')
+        file_obj = compress.open_file(filename, 'rb')
         
     for progress in ProgressGenerator(file_obj, parser):
         yield progress
@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Binary snapshot format for Gaphor models.
+
+A snapshot holds the same content as the XML format written by
+gaphor.storage.storage, but is a lot cheaper to write and to read.
+Type names, property names and element ids are interned: in the file
+they are referred to by an integer, the index in a table that is
+stored at the end of the file.
+
+A snapshot file looks like this (all integers are little endian):
+
+    magic       'GAPHORB\\0'
+    version     uint16
+    records     ...
+    tables      gaphor version, names and ids, each a string table
+    offset      uint32, the file offset of the tables
+
+A string is stored as an uint32 length, followed by the UTF-8 encoded
+string. A string table is an uint32 count, followed by that many strings.
+
+Each record starts with a one byte opcode. END and CANVAS are one byte
+records, the other records are followed by two uint32 numbers:
+
+    ELEMENT type, id    start of a model element
+    ITEM    type, id    start of a canvas item (nested in a canvas or item)
+    CANVAS              start of the canvas of a diagram
+    END                 end of an element, canvas or item
+    VALUE   name, size  followed by size bytes of UTF-8 encoded value
+    REF     name, id    a reference to another element
+    REFLIST name, count followed by count uint32 element ids
+    DELETE  0, id       the element has been deleted (journal entries only)
+
+save_elements() writes a snapshot that holds only some elements of a
+model. Those are used as entries of the save journal (see
+gaphor.storage.journal).
+
+The parser creates the same element, canvas and canvasitem objects as
+gaphor.storage.parser does, so a snapshot is loaded by
+gaphor.storage.storage.load() just like a XML model file.
+"""
+
+from __future__ import absolute_import
+
+import struct
+import types
+from cStringIO import InputType
+
+import gaphas
+import six
+from six.moves import range
+
+from gaphor.UML import uml2
+from gaphor.UML.collection import collection
+from gaphor.application import Application
+from gaphor.misc.odict import odict
+from gaphor.storage.parser import element, canvas, canvasitem, ParserException
+
+__all__ = ['save', 'save_generator', 'save_elements', 'parse', 'parse_generator',
+           'SnapshotLoader', 'is_snapshot', 'SNAPSHOT_EXT']
+
+SNAPSHOT_EXT = '.gaphorb'
+SNAPSHOT_MAGIC = 'GAPHORB\0'
+SNAPSHOT_VERSION = 1
+
+# Record opcodes:
+[ END,
+  ELEMENT,
+  CANVAS,
+  ITEM,
+  VALUE,
+  REF,
+  REFLIST,
+  DELETE
+] = range(8)
+
+_header = struct.Struct('<8sH')
+_record = struct.Struct('<BII')
+_uint = struct.Struct('<I')
+
+
+def is_snapshot(filename):
+    """
+    Return True if ``filename`` (a file name or an open file) contains
+    a snapshot. Open files are read from their current position, which
+    is restored afterwards.
+    """
+    if isinstance(filename, (types.FileType, InputType)):
+        pos = filename.tell()
+        magic = filename.read(len(SNAPSHOT_MAGIC))
+        filename.seek(pos)
+    else:
+        try:
+            with open(filename, 'rb') as f:
+                magic = f.read(len(SNAPSHOT_MAGIC))
+        except IOError:
+            return filename.endswith(SNAPSHOT_EXT)
+    return magic == SNAPSHOT_MAGIC
+
+
+def _encode(value):
+    if isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def _string_table(strings):
+    data = [_uint.pack(len(strings))]
+    for s in strings:
+        s = _encode(s)
+        data.append(_uint.pack(len(s)))
+        data.append(s)
+    return ''.join(data)
+
+
+def save(out, factory, status_queue=None):
+    for status in save_generator(out, factory):
+        if status_queue:
+            status_queue(status)
+
+
+def save_generator(out, factory):
+    """
+    Save the model in ``factory`` as snapshot to ``out``, a file like
+    object opened in binary mode. Like storage.save_generator() this
+    yields the progress (0..100).
+    """
+    return _save_generator(out, factory.values(), factory.size())
+
+
+def save_elements(out, elements, deleted=()):
+    """
+    Save a snapshot with just ``elements`` to ``out``. The ids in
+    ``deleted`` are recorded as deleted elements.
+    """
+    for x in _save_generator(out, elements, len(elements), deleted):
+        pass
+
+
+def _save_generator(out, elements, size, deleted=()):
+    names = {}
+    ids = {}
+    buf = []
+    write = buf.append
+    pack = _record.pack
+
+    def name(n):
+        try:
+            return names[n]
+        except KeyError:
+            i = names[n] = len(names)
+            return i
+
+    def ref(id):
+        try:
+            return ids[id]
+        except KeyError:
+            i = ids[id] = len(ids)
+            return i
+
+    def save_reference(n, value):
+        if value.id:
+            write(pack(REF, name(n), ref(value.id)))
+
+    def save_collection(n, value):
+        refs = [ref(v.id) for v in value if v.id]
+        if refs:
+            write(pack(REFLIST, name(n), len(refs)))
+            write(struct.pack('<%dI' % len(refs), *refs))
+
+    def save_value(n, value):
+        if value is not None:
+            if isinstance(value, bool):
+                # Write booleans as 0/1.
+                value = str(int(value))
+            elif not isinstance(value, six.string_types):
+                value = str(value)
+            value = _encode(value)
+            write(pack(VALUE, name(n), len(value)))
+            write(value)
+
+    def save_element(n, value):
+        if isinstance(value, (uml2.Element, gaphas.Item)):
+            save_reference(n, value)
+        elif isinstance(value, collection):
+            save_collection(n, value)
+        elif isinstance(value, gaphas.Canvas):
+            write(chr(CANVAS))
+            value.save(save_canvasitem)
+            write(chr(END))
+        else:
+            save_value(n, value)
+
+    def save_canvasitem(n, value, reference=False):
+        if isinstance(value, collection) or \
+                (isinstance(value, (list, tuple)) and reference):
+            save_collection(n, value)
+        elif reference:
+            save_reference(n, value)
+        elif isinstance(value, gaphas.Item):
+            write(pack(ITEM, name(value.__class__.__name__), ref(value.id)))
+            value.save(save_canvasitem)
+
+            # save subitems
+            for child in value.canvas.get_children(value):
+                save_canvasitem(None, child)
+
+            write(chr(END))
+        elif isinstance(value, uml2.Element):
+            save_reference(n, value)
+        else:
+            save_value(n, value)
+
+    out.write(_header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+    offset = _header.size
+
+    n = 0
+    for e in elements:
+        assert e.id
+        write(pack(ELEMENT, name(e.__class__.__name__), ref(e.id)))
+        e.save(save_element)
+        write(chr(END))
+
+        data = ''.join(buf)
+        del buf[:]
+        out.write(data)
+        offset += len(data)
+
+        n += 1
+        if n % 25 == 0:
+            yield (n * 100) / size
+
+    if deleted:
+        data = ''.join(pack(DELETE, 0, ref(id)) for id in deleted)
+        out.write(data)
+        offset += len(data)
+
+    def ordered(table):
+        strings = [None] * len(table)
+        for s, i in table.items():
+            strings[i] = s
+        return strings
+
+    out.write(_string_table([Application.distribution.version]))
+    out.write(_string_table(ordered(names)))
+    out.write(_string_table(ordered(ids)))
+    out.write(_uint.pack(offset))
+
+
+class SnapshotLoader(object):
+    """
+    Collect the elements read from a snapshot. This class provides the
+    same attributes as parser.GaphorLoader, so storage can use either one.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.gaphor_version = None
+        self.elements = odict() # map id: element/canvasitem
+        self.deleted = []
+        self._completed = []
+
+    def pop_completed(self):
+        """Return a list of elements (not canvas items) that have been
+        read completely since the last call.
+        """
+        completed = self._completed
+        self._completed = []
+        return completed
+
+
+def _read_strings(data, pos):
+    """
+    Read a string table from ``data`` at offset ``pos``. Return the list of
+    strings and the offset of the first byte after the table.
+    """
+    unpack = _uint.unpack_from
+    count, = unpack(data, pos)
+    pos += 4
+    strings = []
+    for i in range(count):
+        size, = unpack(data, pos)
+        pos += 4
+        strings.append(data[pos:pos + size])
+        pos += size
+    return strings, pos
+
+
+def _read(filename):
+    if isinstance(filename, (types.FileType, InputType)):
+        return filename.read()
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def parse(filename):
+    """Parse a snapshot and return a dictionary ID:element/canvasitem.
+    """
+    loader = SnapshotLoader()
+
+    for x in parse_generator(filename, loader):
+        pass
+    return loader.elements
+
+
+def parse_generator(filename, loader):
+    """
+    Read the snapshot ``filename`` (a file name or an open file) into
+    SnapshotLoader ``loader``. The percentage of the file read is yielded.
+    """
+    assert isinstance(loader, SnapshotLoader), 'loader should be a SnapshotLoader'
+    data = _read(filename)
+
+    try:
+        magic, version = _header.unpack_from(data)
+    except struct.error:
+        magic = version = None
+    if magic != SNAPSHOT_MAGIC:
+        raise ParserException('File is not a Gaphor snapshot')
+    if version != SNAPSHOT_VERSION:
+        raise ParserException('Unsupported snapshot version %s' % version)
+
+    try:
+        end, = _uint.unpack_from(data, len(data) - 4)
+        (gaphor_version,), pos = _read_strings(data, end)
+        names, pos = _read_strings(data, pos)
+        ids, pos = _read_strings(data, pos)
+    except (struct.error, ValueError):
+        raise ParserException('Invalid snapshot: corrupt string tables')
+
+    loader.version = version
+    loader.gaphor_version = gaphor_version
+    elements = loader.elements
+    completed = loader._completed
+    unpack = _record.unpack_from
+
+    stack = []
+    current = None
+    pos = _header.size
+    size = len(data)
+    n = 0
+    try:
+        while pos < end:
+            op = ord(data[pos])
+            if op == END:
+                pos += 1
+                obj = current
+                current = stack.pop()
+                if current is None:
+                    completed.append(obj)
+                    n += 1
+                    if n % 25 == 0:
+                        yield (pos * 100) / size
+                continue
+            if op == CANVAS:
+                pos += 1
+                c = canvas()
+                current.canvas = c
+                stack.append(current)
+                current = c
+                continue
+
+            op, n1, n2 = unpack(data, pos)
+            pos += _record.size
+            if op in (VALUE, REF, REFLIST) and current.__class__ is canvasitem:
+                current.names.append(names[n1])
+            if op == VALUE:
+                current.values[names[n1]] = data[pos:pos + n2].decode('utf-8')
+                pos += n2
+            elif op == REF:
+                current.references[names[n1]] = ids[n2]
+            elif op == REFLIST:
+                if pos + 4 * n2 > end:
+                    raise ParserException('Invalid snapshot: corrupt record at offset %d' % (pos - _record.size))
+                refs = struct.unpack_from('<%dI' % n2, data, pos)
+                current.references[names[n1]] = [ids[i] for i in refs]
+                pos += 4 * n2
+            elif op == ELEMENT:
+                id = ids[n2]
+                assert id not in elements, '%s already defined' % id
+                e = elements[id] = element(id, names[n1])
+                stack.append(current)
+                current = e
+            elif op == ITEM:
+                id = ids[n2]
+                assert id not in elements, '%s already defined' % id
+                c = elements[id] = canvasitem(id, names[n1])
+                current.canvasitems.append(c)
+                stack.append(current)
+                current = c
+            elif op == DELETE:
+                loader.deleted.append(ids[n2])
+            else:
+                raise ParserException('Invalid snapshot: unknown record %d at offset %d' % (op, pos - _record.size))
+    except (struct.error, IndexError, AttributeError, ValueError):
+        raise ParserException('Invalid snapshot: corrupt record at offset %d' % pos)
+
+    if stack or pos != end:
+        raise ParserException('Invalid snapshot: unexpected end of records')
+    yield 100
+
+# vim:sw=4:et:ai
@@ -27,6 +27,10 @@ load(filename)
     load a model from a file
 save(filename)
     store the current model in a file
+
+load() also reads the binary snapshots written by
+gaphor.storage.snapshot.save(), and replays the save journal of a model
+file (see gaphor.storage.journal).
 """
 
 from __future__ import absolute_import
@@ -34,19 +38,25 @@ from __future__ import print_function
 
 import gc
 import os.path
-from cStringIO import InputType
+import time
+import uuid
+from cStringIO import InputType, StringIO
 
 import gaphas
 from six.moves import map
+from zope import component
 
 from gaphor import diagram
 from gaphor.UML import uml2, modelfactory
-from gaphor.UML.collection import collection
+from gaphor.UML.collection import collection, lazycollection
 from gaphor.UML.elementfactory import ElementChangedEventBlocker
+from gaphor.UML.properties import association
 from gaphor.application import Application, NotInitializedError
 from gaphor.diagram import items
 from gaphor.i18n import _
-from gaphor.storage import parser
+from gaphor.misc.odict import odict
+from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.storage import parser, snapshot, journal
 
 __all__ = ['load', 'save']
 
@@ -54,16 +64,67 @@ FILE_FORMAT_VERSION = '3.0'
 NAMESPACE_MODEL = 'http://gaphor.sourceforge.net/model'
 
 
-def save(writer=None, factory=None, status_queue=None):
-    for status in save_generator(writer, factory):
+def save(writer=None, factory=None, status_queue=None, index=None):
+    for status in save_generator(writer, factory, index):
         if status_queue:
             status_queue(status)
 
 
-def save_generator(writer, factory):
+def save_generator(writer, factory, index=None):
     """
     Save the current model using @writer, which is a
-    gaphor.misc.xmlwriter.XMLWriter instance.
+    gaphor.misc.xmlwriter.XMLWriter instance. Saving is faster if the
+    writer is buffered.
+
+    If ``index`` is a list, an (id, type, start, end) tuple is appended
+    for every element saved, start and end being the positions in the
+    output (see gaphor.storage.index).
+    """
+    save_element = element_saver(writer)
+
+    start_document(writer)
+
+    size = factory.size()
+    n = 0
+    for e in factory.values():
+        if index is not None:
+            start = writer.tell()
+        save_element(e)
+        if index is not None:
+            index.append((e.id, e.__class__.__name__, start, writer.tell()))
+
+        n += 1
+        if n % 25 == 0:
+            yield (n * 100) / size
+
+    end_document(writer)
+
+
+def start_document(writer):
+    """
+    Write the start of a model file: everything up to the first element.
+    """
+    writer.startDocument()
+    writer.startPrefixMapping('', NAMESPACE_MODEL)
+    writer.startElementNS((NAMESPACE_MODEL, 'gaphor'), None,
+                          {(NAMESPACE_MODEL, 'version'): FILE_FORMAT_VERSION,
+                           (NAMESPACE_MODEL, 'gaphor-version'): Application.distribution.version})
+
+
+def end_document(writer):
+    """
+    Write the end of a model file, after the last element.
+    """
+    # writer.endElement('gaphor')
+    writer.endElementNS((NAMESPACE_MODEL, 'gaphor'), None)
+    writer.endPrefixMapping('')
+    writer.endDocument()
+
+
+def element_saver(writer):
+    """
+    Return a function that saves a model element, with its canvas items
+    if it is a diagram, using @writer.
     """
 
     # Maintain a set of id's, one for elements, one for references.
@@ -76,42 +137,32 @@ def save_generator(writer, factory):
         """
         # Save a reference to the object:
         if value.id:
-            writer.startElement(name, {})
-            writer.startElement('ref', {'refid': value.id})
-            writer.endElement('ref')
-            writer.endElement(name)
+            writer.write_ref(name, value.id)
 
     def save_collection(name, value):
         """
         Save a list of references.
         """
-        if len(value) > 0:
-            writer.startElement(name, {})
-            writer.startElement('reflist', {})
-            for v in value:
-                # save_reference(name, v)
-                if v.id:
-                    writer.startElement('ref', {'refid': v.id})
-                    writer.endElement('ref')
-            writer.endElement('reflist')
-            writer.endElement(name)
+        if isinstance(value, lazycollection):
+            # Items that have not been created yet are saved by id
+            refids = value.ids()
+            if refids:
+                writer.write_refs(name, refids)
+        elif len(value) > 0:
+            writer.write_refs(name, [v.id for v in value if v.id])
 
     def save_value(name, value):
         """
         Save a value (attribute).
         """
         if value is not None:
-            writer.startElement(name, {})
-            writer.startElement('val', {})
             if isinstance(value, (str,)):
-                writer.characters(value)
+                writer.write_value(name, value)
             elif isinstance(value, bool):
                 # Write booleans as 0/1.
-                writer.characters(str(int(value)))
+                writer.write_value(name, str(int(value)))
             else:
-                writer.characters(str(value))
-            writer.endElement('val')
-            writer.endElement(name)
+                writer.write_value(name, str(value))
 
     def save_element(name, value):
         """
@@ -125,7 +176,7 @@ def save_generator(writer, factory):
             save_reference(name, value)
         elif isinstance(value, collection):
             save_collection(name, value)
-        elif isinstance(value, gaphas.Canvas):
+        elif isinstance(value, (gaphas.Canvas, DeferredCanvas)):
             writer.startElement('canvas', {})
             value.save(save_canvasitem)
             writer.endElement('canvas')
@@ -154,34 +205,146 @@ def save_generator(writer, factory):
 
             writer.endElement('item')
 
+        elif isinstance(value, parser.canvasitem):
+            # An item of a deferred canvas, saved as it was read
+            writer.startElement('item', {'id': value.id,
+                                         'type': value.type})
+            for name in value.names:
+                if name in value.values:
+                    writer.write_value(name, value.values[name])
+                else:
+                    refids = value.references.get(name)
+                    if type(refids) == list:
+                        if refids:
+                            writer.write_refs(name, refids)
+                    elif refids:
+                        writer.write_ref(name, refids)
+
+            for child in value.canvasitems:
+                save_canvasitem(None, child)
+
+            writer.endElement('item')
+
         elif isinstance(value, uml2.Element):
             save_reference(name, value)
         else:
             save_value(name, value)
 
-    writer.startDocument()
-    writer.startPrefixMapping('', NAMESPACE_MODEL)
-    writer.startElementNS((NAMESPACE_MODEL, 'gaphor'), None,
-                          {(NAMESPACE_MODEL, 'version'): FILE_FORMAT_VERSION,
-                           (NAMESPACE_MODEL, 'gaphor-version'): Application.distribution.version})
-
-    size = factory.size()
-    n = 0
-    for e in factory.values():
+    def save(e):
         clazz = e.__class__.__name__
         assert e.id
         writer.startElement(clazz, {'id': str(e.id)})
-        e.save(save_element)
+        if isinstance(e, uml2.Diagram) and isinstance(e.canvas_loader, DeferredCanvas):
+            # Save the items as they were read, instead of creating them
+            super(uml2.Diagram, e).save(save_element)
+            save_element('canvas', e.canvas_loader)
+        else:
+            e.save(save_element)
         writer.endElement(clazz)
 
-        n += 1
-        if n % 25 == 0:
+    return save
+
+
+class FrozenModel(object):
+    """
+    A snapshot of a model, taken by freeze_generator() and saved by
+    save_frozen_generator(). The elements are serialized one by one into
+    an in-memory buffer, so a snapshot takes about as much memory as the
+    model file. The model itself is not used to save the snapshot, so that
+    can be done in another thread while the model is being changed.
+
+    Elements that have changed after they were frozen can be frozen again
+    by update().
+    """
+
+    def __init__(self):
+        self._out = StringIO()
+        self._writer = XMLWriter(self._out, buffered=True)
+        self._save = element_saver(self._writer)
+        # id -> (type, start, end) of the serialized elements
+        self.elements = odict()
+
+    def freeze(self, element):
+        """
+        Serialize ``element``. An earlier serialization of the element is
+        replaced; the element keeps its place in the snapshot.
+        """
+        writer = self._writer
+        start = writer.tell()
+        self._save(element)
+        self.elements[element.id] = (element.__class__.__name__, start, writer.tell())
+
+    def update(self, elements, deleted=()):
+        """
+        Serialize the changed ``elements`` again and leave out the elements
+        with ids ``deleted``, as returned by journal.ChangeTracker.changes().
+        """
+        for e in elements:
+            self.freeze(e)
+        for id in deleted:
+            self.elements.pop(id, None)
+
+    def data(self):
+        """
+        Return the buffer with the serialized elements. An element starts
+        at the first '<' at or after its start position.
+        """
+        self._writer.flush()
+        return self._out.getvalue()
+
+
+def freeze_generator(factory, frozen):
+    """
+    Take a snapshot of the model in ``factory``: serialize its elements
+    into FrozenModel ``frozen``. The progress is yielded, so the snapshot
+    can be taken by a GIdleThread. The elements are those in the factory
+    when the snapshot is started; elements that are removed before they
+    are frozen are left out.
+    """
+    elements = list(factory.values())
+    size = len(elements)
+    lookup = factory.lookup
+    for n, e in enumerate(elements):
+        if lookup(e.id) is e:
+            frozen.freeze(e)
+        if n % 25 == 24:
             yield (n * 100) / size
 
-    # writer.endElement('gaphor')
-    writer.endElementNS((NAMESPACE_MODEL, 'gaphor'), None)
-    writer.endPrefixMapping('')
-    writer.endDocument()
+
+def freeze(factory):
+    """
+    Take a snapshot of the model in ``factory`` at once, see
+    freeze_generator(). Returns a FrozenModel.
+    """
+    frozen = FrozenModel()
+    for x in freeze_generator(factory, frozen):
+        pass
+    return frozen
+
+
+def save_frozen_generator(writer, frozen, index=None):
+    """
+    Save FrozenModel ``frozen`` using @writer. The model itself is not
+    used, so this can be done in another thread while the model is being
+    changed. If ``index`` is a list, index entries are added as by
+    save_generator().
+    """
+    data = frozen.data()
+    elements = frozen.elements.items()
+
+    start_document(writer)
+
+    size = len(elements)
+    for n, (id, (clazz, start, end)) in enumerate(elements):
+        if index is not None:
+            pos = writer.tell()
+        writer.write_xml(data[data.find('<', start, end):end])
+        if index is not None:
+            index.append((id, clazz, pos, writer.tell()))
+        if n % 1000 == 999:
+            yield (n * 100) / size
+
+    end_document(writer)
 
 
 def load_elements(elements, factory, status_queue=None):
@@ -190,10 +353,16 @@ def load_elements(elements, factory, status_queue=None):
             status_queue(status)
 
 
-def load_elements_generator(elements, factory, gaphor_version=None):
+def load_elements_generator(elements, factory, gaphor_version=None, lazy=False):
     """
     Load a file and create a model if possible.
     Exceptions: IOError, ValueError.
+
+    Elements that already have been created (e.g. by load_generator() while
+    the file was being parsed) are not created again.
+
+    If ``lazy`` is set, the canvas items of diagrams are created when the
+    canvas of the diagram is used for the first time (see load_canvas()).
     """
     # TODO: restructure loading code, first load model, then add canvas items
     log.debug(_('Loading %d elements...') % len(elements))
@@ -209,48 +378,38 @@ def load_elements_generator(elements, factory, gaphor_version=None):
     # log.info('0%')
 
     # Fix version inconsistencies
-    version_0_6_2(elements, factory, gaphor_version)
-    version_0_7_2(elements, factory, gaphor_version)
-    version_0_9_0(elements, factory, gaphor_version)
-    version_0_14_0(elements, factory, gaphor_version)
-    version_0_15_0_pre(elements, factory, gaphor_version)
-    version_0_17_0(elements, factory, gaphor_version)
+    migrations = select_migrations(gaphor_version)
+    migrate(migrations, PRE, elements, factory)
 
     # log.debug("Still have %d elements" % len(elements))
 
     # First create elements and canvas items in the factory
     # The elements are stored as attribute 'element' on the parser objects:
 
-    def create_canvasitems(canvas, canvasitems, parent=None):
-        """
-        Canvas is a read gaphas.Canvas, items is a list of parser.canvasitem's
-        """
-        for item in canvasitems:
-            cls = getattr(items, item.type)
-            item.element = diagram.create_as(cls, item.id)
-            canvas.add(item.element, parent=parent)
-            assert canvas.get_parent(item.element) is parent
-            create_canvasitems(canvas, item.canvasitems, parent=item.element)
-
     for id, elem in elements.items():
         st = update_status_queue()
         if st:
             yield st
-        if isinstance(elem, parser.element):
-            cls = getattr(uml2, elem.type)
-            # log.debug('Creating UML element for %s (%s)' % (elem, elem.id))
-            elem.element = factory.create_as(cls, id)
-            if elem.canvas:
-                elem.element.canvas.block_updates = True
-                create_canvasitems(elem.element.canvas, elem.canvas.canvasitems)
-        elif not isinstance(elem, parser.canvasitem):
-            raise ValueError('Item with id "%s" and type %s can not be instantiated' % (id, type(elem)))
+        if not hasattr(elem, 'element'):
+            create_element(elem, factory, lazy)
+
+    # canvas item id -> diagram, for items that are not created yet
+    deferred = {}
+    for id, elem in elements.items():
+        if isinstance(elem, parser.element) and elem.canvas and elem.element.canvas_deferred:
+            defer_canvasitems(elem.element, elem.canvas.canvasitems, deferred)
+
+    # references to canvas items of deferred canvases, set once the
+    # references have been loaded: (element, name, canvas item id)
+    postponed = []
 
     # load attributes and create references:
     for id, elem in elements.items():
         st = update_status_queue()
         if st:
             yield st
+        if id in deferred:
+            continue
         # Ensure that all elements have their element instance ready...
         assert hasattr(elem, 'element')
 
@@ -264,6 +423,8 @@ def load_elements_generator(elements, factory, gaphor_version=None):
 
         for name, refids in elem.references.items():
             if type(refids) == list:
+                if deferred:
+                    refids = defer_references(elem.element, name, refids, deferred)
                 for refid in refids:
                     try:
                         ref = elements[refid]
@@ -277,6 +438,9 @@ def load_elements_generator(elements, factory, gaphor_version=None):
                                 type(elem.element).__name__, name, ref.element.id))
                             raise
             else:
+                if refids in deferred:
+                    postponed.append((elem.element, name, refids))
+                    continue
                 try:
                     ref = elements[refids]
                 except:
@@ -289,10 +453,12 @@ def load_elements_generator(elements, factory, gaphor_version=None):
                             'Loading %s.%s with value %s failed' % (type(elem.element).__name__, name, ref.element.id))
                         raise
 
+    for element, name, refid in postponed:
+        deferred[refid].load_canvas()
+        element.load(name, elements[refid].element)
+
     # Fix version inconsistencies
-    version_0_5_2(elements, factory, gaphor_version)
-    version_0_7_1(elements, factory, gaphor_version)
-    version_0_15_0_post(elements, factory, gaphor_version)
+    migrate(migrations, POST, elements, factory)
 
     # Before version 0.7.2 there was only decision node (no merge nodes).
     # This node could have many incoming and outgoing flows (edges).
@@ -306,103 +472,570 @@ def load_elements_generator(elements, factory, gaphor_version=None):
     # Data model, loaded from file, is updated automatically, so there is
     # no need for special function.
 
-    for d in factory.select(lambda e: isinstance(e, uml2.Diagram)):
+    for d in factory.select_type(uml2.Diagram):
         # update_now() is implicitly called when lock is released
-        d.canvas.block_updates = False
+        if not d.canvas_deferred:
+            d.canvas.block_updates = False
 
     # do a postload:
     for id, elem in elements.items():
         st = update_status_queue()
         if st:
             yield st
-        elem.element.postload()
+        if id not in deferred:
+            elem.element.postload()
 
     factory.notify_model()
 
 
-def load(filename, factory, status_queue=None):
+def create_canvasitems(canvas, canvasitems, parent=None):
+    """
+    Canvas is a read gaphas.Canvas, items is a list of parser.canvasitem's
+    """
+    for item in canvasitems:
+        cls = getattr(items, item.type)
+        item.element = diagram.create_as(cls, item.id)
+        canvas.add(item.element, parent=parent)
+        assert canvas.get_parent(item.element) is parent
+        create_canvasitems(canvas, item.canvasitems, parent=item.element)
+
+
+def create_element(elem, factory, lazy=False):
+    """
+    Create the model element for parser element ``elem`` in the factory.
+    For diagrams the canvas items are created as well, unless ``lazy`` is
+    set. Canvas items themselves are created through their diagram and are
+    ignored here.
+    """
+    if isinstance(elem, parser.element):
+        cls = getattr(uml2, elem.type)
+        # log.debug('Creating UML element for %s (%s)' % (elem, elem.id))
+        elem.element = factory.create_as(cls, elem.id)
+        if elem.canvas and lazy:
+            elem.element.defer_canvas(DeferredCanvas(elem.canvas, factory))
+        elif elem.canvas:
+            elem.element.canvas.block_updates = True
+            create_canvasitems(elem.element.canvas, elem.canvas.canvasitems)
+    elif not isinstance(elem, parser.canvasitem):
+        raise ValueError('Item with id "%s" and type %s can not be instantiated' % (elem.id, type(elem)))
+
+
+def defer_canvasitems(diagram, canvasitems, deferred):
+    """
+    Register the (nested) canvas items of a diagram with a deferred canvas
+    in ``deferred``, a dictionary canvas item id -> diagram.
+    """
+    for item in canvasitems:
+        deferred[item.id] = diagram
+        defer_canvasitems(diagram, item.canvasitems, deferred)
+
+
+def defer_references(element, name, refids, deferred):
+    """
+    References from model elements to canvas items that are not created
+    yet (the presentation of an element) are held by a lazy collection. The
+    diagrams are loaded as soon as the collection is used.
+
+    Returns the references that can be loaded right away.
+    """
+    diagrams = set(deferred[refid] for refid in refids if refid in deferred)
+    if not diagrams:
+        return refids
+
+    prop = getattr(type(element), name)
+    if not isinstance(prop, association):
+        for diagram in diagrams:
+            diagram.load_canvas()
+        return refids
+
+    def load():
+        for diagram in diagrams:
+            diagram.load_canvas()
+
+    pending = [(refid, deferred[refid]) for refid in refids if refid in deferred]
+
+    def pending_refids():
+        return [refid for refid, diagram in pending if diagram.canvas_deferred]
+
+    c = lazycollection(prop, element, prop.type, load, pending_refids)
+    old = getattr(element, prop._name, None)
+    if old:
+        for value in old:
+            c._add(value)
+    setattr(element, prop._name, c)
+    return [refid for refid in refids if refid not in deferred]
+
+
+class DeferredCanvas(object):
+    """
+    The loader of the canvas items of a diagram that has been loaded
+    lazily (see load_canvas()). ``canvas`` is the parser.canvas read from
+    the model file. The diagram can be saved without creating the items.
+    """
+
+    def __init__(self, canvas, factory):
+        self.canvas = canvas
+        self.factory = factory
+
+    def __call__(self, diagram):
+        load_canvas(diagram, self.canvas, self.factory)
+
+    def save(self, save_func):
+        for item in self.canvas.canvasitems:
+            save_func(None, item)
+
+
+def load_canvas(diagram, canvas, factory):
+    """
+    Create the canvas items of a diagram that has been loaded lazily.
+    ``canvas`` is the parser.canvas read from the model file. The items
+    may refer to each other and to elements in ``factory``.
+    """
+    items = {}
+
+    def collect(canvasitems):
+        for item in canvasitems:
+            items[item.id] = item
+            collect(item.canvasitems)
+
+    collect(canvas.canvasitems)
+
+    def lookup(refid):
+        try:
+            return items[refid].element
+        except KeyError:
+            element = factory.lookup(refid)
+            if element is None:
+                raise ValueError('Invalid ID for reference (%s) on diagram %s' % (refid, diagram.id))
+            referenced.add(element)
+            return element
+
+    referenced = set()
+
+    try:
+        component_registry = Application.get_service('component_registry')
+    except NotInitializedError:
+        component_registry = None
+
+    undo_manager = None
+    if component_registry:
+        ElementChangedEventBlocker.block(component_registry)
+        try:
+            undo_manager = component_registry.get_service('undo_manager')
+        except component.ComponentLookupError:
+            pass
+    # Creating the items is not something that should be undone
+    if undo_manager:
+        undo_manager.block()
+    try:
+        c = diagram.canvas
+        c.block_updates = True
+        create_canvasitems(c, canvas.canvasitems)
+
+        for item in items.values():
+            element = item.element
+            for name, value in item.values.items():
+                element.load(name, value)
+            for name, refids in item.references.items():
+                if type(refids) == list:
+                    for refid in refids:
+                        element.load(name, lookup(refid))
+                else:
+                    element.load(name, lookup(refids))
+
+        c.block_updates = False
+        c.postload()
+        for item in items.values():
+            item.element.postload()
+        c.modified = False
+    finally:
+        if undo_manager:
+            undo_manager.unblock()
+        if component_registry:
+            ElementChangedEventBlocker.unblock(component_registry)
+
+    # The values and references have been loaded without change events
+    for item in items.values():
+        factory._index_values(item.element)
+        factory._index_references(item.element)
+    # The presentation of the elements has changed
+    for element in referenced:
+        factory._index_references(element)
+
+
+def element_closure(ids, lookup):
+    """
+    Return the parsed elements ``ids`` (an odict id: element), together
+    with the elements they own (through composite associations) and the
+    canvas items of diagrams and the elements they show. ``lookup(id)``
+    returns the parsed element with id ``id``, or None if there is none.
+    """
+    elements = odict()
+    pending = list(reversed(ids))
+
+    def follow(refids):
+        if type(refids) == list:
+            pending.extend(refids)
+        else:
+            pending.append(refids)
+
+    def add_canvasitems(canvasitems):
+        for item in canvasitems:
+            elements[item.id] = item
+            for refids in item.references.values():
+                follow(refids)
+            add_canvasitems(item.canvasitems)
+
+    while pending:
+        id = pending.pop()
+        if id in elements:
+            continue
+        elem = lookup(id)
+        if not isinstance(elem, parser.element):
+            continue
+        elements[id] = elem
+        cls = getattr(uml2, elem.type)
+        for name, refids in elem.references.items():
+            prop = getattr(cls, name, None)
+            if isinstance(prop, association) and prop.composite:
+                follow(refids)
+        if elem.canvas:
+            add_canvasitems(elem.canvas.canvasitems)
+    return elements
+
+
+def restrict_references(elements, lookup=None):
+    """
+    Restrict the references of ``elements`` to the elements in
+    ``elements``. If ``lookup`` is given, references to other model
+    elements are kept: a placeholder is added for them, an element of the
+    same type and name but without references or diagram. References to
+    canvas items of other diagrams are always left out.
+    """
+    def keep(refid):
+        if refid in elements:
+            return True
+        elem = lookup and lookup(refid)
+        if not isinstance(elem, parser.element):
+            return False
+        placeholder = elements[refid] = parser.element(refid, elem.type)
+        if 'name' in elem.values:
+            placeholder.values['name'] = elem.values['name']
+        return True
+
+    for elem in list(elements.values()):
+        references = {}
+        for name, refids in elem.references.items():
+            if type(refids) == list:
+                refids = [r for r in refids if keep(r)]
+                if refids:
+                    references[name] = refids
+            elif keep(refids):
+                references[name] = refids
+        elem.references = references
+
+
+def resolve_include(include, elements):
+    """
+    Return the ids of the parsed ``elements`` selected by ``include``, a
+    list of element ids and qualified names. A qualified name is a tuple of
+    names, like NamedElement.qualifiedName, or a string with the names
+    separated by '::'. The owner of an element is found through its
+    ``package`` reference.
+
+    Raises parser.ParserException if an entry selects no element.
+    """
+    def qualified_name(elem):
+        names = []
+        while isinstance(elem, parser.element):
+            names.append(elem.values.get('name', ''))
+            elem = elements.get(elem.references.get('package'))
+        return tuple(reversed(names))
+
+    names = {}
+    for elem in elements.values():
+        if isinstance(elem, parser.element) and 'name' in elem.values:
+            names.setdefault(qualified_name(elem), []).append(elem.id)
+
+    ids = []
+    unresolved = []
+    for entry in include:
+        if isinstance(entry, (tuple, list)):
+            found = names.get(tuple(entry), ())
+        elif entry in elements:
+            found = (entry,)
+        else:
+            found = names.get(tuple(entry.split('::')), ())
+        if not found:
+            unresolved.append(entry)
+        ids.extend(found)
+    if unresolved:
+        raise parser.ParserException('No elements found for %s' % ', '.join(
+            '::'.join(e) if isinstance(e, (tuple, list)) else e for e in unresolved))
+    return ids
+
+
+def select_elements(elements, include):
+    """
+    Return the parsed elements needed to load the packages and diagrams
+    selected by ``include`` (see resolve_include()) from ``elements``: the
+    selected elements, everything they own, the elements shown on their
+    diagrams and placeholders for the elements they refer to (see
+    restrict_references()).
+    """
+    selected = element_closure(resolve_include(include, elements), elements.get)
+    restrict_references(selected, elements.get)
+    return selected
+
+
+def can_stream(gaphor_version):
+    """
+    Elements can be handed over to the factory while the file is being
+    parsed, if none of the version fixups that change the parsed elements
+    before they are created apply.
+    """
+    return bool(gaphor_version) and not version_lower_than(gaphor_version, (0, 17, 0))
+
+
+def load(filename, factory, status_queue=None, lazy=False, include=None):
     """
     Load a file and create a model if possible.
     Optionally, a status queue function can be given, to which the
     progress is written (as status_queue(progress)).
     """
-    for status in load_generator(filename, factory):
+    for status in load_generator(filename, factory, lazy, include):
         if status_queue:
             status_queue(status)
 
 
-def load_generator(filename, factory):
+def load_generator(filename, factory, lazy=False, include=None):
     """
     Load a file and create a model if possible.
     This function is a generator. It will yield values from 0 to 100 (%)
     to indicate its progression.
+
+    If the model file is recent enough, the factory is flushed as soon as the
+    file header has been read and elements are created while the rest of the
+    file is still being parsed. This is not done if the model file has a
+    journal: the journal is replayed first. If loading fails once the
+    factory has been flushed, the factory is flushed again, so no partly
+    loaded model is left behind.
+
+    Both XML model files and binary snapshots can be loaded. XML model
+    files may be compressed (see gaphor.storage.compress); the progress is
+    then that of the compressed file.
+
+    If ``lazy`` is set, the canvas items of a diagram are only created when
+    the diagram's canvas is used (for instance when it is shown or saved).
+    This is only done for models that can be streamed.
+
+    If ``include`` is given, a list of ids and qualified names of packages
+    and diagrams, only those and the elements they own are loaded (see
+    select_elements()). Elements they refer to are loaded as placeholders.
     """
     if isinstance(filename, (file, InputType)):
         log.info('Loading file from file descriptor')
+        journaled = False
     else:
         log.info('Loading file %s' % os.path.basename(filename))
-    try:
-        # Use the incremental parser and yield the percentage of the file.
-        loader = parser.GaphorLoader()
-        for percentage in parser.parse_generator(filename, loader):
-            pass
-            if percentage:
-                yield percentage / 2
-            else:
-                yield percentage
-        elements = loader.elements
-        gaphor_version = loader.gaphor_version
-        # elements = parser.parse(filename)
-        # yield 100
-    except Exception as e:
-        log.error('File could no be parsed', exc_info=True)
-        raise
+        journaled = journal.exists(filename)
 
     try:
         component_registry = Application.get_service('component_registry')
     except NotInitializedError:
         component_registry = None
 
-    try:
+    def flush():
         factory.flush()
         gc.collect()
-        log.info("Read %d elements from file" % len(elements))
         if component_registry:
-            component_registry.register_subscription_adapter(ElementChangedEventBlocker)
+            ElementChangedEventBlocker.block(component_registry)
+
+    def unblock():
+        if component_registry:
+            ElementChangedEventBlocker.unblock(component_registry)
+
+    flushed = False
+    try:
         try:
-            for percentage in load_elements_generator(elements, factory, gaphor_version):
+            # Use the incremental parser and yield the percentage of the file.
+            if snapshot.is_snapshot(filename):
+                loader = snapshot.SnapshotLoader()
+                parse_generator = snapshot.parse_generator
+            else:
+                loader = parser.GaphorLoader()
+                parse_generator = parser.parse_generator
+            for percentage in parse_generator(filename, loader):
+                if not flushed and not journaled and include is None \
+                        and can_stream(loader.gaphor_version):
+                    flush()
+                    flushed = True
+                if flushed:
+                    for elem in loader.pop_completed():
+                        create_element(elem, factory, lazy)
                 if percentage:
-                    yield percentage / 2 + 50
+                    yield percentage / 2
                 else:
                     yield percentage
+            elements = loader.elements
+            gaphor_version = loader.gaphor_version
+            if journaled:
+                log.info("Replayed %d journal entries" % journal.replay(filename, elements))
+            if include is not None:
+                elements = select_elements(elements, include)
         except Exception as e:
+            log.error('File could no be parsed', exc_info=True)
             raise
-        finally:
-            if component_registry:
-                component_registry.unregister_subscription_adapter(ElementChangedEventBlocker)
 
-        gc.collect()
-        yield 100
-    except Exception as e:
-        log.info('file %s could not be loaded' % filename)
+        try:
+            if not flushed:
+                flush()
+                flushed = True
+            log.info("Read %d elements from file" % len(elements))
+            lazy = lazy and can_stream(gaphor_version)
+            for percentage in load_elements_generator(elements, factory, gaphor_version, lazy):
+                if percentage:
+                    yield percentage / 2 + 50
+                else:
+                    yield percentage
+
+            gc.collect()
+            yield 100
+        except Exception as e:
+            log.info('file %s could not be loaded' % filename)
+            raise
+    except:
+        if flushed:
+            # The model has been replaced by a partly loaded one: do not
+            # leave that behind
+            flushed = False
+            unblock()
+            factory.flush()
+            gc.collect()
+            factory.notify_model()
         raise
+    finally:
+        if flushed:
+            unblock()
 
 
-def version_lower_than(gaphor_version, version):
+def parse_version(gaphor_version):
     """
-    if version_lower_than('0.3.0', (0, 15, 0)):
-       ...
+    Parse a Gaphor version string. A tuple (version, dev) is returned,
+    ``dev`` is True for -dev, -pre, -beta, -alpha or whatever versions.
     """
     parts = gaphor_version.split('.')
     try:
-        return tuple(map(int, parts)) < version
+        return tuple(map(int, parts)), False
     except ValueError:
-        # We're having a -dev, -pre, -beta, -alpha or whatever version
-        parts = parts[:-1]
-        return tuple(map(int, parts)) <= version
+        return tuple(map(int, parts[:-1])), True
 
 
-def version_0_15_0_pre(elements, factory, gaphor_version):
+def version_lower_than(gaphor_version, version):
+    """
+    if version_lower_than('0.3.0', (0, 15, 0)):
+       ...
+
+    ``gaphor_version`` may also be a version parsed by parse_version().
+    """
+    if not isinstance(gaphor_version, tuple):
+        gaphor_version = parse_version(gaphor_version)
+    parts, dev = gaphor_version
+    if dev:
+        return parts <= version
+    return parts < version
+
+
+# Migration phases: before and after the elements have been created
+PRE, POST = 'pre', 'post'
+
+
+class Migration(object):
+    """
+    A migration step for model files written by a Gaphor version lower
+    than ``version``.
+
+    Whole-model steps are called as ``func(elements, factory)``. Steps
+    with ``per_element`` set are called as ``func(elem, elements, factory)``
+    for every parsed element. Such steps may only depend on the element
+    they are given: consecutive per-element steps are done in one pass
+    over the elements.
+    """
+
+    def __init__(self, version, phase, func, per_element=False):
+        self.version = version
+        self.phase = phase
+        self.func = func
+        self.per_element = per_element
+        self.name = func.__name__
+
+
+# The migration steps, ordered by version (see migration())
+MIGRATIONS = []
+
+# Migration step name -> seconds spent in it, for the last model loaded
+migration_timings = {}
+
+
+def migration(version, phase, per_element=False):
+    """
+    Decorator that registers a migration step (see Migration).
+    """
+    def register(func):
+        MIGRATIONS.append(Migration(version, phase, func, per_element))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return register
+
+
+def select_migrations(gaphor_version):
+    """
+    Return the migration steps that apply to a model file written by
+    Gaphor ``gaphor_version``. A model file written by the current version
+    (or one that has no version) needs none.
+    """
+    migration_timings.clear()
+    if not gaphor_version:
+        return []
+    version = parse_version(gaphor_version)
+    return [m for m in MIGRATIONS if version_lower_than(version, m.version)]
+
+
+def migrate(migrations, phase, elements, factory):
+    """
+    Apply the ``migrations`` of ``phase`` (PRE or POST) to the parsed
+    ``elements``. The time spent in each step is kept in
+    migration_timings.
+    """
+    steps = [m for m in migrations if m.phase == phase]
+    clock = time.time
+    while steps:
+        if not steps[0].per_element:
+            step = steps.pop(0)
+            start = clock()
+            step.func(elements, factory)
+            migration_timings[step.name] = clock() - start
+            log.info('Migration %s took %.3fs' % (step.name, migration_timings[step.name]))
+            continue
+
+        # Fuse the per-element steps into one pass
+        n = 1
+        while n < len(steps) and steps[n].per_element:
+            n += 1
+        fused, steps = steps[:n], steps[n:]
+        timings = [0.0] * n
+        for elem in list(elements.values()):
+            for i, step in enumerate(fused):
+                start = clock()
+                step.func(elem, elements, factory)
+                timings[i] += clock() - start
+        for step, t in zip(fused, timings):
+            migration_timings[step.name] = t
+            log.info('Migration %s took %.3fs' % (step.name, t))
+
+
+@migration((0, 14, 99), PRE)
+def version_0_15_0_pre(elements, factory):
     """
     Fix association navigability UML metamodel to comply with UML 2.2
     using Association.navigableOwnedEnd among others (see model factory
@@ -417,65 +1050,65 @@ def version_0_15_0_pre(elements, factory, gaphor_version):
     This function is called before the actual elements are constructed.
     """
     ATTRS = set(['class_', 'interface_', 'actor', 'useCase', 'owningAssociation'])
-    if version_lower_than(gaphor_version, (0, 14, 99)):
-        # update associations
-        values = (v for v in elements.values()
-                  if type(v) is parser.element
-                  and v.type == 'Property'
-                  and 'association' in v.references)
-        for et in values:
-            # get association
-            assoc = elements[et.references['association']]
-
-            attrs = set(set(ATTRS) & set(et.references))
-            if attrs:
-                assert len(attrs) == 1
-
-                attr = attrs.pop()
-
-                if attr == 'owningAssociation':
-                    assoc.references['ownedEnd'].remove(et.id)
-                    if not assoc.references['ownedEnd']:
-                        del assoc.references['ownedEnd']
-                elif attr in ('actor', 'useCase'):
-                    if 'navigableOwnedEnd' not in assoc.references:
-                        assoc.references['navigableOwnedEnd'] = []
-                    assoc.references['navigableOwnedEnd'].append(et.id)
-
-                    el = elements[et.references[attr]]
-                    el.references['ownedAttribute'].remove(et.id)
-                    if not el.references['ownedAttribute']:
-                        del el.references['ownedAttribute']
-
-                del et.references[attr]
-            else:
-                if 'ownedEnd' not in assoc.references:
-                    assoc.references['ownedEnd'] = []
-                assoc.references['ownedEnd'].append(et.id)
-
-        # - get rid of tagged values
-        for e in elements.values():
-            if 'taggedValue' in e.references:
-                taggedvalue = [elements[i].values['value'] for i in e.references['taggedValue'] if
-                               elements[i].values.get('value')]
-                # convert_tagged_value(e, elements, factory)
-                if taggedvalue:
-                    e.taggedvalue = taggedvalue
-
-                # Remove obsolete elements
-                for t in e.references['taggedValue']:
-                    del elements[t]
-                del e.references['taggedValue']
-
-        # - rename EventOccurrence to MessageOccurrenceSpecification
-        values = (v for v in elements.values()
-                  if type(v) is parser.element
-                  and v.type == 'EventOccurrence')
-        for et in values:
-            et.type = 'MessageOccurrenceSpecification'
-
-
-def version_0_15_0_post(elements, factory, gaphor_version):
+    # update associations
+    values = (v for v in elements.values()
+              if type(v) is parser.element
+              and v.type == 'Property'
+              and 'association' in v.references)
+    for et in values:
+        # get association
+        assoc = elements[et.references['association']]
+
+        attrs = set(set(ATTRS) & set(et.references))
+        if attrs:
+            assert len(attrs) == 1
+
+            attr = attrs.pop()
+
+            if attr == 'owningAssociation':
+                assoc.references['ownedEnd'].remove(et.id)
+                if not assoc.references['ownedEnd']:
+                    del assoc.references['ownedEnd']
+            elif attr in ('actor', 'useCase'):
+                if 'navigableOwnedEnd' not in assoc.references:
+                    assoc.references['navigableOwnedEnd'] = []
+                assoc.references['navigableOwnedEnd'].append(et.id)
+
+                el = elements[et.references[attr]]
+                el.references['ownedAttribute'].remove(et.id)
+                if not el.references['ownedAttribute']:
+                    del el.references['ownedAttribute']
+
+            del et.references[attr]
+        else:
+            if 'ownedEnd' not in assoc.references:
+                assoc.references['ownedEnd'] = []
+            assoc.references['ownedEnd'].append(et.id)
+
+    # - get rid of tagged values
+    for e in elements.values():
+        if 'taggedValue' in e.references:
+            taggedvalue = [elements[i].values['value'] for i in e.references['taggedValue'] if
+                           elements[i].values.get('value')]
+            # convert_tagged_value(e, elements, factory)
+            if taggedvalue:
+                e.taggedvalue = taggedvalue
+
+            # Remove obsolete elements
+            for t in e.references['taggedValue']:
+                del elements[t]
+            del e.references['taggedValue']
+
+    # - rename EventOccurrence to MessageOccurrenceSpecification
+    values = (v for v in elements.values()
+              if type(v) is parser.element
+              and v.type == 'EventOccurrence')
+    for et in values:
+        et.type = 'MessageOccurrenceSpecification'
+
+
+@migration((0, 14, 99), POST)
+def version_0_15_0_post(elements, factory):
     """
     Part two: create stereotypes and what more for the elements that have a
     taggedvalue property.
@@ -485,114 +1118,113 @@ def version_0_15_0_post(elements, factory, gaphor_version):
         e = elements[element.id] = parser.element(element.id, element.__class__.__name__)
         e.element = element
 
-    if version_lower_than(gaphor_version, (0, 14, 99)):
-        stereotypes = {}
-        profile = None
-        for e in elements.values():
-            if hasattr(e, 'taggedvalue'):
-                if not profile:
-                    profile = factory.create(uml2.Profile)
-                    profile.name = 'version 0.15 conversion'
-                    update_elements(profile)
-                st = stereotypes.get(e.type)
-                if not st:
-                    st = stereotypes[e.type] = factory.create(uml2.Stereotype)
-                    st.name = 'Tagged'
-                    st.package = profile
-                    update_elements(st)
-                    cl = factory.create(uml2.Class)
-                    cl.name = str(e.type)
-                    cl.package = profile
-                    update_elements(cl)
-                    ext = modelfactory.extend_with_stereotype(factory, cl, st)
-                    update_elements(ext)
-                    for me in ext.memberEnd:
-                        update_elements(me)
-                # Create instance specification for the stereotype:
-                instspec = modelfactory.apply_stereotype(factory, e.element, st)
-                update_elements(instspec)
-
-                def create_slot(key, val):
-                    for attr in st.ownedAttribute:
-                        if attr.name == key:
-                            break
-                    else:
-                        attr = st.ownedAttribute = factory.create(uml2.Property)
-                        attr.name = str(key)
-                        update_elements(attr)
-                    slot = modelfactory.add_slot(factory, instspec, attr)
-                    slot.value.value = str(val)
-                    update_elements(slot)
-
-                tviter = iter(e.taggedvalue or [])
-                for tv in tviter:
+    stereotypes = {}
+    profile = None
+    for e in elements.values():
+        if hasattr(e, 'taggedvalue'):
+            if not profile:
+                profile = factory.create(uml2.Profile)
+                profile.name = 'version 0.15 conversion'
+                update_elements(profile)
+            st = stereotypes.get(e.type)
+            if not st:
+                st = stereotypes[e.type] = factory.create(uml2.Stereotype)
+                st.name = 'Tagged'
+                st.package = profile
+                update_elements(st)
+                cl = factory.create(uml2.Class)
+                cl.name = str(e.type)
+                cl.package = profile
+                update_elements(cl)
+                ext = modelfactory.extend_with_stereotype(factory, cl, st)
+                update_elements(ext)
+                for me in ext.memberEnd:
+                    update_elements(me)
+            # Create instance specification for the stereotype:
+            instspec = modelfactory.apply_stereotype(factory, e.element, st)
+            update_elements(instspec)
+
+            def create_slot(key, val):
+                for attr in st.ownedAttribute:
+                    if attr.name == key:
+                        break
+                else:
+                    attr = st.ownedAttribute = factory.create(uml2.Property)
+                    attr.name = str(key)
+                    update_elements(attr)
+                slot = modelfactory.add_slot(factory, instspec, attr)
+                slot.value.value = str(val)
+                update_elements(slot)
+
+            tviter = iter(e.taggedvalue or [])
+            for tv in tviter:
+                try:
                     try:
+                        key, val = tv.split('=', 1)
+                        key = key.strip()
+                    except ValueError:
+                        log.info('Tagged value "%s" has no key=value format, trying key_value ' % tv)
                         try:
-                            key, val = tv.split('=', 1)
+                            key, val = tv.split(' ', 1)
                             key = key.strip()
                         except ValueError:
-                            log.info('Tagged value "%s" has no key=value format, trying key_value ' % tv)
-                            try:
-                                key, val = tv.split(' ', 1)
-                                key = key.strip()
-                            except ValueError:
-                                # Fallback, deal with it as if it were a boolean
-                                key = tv.strip()
-                                val = 'true'
-
-                            # This syntax is used with the uml2 meta model:
-                            if key in ('subsets', 'redefines'):
-                                rest = ', '.join(tviter)
-                                val = ', '.join([val, rest]) if rest else val
-                                val = val.replace('\n', ' ')
-                                log.info('Special case: UML metamodel "%s %s"' % (key, val))
-                        create_slot(key, val)
-                    except Exception as e:
-                        log.warning('Unable to process tagged value "%s" as key=value pair' % tv, exc_info=True)
-
-        def find(messages, attr):
-            occurrences = set(getattr(m, attr) for m in messages
-                              if hasattr(m, attr) and getattr(m, attr))
-            assert len(occurrences) <= 1
-            if occurrences:
-                return occurrences.pop()
-            else:
-                return None
-
-        def update_msg(msg, sl, rl):
-            if sl:
-                s = factory.create(uml2.MessageOccurrenceSpecification)
-                s.covered = sl
-                m.sendEvent = s
-            if rl:
-                r = factory.create(uml2.MessageOccurrenceSpecification)
-                r.covered = rl
-                m.receiveEvent = r
-
-        for e in elements.values():
-            if e.type == 'MessageItem':
-                msg = e.element
-                send = msg.subject.sendEvent
-                receive = msg.subject.receiveEvent
-
-                if not send:
-                    send = find(list(msg._messages.keys()), 'sendEvent')
-                if not receive:
-                    receive = find(list(msg._messages.keys()), 'receiveEvent')
-                if not send:
-                    send = find(list(msg._inverted_messages.keys()), 'reveiveEvent')
-                if not receive:
-                    receive = find(list(msg._inverted_messages.keys()), 'sendEvent')
-
-                sl = send.covered if send else None
-                rl = receive.covered if receive else None
-
-                for m in msg._messages:
-                    update_msg(m, sl, rl)
-                for m in msg._inverted_messages:
-                    update_msg(m, rl, sl)
-                msg.subject.sendEvent = send
-                msg.subject.receiveEvent = receive
+                            # Fallback, deal with it as if it were a boolean
+                            key = tv.strip()
+                            val = 'true'
+
+                        # This syntax is used with the uml2 meta model:
+                        if key in ('subsets', 'redefines'):
+                            rest = ', '.join(tviter)
+                            val = ', '.join([val, rest]) if rest else val
+                            val = val.replace('\n', ' ')
+                            log.info('Special case: UML metamodel "%s %s"' % (key, val))
+                    create_slot(key, val)
+                except Exception as e:
+                    log.warning('Unable to process tagged value "%s" as key=value pair' % tv, exc_info=True)
+
+    def find(messages, attr):
+        occurrences = set(getattr(m, attr) for m in messages
+                          if hasattr(m, attr) and getattr(m, attr))
+        assert len(occurrences) <= 1
+        if occurrences:
+            return occurrences.pop()
+        else:
+            return None
+
+    def update_msg(msg, sl, rl):
+        if sl:
+            s = factory.create(uml2.MessageOccurrenceSpecification)
+            s.covered = sl
+            m.sendEvent = s
+        if rl:
+            r = factory.create(uml2.MessageOccurrenceSpecification)
+            r.covered = rl
+            m.receiveEvent = r
+
+    for e in elements.values():
+        if e.type == 'MessageItem':
+            msg = e.element
+            send = msg.subject.sendEvent
+            receive = msg.subject.receiveEvent
+
+            if not send:
+                send = find(list(msg._messages.keys()), 'sendEvent')
+            if not receive:
+                receive = find(list(msg._messages.keys()), 'receiveEvent')
+            if not send:
+                send = find(list(msg._inverted_messages.keys()), 'reveiveEvent')
+            if not receive:
+                receive = find(list(msg._inverted_messages.keys()), 'sendEvent')
+
+            sl = send.covered if send else None
+            rl = receive.covered if receive else None
+
+            for m in msg._messages:
+                update_msg(m, sl, rl)
+            for m in msg._inverted_messages:
+                update_msg(m, rl, sl)
+            msg.subject.sendEvent = send
+            msg.subject.receiveEvent = receive
 
 
 def convert_tagged_value(element, elements, factory):
@@ -642,7 +1274,8 @@ def convert_tagged_value(element, elements, factory):
                     break
 
 
-def version_0_17_0(elements, factory, gaphor_version):
+@migration((0, 17, 0), PRE)
+def version_0_17_0(elements, factory):
     """
     As of version 0.17.0, ValueSpecification and subclasses is dealt
     with as if it were attributes.
@@ -653,26 +1286,25 @@ def version_0_17_0(elements, factory, gaphor_version):
                      'InstanceValue', 'LiteralSpecification', 'LiteralUnlimitedNatural',
                      'LiteralInteger', 'LiteralString', 'LiteralBoolean', 'LiteralNull']
 
-    print('version', gaphor_version)
-    if version_lower_than(gaphor_version, (0, 17, 0)):
-        valspecs = dict((v.id, v) for v in elements.values() if v.type in valspec_types)
+    valspecs = dict((v.id, v) for v in elements.values() if v.type in valspec_types)
 
-        for id in valspecs.keys():
-            del elements[id]
+    for id in valspecs.keys():
+        del elements[id]
 
-        for e in elements.values():
-            for name, ref in list(e.references.items()):
-                # ValueSpecifications are always defined in 1:1 relationships
-                if type(ref) != list and ref in valspecs:
-                    del e.references[name]
-                    assert name not in e.values
-                    try:
-                        e.values[name] = valspecs[ref].values['value']
-                    except KeyError:
-                        pass  # Empty LiteralSpecification
+    for e in elements.values():
+        for name, ref in list(e.references.items()):
+            # ValueSpecifications are always defined in 1:1 relationships
+            if type(ref) != list and ref in valspecs:
+                del e.references[name]
+                assert name not in e.values
+                try:
+                    e.values[name] = valspecs[ref].values['value']
+                except KeyError:
+                    pass  # Empty LiteralSpecification
 
 
-def version_0_14_0(elements, factory, gaphor_version):
+@migration((0, 14, 0), PRE, per_element=True)
+def version_0_14_0(et, elements, factory):
     """
     Fix applied stereotypes UML metamodel. Before Gaphor 0.14.0 applied
     stereotypes was a collection of stereotypes classes, but now the list
@@ -680,34 +1312,33 @@ def version_0_14_0(elements, factory, gaphor_version):
 
     This function is called before the actual elements are constructed.
     """
-    import uuid
-    if version_lower_than(gaphor_version, (0, 14, 0)):
-        values = (v for v in elements.values() if type(v) is parser.element)
-        for et in values:
-            try:
-                if 'appliedStereotype' in et.references:
-                    data = tuple(et.references['appliedStereotype'])
-                    applied = []
-                    # collect stereotypes instances in `applied` list
-                    for refid in data:
-                        st = elements[refid]
-                        obj = parser.element(str(uuid.uuid1()),
-                                             'InstanceSpecification')
-                        obj.references['classifier'] = [st.id]
-                        elements[obj.id] = obj
-                        applied.append(obj.id)
-
-                        assert obj.id in applied and obj.id in elements
-
-                    # replace stereotypes with their instances
-                    assert len(applied) == len(data)
-                    et.references['appliedStereotype'] = applied
+    if type(et) is not parser.element:
+        return
+    try:
+        if 'appliedStereotype' in et.references:
+            data = tuple(et.references['appliedStereotype'])
+            applied = []
+            # collect stereotypes instances in `applied` list
+            for refid in data:
+                st = elements[refid]
+                obj = parser.element(str(uuid.uuid1()),
+                                     'InstanceSpecification')
+                obj.references['classifier'] = [st.id]
+                elements[obj.id] = obj
+                applied.append(obj.id)
+
+                assert obj.id in applied and obj.id in elements
+
+            # replace stereotypes with their instances
+            assert len(applied) == len(data)
+            et.references['appliedStereotype'] = applied
 
-            except Exception as e:
-                log.error('Error while updating stereotypes', exc_info=True)
+    except Exception as e:
+        log.error('Error while updating stereotypes', exc_info=True)
 
 
-def version_0_9_0(elements, factory, gaphor_version):
+@migration((0, 9, 0), PRE, per_element=True)
+def version_0_9_0(elem, elements, factory):
     """
     Before 0.9.0, we used DiaCanvas2 as diagram widget in the GUI. As of 0.9.0
     Gaphas was introduced. Some properties of <item /> elements have changed,
@@ -715,53 +1346,61 @@ def version_0_9_0(elements, factory, gaphor_version):
 
     This function is called before the actual elements are constructed.
     """
-    if version_lower_than(gaphor_version, (0, 9, 0)):
-        for elem in elements.values():
-            try:
-                if type(elem) is parser.canvasitem:
-                    # Rename affine to matrix
-                    if elem.values.get('affine'):
-                        elem.values['matrix'] = elem.values['affine']
-                        del elem.values['affine']
-                    # No more 'color' attribute:
-                    if elem.values.get('color'):
-                        del elem.values['color']
+    try:
+        if type(elem) is parser.canvasitem:
+            # Rename affine to matrix
+            if elem.values.get('affine'):
+                elem.values['matrix'] = elem.values['affine']
+                del elem.values['affine']
+            # No more 'color' attribute:
+            if elem.values.get('color'):
+                del elem.values['color']
 
-            except Exception as e:
-                log.error('Error while updating from DiaCanvas2', exc_info=True)
+    except Exception as e:
+        log.error('Error while updating from DiaCanvas2', exc_info=True)
 
 
-def version_0_7_2(elements, factory, gaphor_version):
+@migration((0, 7, 2), PRE, per_element=True)
+def version_0_7_2(elem, elements, factory):
     """
     Before 0.7.2, only Property and Parameter elements had taggedValues.
     Since 0.7.2 all NamedElements are able to have taggedValues. However,
     the multiplicity of taggedValue has changed from 0..1 to *, so all elements
     should be converted to a list.
     """
-    import uuid
+    try:
+        if type(elem) is parser.element \
+                and elem.type in ('Property', 'Parameter') \
+                and elem.get('taggedValue'):
+            tvlist = []
+            tv = elements[elem.taggedValue]
+            if tv.value:
+                for t in map(str.strip, str(tv.value).split(',')):
+                    # log.debug("Tagged value: %s" % t)
+                    newtv = parser.element(str(uuid.uuid1()),
+                                           'LiteralSpecification')
+                    newtv.values['value'] = t
+                    elements[newtv.id] = newtv
+                    tvlist.append(newtv.id)
+                elem.references['taggedValue'] = tvlist
+    except Exception as e:
+        log.error('Error while updating taggedValues', exc_info=True)
 
-    if version_lower_than(gaphor_version, (0, 7, 2)):
-        for elem in elements.values():
-            try:
-                if type(elem) is parser.element \
-                        and elem.type in ('Property', 'Parameter') \
-                        and elem.taggedValue:
-                    tvlist = []
-                    tv = elements[elem.taggedValue]
-                    if tv.value:
-                        for t in map(str.strip, str(tv.value).split(',')):
-                            # log.debug("Tagged value: %s" % t)
-                            newtv = parser.element(str(uuid.uuid1()),
-                                                   'LiteralSpecification')
-                            newtv.values['value'] = t
-                            elements[newtv.id] = newtv
-                            tvlist.append(newtv.id)
-                        elem.references['taggedValue'] = tvlist
-            except Exception as e:
-                log.error('Error while updating taggedValues', exc_info=True)
-
-
-def version_0_7_1(elements, factory, gaphor_version):
+
+def _fix_navigability(end1, end2):
+    if isinstance(end2.type, uml2.Interface):
+        type = end1.interface_
+    else:  # isinstance(end2.type, uml2.Class):
+        type = end1.class_
+
+    # if the end of association is not navigable (in terms of UML 1.x)
+    # then set navigability to unknown (in terms of UML 2.0)
+    if not (type and end1 in type.ownedAttribute):
+        del end1.owningAssociation
+
+
+@migration((0, 7, 1), POST, per_element=True)
+def version_0_7_1(elem, elements, factory):
     """
     Before version 0.7.1, there were two states for association
     navigability (in terms of UML 2.0): unknown and navigable.
@@ -771,69 +1410,51 @@ def version_0_7_1(elements, factory, gaphor_version):
     In case of unknown navigability the Property.owningAssociation
     should not be set.
     """
-
-    def fix(end1, end2):
-        if isinstance(end2.type, uml2.Interface):
-            type = end1.interface_
-        else:  # isinstance(end2.type, uml2.Class):
-            type = end1.class_
-
-        # if the end of association is not navigable (in terms of UML 1.x)
-        # then set navigability to unknown (in terms of UML 2.0)
-        if not (type and end1 in type.ownedAttribute):
-            del end1.owningAssociation
-
-    if version_lower_than(gaphor_version, (0, 7, 1)):
-        log.info('Fix navigability of Associations (file version: %s)' % gaphor_version)
-        for elem in elements.values():
-            try:
-                if elem.type == 'Association':
-                    asc = elem.element
-                    end1 = asc.memberEnd[0]
-                    end2 = asc.memberEnd[1]
-                    if end1 and end2:
-                        fix(end1, end2)
-                        fix(end2, end1)
-            except Exception as e:
-                log.error('Error while updating Association', exc_info=True)
+    try:
+        if elem.type == 'Association':
+            asc = elem.element
+            end1 = asc.memberEnd[0]
+            end2 = asc.memberEnd[1]
+            if end1 and end2:
+                _fix_navigability(end1, end2)
+                _fix_navigability(end2, end1)
+    except Exception as e:
+        log.error('Error while updating Association', exc_info=True)
 
 
-def version_0_6_2(elements, factory, gaphor_version):
+@migration((0, 6, 2), PRE, per_element=True)
+def version_0_6_2(elem, elements, factory):
     """
     Before 0.6.2 an Interface could be represented by a ClassItem and
     a InterfaceItem. Now only InterfaceItems are used.
     """
-    if version_lower_than(gaphor_version, (0, 6, 2)):
-        for elem in elements.values():
-            try:
-                if type(elem) is parser.element and elem.type == 'Interface':
-                    for p_id in elem.presentation:
-                        p = elements[p_id]
-                        if p.type == 'ClassItem':
-                            p.type = 'InterfaceItem'
-                            p.values['drawing-style'] = '0'
-                        elif p.type == 'InterfaceItem':
-                            p.values['drawing-style'] = '2'
-            except Exception as e:
-                log.error('Error while updating InterfaceItems', exc_info=True)
+    try:
+        if type(elem) is parser.element and elem.type == 'Interface':
+            for p_id in elem.presentation:
+                p = elements[p_id]
+                if p.type == 'ClassItem':
+                    p.type = 'InterfaceItem'
+                    p.values['drawing-style'] = '0'
+                elif p.type == 'InterfaceItem':
+                    p.values['drawing-style'] = '2'
+    except Exception as e:
+        log.error('Error while updating InterfaceItems', exc_info=True)
 
 
-def version_0_5_2(elements, factory, gaphor_version):
+@migration((0, 5, 2), POST, per_element=True)
+def version_0_5_2(elem, elements, factory):
     """
     Before version 0.5.2, the wrong memberEnd of the association was
     holding the aggregation information.
     """
-    if version_lower_than(gaphor_version, (0, 5, 2)):
-        log.info('Fix composition on Associations (file version: %s)' % gaphor_version)
-        for elem in elements.values():
-            try:
-                if elem.type == 'Association':
-                    a = elem.element
-                    agg1 = a.memberEnd[0].aggregation
-                    agg2 = a.memberEnd[1].aggregation
-                    a.memberEnd[0].aggregation = agg2
-                    a.memberEnd[1].aggregation = agg1
-            except Exception as e:
-                log.error('Error while updating Association', exc_info=True)
+    try:
+        if elem.type == 'Association':
+            a = elem.element
+            agg1 = a.memberEnd[0].aggregation
+            agg2 = a.memberEnd[1].aggregation
+            a.memberEnd[0].aggregation = agg2
+            a.memberEnd[1].aggregation = agg1
+    except Exception as e:
+        log.error('Error while updating Association', exc_info=True)
 
 # vim: sw=4:et:ai
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unittest the element index.
+"""
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+
+from gaphor.tests.testcase import TestCase
+from gaphor.UML import uml2
+from gaphor.storage import storage, journal, index
+from gaphor.storage.parser import ParserException
+from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.diagram import items
+
+
+class IndexTestCase(TestCase):
+
+    def setUp(self):
+        super(IndexTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'model.gaphor')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(IndexTestCase, self).tearDown()
+
+    def save_model(self):
+        entries = []
+        with open(self.filename, 'w') as f:
+            storage.save(XMLWriter(f), factory=self.element_factory, index=entries)
+        index.save(self.filename, entries, '0.1')
+
+    def create_model(self):
+        package = self.element_factory.create(uml2.Package)
+        package.name = 'Package'
+        klass = self.create(items.ClassItem, uml2.Class)
+        klass.subject.name = 'Class'
+        klass.subject.package = package
+        attribute = self.element_factory.create(uml2.Property)
+        attribute.name = 'attr'
+        klass.subject.ownedAttribute = attribute
+        return package, klass.subject, attribute
+
+    def test_select(self):
+        package, klass, attribute = self.create_model()
+        self.save_model()
+
+        with index.ModelIndex(self.filename) as model_index:
+            self.assertEquals([klass.id], model_index.select(uml2.Class))
+            self.assertEquals('Property', model_index.type(attribute.id))
+            assert package.id in model_index
+            self.assertEquals(list(self.element_factory.keys()), model_index.ids())
+
+    def test_load(self):
+        package, klass, attribute = self.create_model()
+        klass_id, attribute_id, package_id = klass.id, attribute.id, package.id
+        self.save_model()
+        self.element_factory.flush()
+
+        with index.ModelIndex(self.filename) as model_index:
+            loaded = model_index.load(self.element_factory, [klass_id])
+
+        self.assertEquals(1, len(loaded))
+        klass = loaded[0]
+        self.assertEquals('Class', klass.name)
+        # Owned attributes are loaded, the package is not
+        self.assertEquals(['attr'], [a.name for a in klass.ownedAttribute])
+        self.assertEquals(attribute_id, klass.ownedAttribute[0].id)
+        assert klass.package is None
+        assert self.element_factory.lookup(package_id) is None
+
+    def test_journal(self):
+        tracker = journal.ChangeTracker(self.element_factory)
+        tracker.register(self.get_service('component_registry'))
+        try:
+            package, klass, attribute = self.create_model()
+            self.save_model()
+            tracker.reset()
+
+            klass.name = 'Renamed'
+            # The package owns the class, so it would be deleted as well
+            del klass.package
+            package_id = package.id
+            package.unlink()
+            journal.append(self.filename, *tracker.changes())
+        finally:
+            tracker.unregister(self.get_service('component_registry'))
+
+        with index.ModelIndex(self.filename) as model_index:
+            assert package_id not in model_index
+            assert klass.id in model_index
+            element = model_index.element(klass.id)
+            self.assertEquals('Renamed', element.values['name'])
+            assert 'package' not in element.references
+
+    def test_out_of_date(self):
+        self.create_model()
+        self.save_model()
+        os.utime(self.filename, (0, 0))
+
+        self.assertRaises(ParserException, index.ModelIndex, self.filename)
+
+    def test_remove(self):
+        self.create_model()
+        self.save_model()
+        assert index.exists(self.filename)
+
+        index.remove(self.filename)
+        assert not index.exists(self.filename)
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unittest the save journal.
+"""
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+from gaphor.tests.testcase import TestCase
+from gaphor.UML import uml2
+from gaphor.storage import storage, journal
+from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.diagram import items
+
+
+class JournalTestCase(TestCase):
+
+    def setUp(self):
+        super(JournalTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'model.gaphor')
+        self.tracker = journal.ChangeTracker(self.element_factory)
+        self.tracker.register(self.get_service('component_registry'))
+
+    def tearDown(self):
+        self.tracker.unregister(self.get_service('component_registry'))
+        shutil.rmtree(self.tmpdir)
+        super(JournalTestCase, self).tearDown()
+
+    def save_xml(self):
+        f = StringIO()
+        storage.save(XMLWriter(f), factory=self.element_factory)
+        data = f.getvalue()
+        f.close()
+        return data
+
+    def save_model(self):
+        with open(self.filename, 'w') as f:
+            f.write(self.save_xml())
+        self.tracker.reset()
+
+    def save_journal(self):
+        journal.append(self.filename, *self.tracker.changes())
+        self.tracker.reset()
+
+    def test_changes(self):
+        klass = self.create(items.ClassItem, uml2.Class)
+        package = self.element_factory.create(uml2.Package)
+        self.tracker.reset()
+        self.assertEquals(([], []), self.tracker.changes())
+
+        klass.subject.name = 'Name'
+        assert klass.subject in self.tracker.changes()[0]
+        assert package not in self.tracker.changes()[0]
+
+        # Changing an item changes its diagram
+        self.tracker.reset()
+        klass.matrix.translate(10, 10)
+        self.diagram.canvas.request_matrix_update(klass)
+        self.assertEquals(([self.diagram], []), self.tracker.changes())
+
+        self.tracker.reset()
+        package_id = package.id
+        package.unlink()
+        self.assertEquals([package_id], self.tracker.changes()[1])
+
+    def test_replay(self):
+        klass = self.create(items.ClassItem, uml2.Class)
+        klass.subject.name = 'Class'
+        self.save_model()
+
+        klass.subject.name = 'Renamed'
+        comment = self.create(items.CommentItem, uml2.Comment)
+        comment.subject.body = 'Comment'
+        self.save_journal()
+        assert not self.tracker.changes()[0]
+
+        # Unlinking an item clears its subject
+        subject = comment.subject
+        comment.unlink()
+        subject.unlink()
+        self.save_journal()
+
+        klass_id = klass.subject.id
+        data = self.save_xml()
+        self.element_factory.flush()
+        storage.load(self.filename, self.element_factory)
+
+        assert self.element_factory.lookup(subject.id) is None
+        self.assertEquals('Renamed', self.element_factory.lookup(klass_id).name)
+        self.assertEquals(data, self.save_xml())
+
+    def test_incomplete_entry(self):
+        klass = self.create(items.ClassItem, uml2.Class)
+        self.save_model()
+
+        klass.subject.name = 'Class'
+        self.save_journal()
+        data = self.save_xml()
+
+        klass.subject.name = 'Lost'
+        self.save_journal()
+        with open(journal.journal_filename(self.filename), 'rb+') as f:
+            f.truncate(os.path.getsize(f.name) - 4)
+
+        self.element_factory.flush()
+        storage.load(self.filename, self.element_factory)
+        self.assertEquals(data, self.save_xml())
+
+    def test_journal_of_other_model_file(self):
+        klass = self.create(items.ClassItem, uml2.Class)
+        klass.subject.name = 'Class'
+        self.save_model()
+        data = self.save_xml()
+
+        klass.subject.name = 'Renamed'
+        self.save_journal()
+        os.utime(self.filename, (0, 0))
+
+        self.element_factory.flush()
+        storage.load(self.filename, self.element_factory)
+        self.assertEquals(data, self.save_xml())
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unittest the model file parser.
+"""
+
+from __future__ import absolute_import
+import gzip
+import unittest
+from cStringIO import StringIO
+
+from gaphor.storage import parser, compress
+
+MODEL = """<?xml version="1.0" encoding="utf-8"?>
+<gaphor xmlns="http://gaphor.sourceforge.net/model" version="3.0" gaphor-version="0.17.2">
+<Package id="1">
+<name><val>model</val></name>
+<ownedDiagram><reflist><ref refid="2"/></reflist></ownedDiagram>
+</Package>
+<Diagram id="2">
+<package><ref refid="1"/></package>
+<canvas>
+<item id="3" type="ClassItem">
+<subject><ref refid="4"/></subject>
+</item>
+</canvas>
+</Diagram>
+<Class id="4">
+<name><val>A &amp; B</val></name>
+</Class>
+</gaphor>
+"""
+
+
+class ParserTestCase(unittest.TestCase):
+
+    def test_parse(self):
+        elements = parser.parse(StringIO(MODEL))
+        assert list(elements.keys()) == ['1', '2', '3', '4']
+        assert elements['1'].values['name'] == 'model'
+        assert elements['1'].references['ownedDiagram'] == ['2']
+        assert elements['2'].references['package'] == '1'
+        assert elements['2'].canvas.canvasitems == [elements['3']]
+        assert elements['3'].references['subject'] == '4'
+        assert elements['4'].values['name'] == 'A & B'
+
+    def test_duplicate_id(self):
+        model = MODEL.replace('<Class id="4">', '<Class id="1">')
+        self.assertRaises(AssertionError, parser.parse, StringIO(model))
+
+    def test_pop_completed(self):
+        loader = parser.GaphorLoader()
+        completed = []
+        for percentage in parser.parse_generator(StringIO(MODEL), loader):
+            completed.extend(loader.pop_completed())
+        assert loader.gaphor_version == '0.17.2'
+        assert [e.id for e in completed] == ['1', '2', '4']
+        assert completed[1].canvas.canvasitems[0].id == '3'
+        assert loader.pop_completed() == []
+
+    def gzip_model(self, data=MODEL):
+        f = StringIO()
+        out = gzip.GzipFile(fileobj=f, mode='wb')
+        out.write(data)
+        out.close()
+        return f.getvalue()
+
+    def test_parse_gzip(self):
+        data = self.gzip_model()
+        elements = parser.parse(StringIO(data))
+        assert list(elements.keys()) == ['1', '2', '3', '4']
+        assert elements['4'].values['name'] == 'A & B'
+
+        # Concatenated gzip streams are read as one
+        data = self.gzip_model(MODEL[:100]) + self.gzip_model(MODEL[100:])
+        assert list(parser.parse(StringIO(data)).keys()) == ['1', '2', '3', '4']
+
+    def test_gzip_progress(self):
+        data = self.gzip_model(MODEL + '<!--%s-->' % ('x' * 10000))
+        input = compress.decompress(StringIO(data))
+        assert isinstance(input, compress.DecompressFile)
+
+        fed = []
+
+        class Output(object):
+            feed = fed.append
+
+        progress = list(parser.ProgressGenerator(input, Output(), block_size=16))
+        # Progress is measured on the compressed data
+        assert progress == sorted(progress)
+        assert progress[-1] == 100
+        assert ''.join(fed).startswith(MODEL)
+
+    def test_not_compressed(self):
+        input = StringIO(MODEL)
+        assert compress.decompress(input) is input
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License
+# more details.
+#
+# You should have received a copy of the GNU Library General Public
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unittest the binary snapshot format.
+"""
+
+from __future__ import absolute_import
+from cStringIO import StringIO
+
+from gaphor.tests.testcase import TestCase
+from gaphor.UML import uml2
+from gaphor.storage import storage, parser, snapshot
+from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.diagram import items
+
+
+class SnapshotTestCase(TestCase):
+
+    def save_snapshot(self):
+        f = StringIO()
+        snapshot.save(f, factory=self.element_factory)
+        data = f.getvalue()
+        f.close()
+        return data
+
+    def save_xml(self):
+        f = StringIO()
+        storage.save(XMLWriter(f), factory=self.element_factory)
+        data = f.getvalue()
+        f.close()
+        return data
+
+    def test_is_snapshot(self):
+        data = self.save_snapshot()
+        assert data.startswith(snapshot.SNAPSHOT_MAGIC)
+        assert snapshot.is_snapshot(StringIO(data))
+        assert not snapshot.is_snapshot(StringIO(self.save_xml()))
+
+    def test_parse_same_as_xml(self):
+        """
+        A snapshot contains the same content as the XML file.
+        """
+        p = self.element_factory.create(uml2.Package)
+        p.name = 'Package'
+        self.diagram.package = p
+        klass = self.create(items.ClassItem, uml2.Class)
+        klass.subject.name = 'Class'
+        klass.subject.package = p
+        klass.subject.isAbstract = True
+        attr = self.element_factory.create(uml2.Property)
+        attr.name = 'attr'
+        attr.typeValue = 'int'
+        klass.subject.ownedAttribute = attr
+
+        xml = parser.parse(StringIO(self.save_xml()))
+        snap = snapshot.parse(StringIO(self.save_snapshot()))
+
+        self.assertEquals(list(xml.keys()), list(snap.keys()))
+        for id, elem in xml.items():
+            self.assertEquals(elem.type, snap[id].type)
+            self.assertEquals(elem.values, snap[id].values)
+            self.assertEquals(elem.references, snap[id].references)
+
+        canvas = snap[self.diagram.id].canvas
+        assert canvas
+        self.assertEquals([klass.id], [c.id for c in canvas.canvasitems])
+
+    def test_load(self):
+        """
+        Snapshots are loaded by storage.load().
+        """
+        self.element_factory.create(uml2.Package)
+        iface = self.create(items.InterfaceItem, uml2.Interface)
+        iface.subject.name = 'Circus'
+        iface.matrix.translate(10, 10)
+        xml = self.save_xml()
+
+        data = self.save_snapshot()
+        self.element_factory.flush()
+        assert not list(self.element_factory.select())
+        storage.load(StringIO(data), factory=self.element_factory)
+
+        assert len(self.element_factory.lselect()) == 3
+        iface = self.element_factory.lselect(lambda e: e.isKindOf(uml2.Interface))[0]
+        assert iface.name == 'Circus'
+        assert len(iface.presentation) == 1
+        assert tuple(iface.presentation[0].matrix) == (1, 0, 0, 1, 10, 10), tuple(iface.presentation[0].matrix)
+
+        self.assertEquals(xml, self.save_xml())
+
+    def test_invalid(self):
+        self.assertRaises(parser.ParserException, snapshot.parse,
+                          StringIO('GAPHORB\0\x63\x00'))
+
+    def test_corrupt(self):
+        """
+        Truncated or damaged snapshots are reported as invalid.
+        """
+        klass = self.create(items.ClassItem, uml2.Class)
+        klass.subject.name = 'Class'
+        data = self.save_snapshot()
+
+        for size in range(len(data)):
+            self.assertRaises(parser.ParserException, snapshot.parse,
+                              StringIO(data[:size]))
+
+        # A reference list that is longer than the file
+        records = snapshot._header.pack(snapshot.SNAPSHOT_MAGIC, snapshot.SNAPSHOT_VERSION) + \
+            snapshot._record.pack(snapshot.ELEMENT, 0, 0) + \
+            snapshot._record.pack(snapshot.REFLIST, 1, 0x7fffffff) + chr(snapshot.END)
+        damaged = records + snapshot._string_table(['0.17']) + \
+            snapshot._string_table(['Class', 'ownedAttribute']) + \
+            snapshot._string_table(['1']) + snapshot._uint.pack(len(records))
+        self.assertRaises(parser.ParserException, snapshot.parse, StringIO(damaged))
+
+# vim:sw=4:et:ai
@@ -30,7 +30,7 @@ import os.path
 import pkg_resources
 from gaphor.tests.testcase import TestCase
 from gaphor.UML import uml2
-from gaphor.storage import storage
+from gaphor.storage import storage, parser
 from gaphor.misc.xmlwriter import XMLWriter
 from gaphor.diagram import items
 from cStringIO import StringIO
@@ -65,6 +65,16 @@ class StorageTestCase(TestCase):
         self.assertFalse(version_lower_than('0.16.b1', (0, 15, 0)))
         self.assertFalse(version_lower_than('0.15.0.b2', (0, 14, 99)))
 
+    def test_select_migrations(self):
+        self.assertEquals([], storage.select_migrations('0.17.2'))
+        self.assertEquals([], storage.select_migrations(None))
+        self.assertEquals(['version_0_15_0_pre', 'version_0_15_0_post', 'version_0_17_0'],
+                          [m.name for m in storage.select_migrations('0.14.0')])
+        migrations = storage.select_migrations('0.5.0')
+        self.assertEquals(len(storage.MIGRATIONS), len(migrations))
+        versions = [m.version for m in migrations]
+        self.assertEquals(sorted(versions), versions)
+
     def test_save_uml(self):
         """Saving gaphor.uml2 model elements.
         """
@@ -97,6 +107,55 @@ class StorageTestCase(TestCase):
         assert '<canvas>' in out.data
         assert ' type="CommentItem" ' in out.data, out.data
 
+    def test_save_frozen(self):
+        """Save a snapshot of the model, taken by freeze().
+        """
+        diagram = self.element_factory.create(uml2.Diagram)
+        comment = diagram.create(items.CommentItem, subject=self.element_factory.create(uml2.Comment))
+        comment.subject.body = 'Comment & more'
+
+        out = StringIO()
+        entries = []
+        storage.save(XMLWriter(out), factory=self.element_factory, index=entries)
+
+        frozen = storage.freeze(self.element_factory)
+        # Changes made after the snapshot has been taken are not saved
+        comment.subject.body = 'Changed'
+        self.element_factory.create(uml2.Class)
+
+        frozen_out = StringIO()
+        frozen_entries = []
+        for x in storage.save_frozen_generator(XMLWriter(frozen_out, buffered=True), frozen, frozen_entries):
+            pass
+
+        self.assertEquals(out.getvalue(), frozen_out.getvalue())
+        self.assertEquals(entries, frozen_entries)
+
+    def test_update_frozen(self):
+        """Elements changed after they have been frozen are frozen again.
+        """
+        diagram = self.element_factory.create(uml2.Diagram)
+        comment = diagram.create(items.CommentItem, subject=self.element_factory.create(uml2.Comment))
+        comment.subject.body = 'Comment'
+
+        frozen = storage.freeze(self.element_factory)
+        # Unlinking the diagram clears the subject of its items
+        subject = comment.subject
+        subject.body = 'Changed'
+        klass = self.element_factory.create(uml2.Class)
+        deleted = diagram.id
+        diagram.unlink()
+        frozen.update([e for e in (subject, klass) if self.element_factory.lookup(e.id)],
+                      [id for id in (deleted, subject.id) if not self.element_factory.lookup(id)])
+
+        out = StringIO()
+        storage.save(XMLWriter(out), factory=self.element_factory)
+        frozen_out = StringIO()
+        for x in storage.save_frozen_generator(XMLWriter(frozen_out), frozen):
+            pass
+
+        self.assertEquals(out.getvalue(), frozen_out.getvalue())
+
     def test_load_uml(self):
         """
         Test loading of a freshly saved model.
@@ -157,6 +216,164 @@ class StorageTestCase(TestCase):
         assert d1
         # print d1, d1.subject
 
+    def test_load_lazy(self):
+        """
+        The canvas items of a lazily loaded diagram are created when they
+        are needed.
+        """
+        self.create(items.CommentItem, uml2.Comment)
+        self.create(items.ClassItem, uml2.Class)
+
+        data = self.save()
+        storage.load(StringIO(data), factory=self.element_factory, lazy=True)
+
+        d = self.element_factory.lselect(lambda e: e.isKindOf(uml2.Diagram))[0]
+        comment = self.element_factory.lselect(lambda e: e.isKindOf(uml2.Comment))[0]
+        assert d.canvas_deferred
+        assert comment in self.element_factory.lselect()
+
+        assert len(comment.presentation) == 1
+        assert not d.canvas_deferred
+        assert len(d.canvas.get_all_items()) == 2
+        assert comment.presentation[0] in d.canvas.get_all_items()
+        assert comment.presentation[0].subject is comment
+        # The references of the created items are indexed
+        assert (comment.presentation[0], uml2.Presentation.subject) in \
+                self.element_factory.referrers(comment)
+
+        self.assertEquals(data, self.save())
+
+    def save_xml(self):
+        out = StringIO()
+        storage.save(XMLWriter(out), factory=self.element_factory)
+        return out.getvalue()
+
+    def test_save_lazy(self):
+        """
+        A lazily loaded diagram is saved without creating its canvas items.
+        """
+        self.create(items.CommentItem, uml2.Comment)
+        self.create(items.ClassItem, uml2.Class)
+
+        storage.load(StringIO(self.save()), factory=self.element_factory, lazy=True)
+        d = self.element_factory.lselect(lambda e: e.isKindOf(uml2.Diagram))[0]
+        data = self.save_xml()
+        assert d.canvas_deferred
+
+        self.load(data)
+        comment = self.element_factory.lselect(lambda e: e.isKindOf(uml2.Comment))[0]
+        assert len(self.diagram.canvas.get_all_items()) == 2
+        assert comment.presentation[0].subject is comment
+
+    def test_save_lazy_unchanged(self):
+        """
+        A lazily loaded model that has not been edited is saved as it was
+        read.
+        """
+        self.create(items.CommentItem, uml2.Comment).subject.body = 'A & B'
+        klass = self.create(items.ClassItem, uml2.Class)
+        klass.subject.name = 'Class'
+        klass.matrix.translate(10, 20)
+        iface = self.create(items.InterfaceItem, uml2.Interface)
+        other = self.element_factory.create(uml2.Diagram)
+        other.create(items.ClassItem, subject=klass.subject)
+        other.create(items.InterfaceItem, subject=iface.subject)
+
+        data = self.save()
+        storage.load(StringIO(data), factory=self.element_factory, lazy=True)
+        self.assertEquals(data, self.save_xml())
+        assert all(d.canvas_deferred for d in self.element_factory.select(lambda e: e.isKindOf(uml2.Diagram)))
+
+    def test_unlink_lazy(self):
+        """
+        Removing an item from a lazy presentation collection does not
+        create the items of the other diagrams.
+        """
+        comment = self.create(items.CommentItem, uml2.Comment).subject
+        other = self.element_factory.create(uml2.Diagram)
+        other.create(items.CommentItem, subject=comment)
+
+        storage.load(StringIO(self.save()), factory=self.element_factory, lazy=True)
+        d1, d2 = self.element_factory.lselect(lambda e: e.isKindOf(uml2.Diagram))
+        d1.canvas.get_all_items()[0].unlink()
+
+        assert d2.canvas_deferred
+        assert len(self.element_factory.lselect(lambda e: e.isKindOf(uml2.Comment))[0].presentation) == 1
+
+    def test_load_truncated(self):
+        """
+        A model file that can not be loaded completely leaves no partly
+        loaded model behind.
+        """
+        self.create(items.CommentItem, uml2.Comment)
+        self.create(items.ClassItem, uml2.Class)
+        data = self.save()
+
+        self.assertRaises(Exception, storage.load,
+                          StringIO(data[:len(data) * 2 / 3]), factory=self.element_factory)
+        self.assertEquals([], self.element_factory.lselect())
+
+    def test_load_include(self):
+        """
+        Load only a package, the elements it owns and placeholders for the
+        elements they refer to.
+        """
+        factory = self.element_factory
+        model = factory.create(uml2.Package)
+        model.name = 'Model'
+        sub = factory.create(uml2.Package)
+        sub.name = 'Sub'
+        sub.package = model
+        a = factory.create(uml2.Class)
+        a.name = 'A'
+        a.package = sub
+        b = factory.create(uml2.Class)
+        b.name = 'B'
+        b.package = model
+        other = factory.create(uml2.Package)
+        other.name = 'Other'
+        self.diagram.name = 'D'
+        self.diagram.package = sub
+        self.create(items.ClassItem, subject=b)
+
+        data = self.save()
+        for include in ([('Model', 'Sub')], ['Model::Sub'], [sub.id]):
+            storage.load(StringIO(data), factory=factory, include=include)
+
+            names = sorted(e.name for e in factory.select())
+            self.assertEquals(['A', 'B', 'D', 'Model', 'Sub'], names)
+
+            # B is shown on diagram D, its package is a placeholder
+            b = factory.lselect(lambda e: e.name == 'B')[0]
+            assert b.package.name == 'Model'
+            assert b.package.nestedPackage[0].name == 'Sub'
+            assert len(b.presentation) == 1
+            d = factory.lselect(lambda e: e.isKindOf(uml2.Diagram))[0]
+            assert b.presentation[0] in d.canvas.get_all_items()
+            assert d.package.name == 'Sub'
+            assert d.package.package.name == 'Model'
+            assert not d.package.package.package
+
+    def test_load_include_unresolved(self):
+        """
+        Include entries that select no element are reported and the
+        current model is kept.
+        """
+        factory = self.element_factory
+        model = factory.create(uml2.Package)
+        model.name = 'Model'
+        data = self.save_xml()
+        elements = factory.lselect()
+
+        try:
+            storage.load(StringIO(data), factory=factory,
+                         include=['Model', 'Modle', ('Model', 'Sub')])
+        except parser.ParserException as e:
+            assert 'Modle, Model::Sub' in str(e), str(e)
+        else:
+            self.fail('ParserException not raised')
+        self.assertEquals(set(elements), set(factory.lselect()))
+
     def test_load_with_whitespace_name(self):
         difficult_name = '    with space before and after  '
         diagram = self.element_factory.lselect()[0]
@@ -308,6 +525,9 @@ class FileUpgradeTestCase(TestCase):
         with open(path) as ifile:
             storage.load(ifile, factory=self.element_factory)
 
+        assert 'version_0_15_0_pre' in storage.migration_timings
+        assert 'version_0_15_0_post' in storage.migration_timings
+
         diagrams = list(self.kindof(uml2.Diagram))
         self.assertEquals(1, len(diagrams))
         diagram = diagrams[0]
@@ -38,8 +38,11 @@ def orphan_references(factory):
     saved, but I have no means to correct or fix the model.
     """
 
-    # Maintain a set of id's, one for elements, one for references.
-    # Write only to file if references is a subset of elements
+    # Maintain a set of id's, one for canvas items, one for references.
+    # Write only to file if references are canvas items or are in the
+    # element factory.
+    # References between model elements are maintained by the factory,
+    # only the canvas items have to be visited.
 
     refs = set()
     elements = set()
@@ -93,11 +96,16 @@ def orphan_references(factory):
         elif isinstance(value, uml2.Element):
             verify_reference(name, value)
 
-    for e in factory.values():
-        assert e.id
-        elements.add(e.id)
-        e.save(verify_element)
+    # Items of diagrams that are not loaded yet can not have been changed
+    for d in factory.select_type(uml2.Diagram):
+        if not d.canvas_deferred:
+            verify_element('canvas', d.canvas)
 
-    return [r[1] for r in refs if not r[0] in elements]
+    lookup = factory.lookup
+    for value in factory.referenced():
+        if value.id and lookup(value.id) is None:
+            refs.add((value.id, value))
+
+    return [r[1] for r in refs if r[0] not in elements and lookup(r[0]) is None]
 
 # vim:sw=4:et:ai
@@ -21,7 +21,8 @@
 from __future__ import absolute_import
 from __future__ import print_function
 import gaphor
-from gaphor.storage import storage
+from gaphor.storage import storage, snapshot, index
+from gaphor.misc.xmlwriter import XMLWriter
 import gaphor.UML as UML
 
 from gaphas.painter import ItemPainter
@@ -45,6 +46,36 @@ def pkg2dir(package):
     return '/'.join(name)
 
 
+def save_model(model):
+    """
+    Save the loaded model in the model file format selected by the user.
+    """
+    name = os.path.splitext(os.path.basename(model))[0]
+    odir = options.dir or os.path.dirname(model) or '.'
+    outfilename = '%s/%s.%s' % (odir, name, options.format)
+    # A model file is saved again if its index has to be written
+    if outfilename == model and not (options.index and options.format == 'gaphor'):
+        message('skipping %s: it is already in %s format' % (model, options.format))
+        return
+
+    if not os.path.exists(odir):
+        message('creating dir %s' % odir)
+        os.makedirs(odir)
+
+    message('saving: %s -> %s...' % (model, outfilename))
+    if options.format == 'gaphorb':
+        with open(outfilename, 'wb') as out:
+            snapshot.save(out, factory)
+    else:
+        entries = [] if options.index else None
+        with open(outfilename, 'w') as out:
+            storage.save(XMLWriter(out, buffered=True), factory, index=entries)
+        if options.index:
+            index.save(outfilename, entries, gaphor.Application.distribution.version)
+        else:
+            index.remove(outfilename)
+
+
 def message(msg):
     """
     Print message if user set verbose mode.
@@ -65,8 +96,11 @@ parser.add_option('-u', '--use-underscores', dest='underscores', action='store_t
 parser.add_option('-d', '--dir', dest='dir', metavar='directory',
     help='output to directory')
 parser.add_option('-f', '--format', dest='format', metavar='format',
-    help='output file format, default pdf', default='pdf',
-    choices=['pdf', 'svg', 'png'])
+    help='output file format, default pdf; gaphor and gaphorb convert the' \
+    ' model itself to XML or binary snapshot format', default='pdf',
+    choices=['pdf', 'svg', 'png', 'gaphor', 'gaphorb'])
+parser.add_option('-i', '--index', dest='index', action='store_true',
+    help='write an element index next to models saved in gaphor format')
 parser.add_option('-r', '--regex', dest='regex', metavar='regex',
     help='process diagrams which name matches given regular expresion;' \
     ' name includes package name; regular expressions are case insensitive')
@@ -89,9 +123,14 @@ if options.regex:
 for model in args:
     message('loading model %s' % model)
     storage.load(model, factory)
+
+    if options.format in ('gaphor', 'gaphorb'):
+        save_model(model)
+        continue
+
     message('\nready for rendering\n')
 
-    for diagram in factory.select(lambda e: e.isKindOf(UML.Diagram)):
+    for diagram in factory.select_type(UML.Diagram):
         odir = pkg2dir(diagram.package)
 
         # just diagram name
@@ -26,13 +26,14 @@ from gaphor.interfaces import IActionProvider
 from gaphor.ui.interfaces import IUIComponent
 from gaphor.action import action, open_action, build_action_group
 from gaphor.misc.console import GTKInterpreterConsole
-from gaphor.misc import get_user_data_dir
+from gaphor.misc import get_user_data_dir, eventprofile
 
 class ConsoleWindow(object):
     
     interface.implements(IUIComponent, IActionProvider)
 
     component_registry = inject('component_registry')
+    element_dispatcher = inject('element_dispatcher')
 
     menu_xml = """
         <ui>
@@ -84,10 +85,23 @@ class ConsoleWindow(object):
 
     def construct(self):
         console = GTKInterpreterConsole(locals={
-                'service': self.component_registry.get_service
+                'service': self.component_registry.get_service,
+                'start_profiling': self.start_profiling,
+                'stop_profiling': self.stop_profiling,
                 })
         console.show()
         self.console = console
         return console
 
+    def start_profiling(self):
+        """
+        Profile the event handlers of the component registry and the
+        element dispatcher. The gaphor.misc.eventprofile.HandlerProfile is
+        returned.
+        """
+        return eventprofile.start(self.component_registry, self.element_dispatcher)
+
+    def stop_profiling(self):
+        eventprofile.stop(self.component_registry, self.element_dispatcher)
+
 # vim:sw=4:et:ai
@@ -334,7 +334,7 @@ class NamespaceModel(gtk.GenericTreeModel):
 
 
     def _build_model(self):
-        toplevel = self.factory.select(lambda e: isinstance(e, uml2.Namespace) and not e.namespace)
+        toplevel = self.factory.select_type(uml2.Namespace, lambda e: not e.namespace)
 
         for element in toplevel:
             self._add_elements(element)
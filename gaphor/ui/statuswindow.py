@@ -33,18 +33,20 @@ class StatusWindow(object):
     with a label and a progress bar.  The progress bar is updated as the 
     queue is updated."""
     
-    def __init__(self, title, message, parent=None, queue=None, display=True):
+    def __init__(self, title, message, parent=None, queue=None, display=True, modal=True):
         """Create the status window.  The title parameter is the title of the
         window.  The message parameter is a string displayed near the progress
         bar to indicate what is happening.  The parent parameter is the
         parent window to display the window in.  The queue parameter is a
         queue that is used to update the progress bar.  The display parameter
-        will display the window if true.  This is the default."""
+        will display the window if true.  This is the default.  The modal
+        parameter makes the window modal, which is also the default."""
         
         self.title = title
         self.message = message
         self.parent = parent
         self.queue = queue
+        self.modal = modal
         
         self.init_window()
         
@@ -65,7 +67,7 @@ class StatusWindow(object):
         self.window.set_title(self.title)
         self.window.set_position(gtk.WIN_POS_CENTER_ON_PARENT)
         self.window.set_transient_for(self.parent)
-        self.window.set_modal(True)
+        self.window.set_modal(self.modal)
         self.window.set_resizable(False)
         self.window.set_decorated(False)
         self.window.set_type_hint(gtk.gdk.WINDOW_TYPE_HINT_SPLASHSCREEN)
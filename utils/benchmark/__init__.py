@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Small benchmark scripts for the Gaphor data model and storage layer.
+
+Each module can be run on its own, e.g.:
+    python -m utils.benchmark.factory_scaling
+
+The helpers in this module take care of timing and reporting.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import time
+
+__all__ = ['timed', 'report']
+
+
+def timed(func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) and return a tuple (seconds, result).
+    """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+def report(title, header, rows):
+    """
+    Print a simple table. Header is a sequence of column names, rows is a
+    sequence of tuples with values.
+    """
+    print(title)
+    print('  '.join('%14s' % h for h in header))
+    for row in rows:
+        print('  '.join(isinstance(v, float) and '%14.4f' % v or '%14s' % (v,)
+                        for v in row))
+    print()
+
+# vim:sw=4:et:ai
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measure the cost of reading derived unions after a single edit in a large
+model.
+
+A model of 50k elements (packages, classes and properties) is created. After
+a single edit all derived unions are read again: Namespace.ownedMember
+for all namespaces and Property.isComposite for all properties. Only the
+edited elements should need to compute their unions again.
+
+This can be called as:
+    python -m utils.benchmark.derived_cache [size]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+
+from gaphor.UML import uml2
+from gaphor.UML.elementfactory import ElementFactory
+from utils.benchmark import timed, report
+
+SIZE = 50000
+
+# Every package contains 4 classes with 5 properties each
+CLASSES, PROPERTIES = 4, 5
+
+
+def create_model(factory, size):
+    packages = []
+    for i in range(size // (1 + CLASSES * (1 + PROPERTIES))):
+        p = factory.create(uml2.Package)
+        packages.append(p)
+        for j in range(CLASSES):
+            c = factory.create(uml2.Class)
+            c.package = p
+            for k in range(PROPERTIES):
+                c.ownedAttribute = factory.create(uml2.Property)
+    return packages
+
+
+def read_all(namespaces, properties):
+    for n in namespaces:
+        n.ownedMember
+    for p in properties:
+        p.isComposite
+
+
+def run(size=SIZE):
+    factory = ElementFactory()
+    packages = create_model(factory, size)
+    namespaces = factory.lselect(lambda e: isinstance(e, uml2.Namespace))
+    properties = factory.lselect(lambda e: isinstance(e, uml2.Property))
+    c = packages[0].ownedClassifier[0]
+    p = properties[0]
+
+    def rename():
+        c.name = 'renamed'
+
+    def set_aggregation():
+        p.aggregation = 'composite'
+
+    def move_class():
+        c.package = packages[-1]
+
+    rows = []
+    timed(read_all, namespaces, properties)
+    for title, edit in (('none', lambda: None),
+                        ('rename', rename),
+                        ('aggregation', set_aggregation),
+                        ('move class', move_class)):
+        t_edit, _ = timed(edit)
+        t_read, _ = timed(read_all, namespaces, properties)
+        rows.append((title, t_edit, t_read))
+    report('Read derived unions of %d elements after an edit' % factory.size(),
+           ('edit', 'edit (s)', 'read (s)'),
+           rows)
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:2]])
+
+# vim:sw=4:et:ai
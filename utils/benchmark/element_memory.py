@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Report the memory used per model element.
+
+Elements are created in an ElementFactory, as is done when a model is
+loaded. Half of the elements are classes with a name, in a package, the
+other half are their attributes. The process' peak memory (RSS) is
+compared before and after creation.
+
+This can be called as:
+    python -m utils.benchmark.element_memory [size]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import gc
+import resource
+import sys
+
+from gaphor.UML import uml2
+from gaphor.UML.elementfactory import ElementFactory
+from utils.benchmark import report
+
+SIZE = 100000
+
+
+def maxrss():
+    """
+    Peak memory usage in bytes.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, Mac OS X bytes
+    if sys.platform != 'darwin':
+        rss *= 1024
+    return rss
+
+
+def create_model(factory, size):
+    create_as = factory.create_as
+    package = create_as(uml2.Package, 'package')
+    for i in range(size // 2):
+        c = create_as(uml2.Class, 'class%d' % i)
+        c.name = 'Class%d' % i
+        c.package = package
+        a = create_as(uml2.Property, 'attr%d' % i)
+        a.name = 'attr%d' % i
+        c.ownedAttribute = a
+
+
+def run(size=SIZE):
+    factory = ElementFactory()
+    gc.collect()
+    before = maxrss()
+    create_model(factory, size)
+    gc.collect()
+    used = maxrss() - before
+    report('Memory used by %d elements' % factory.size(),
+           ('elements', 'total (MB)', 'bytes/element'),
+           [(factory.size(), used / 1024.0 ** 2, used // factory.size())])
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:2]])
+
+# vim:sw=4:et:ai
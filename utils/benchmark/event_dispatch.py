@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measure how fast model change events are processed during a scripted bulk
+edit.
+
+Classes are created, named and given attributes with a type and a
+multiplicity. Each edit emits events that are handled by the derived and
+redefined properties of the UML model.
+
+This can be called as:
+    python -m utils.benchmark.event_dispatch [classes]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+
+from zope import component
+
+from gaphor.UML import uml2
+from gaphor.UML.elementfactory import ElementFactory
+from gaphor.UML.interfaces import IElementChangeEvent
+from utils.benchmark import timed, report
+
+CLASSES = 2000
+ATTRIBUTES = 5
+
+
+def bulk_edit(factory, package, classes):
+    create = factory.create
+    for i in range(classes):
+        c = create(uml2.Class)
+        c.name = 'Class%d' % i
+        c.package = package
+        for j in range(ATTRIBUTES):
+            a = create(uml2.Property)
+            a.name = 'attr%d' % j
+            a.type = c
+            a.upperValue = '*'
+            c.ownedAttribute = a
+
+
+def run(classes=CLASSES):
+    events = [0]
+
+    @component.adapter(IElementChangeEvent)
+    def count(event):
+        events[0] += 1
+
+    factory = ElementFactory()
+    package = factory.create(uml2.Package)
+    component.provideHandler(count)
+    try:
+        seconds, _ = timed(bulk_edit, factory, package, classes)
+    finally:
+        component.getGlobalSiteManager().unregisterHandler(count)
+    report('Bulk edit of %d classes' % classes,
+           ('elements', 'events', 'time (s)', 'events/s'),
+           [(factory.size(), events[0], seconds, events[0] / seconds)])
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:2]])
+
+# vim:sw=4:et:ai
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measure how element creation (as done while loading a model) and flushing
+scale with the amount of elements in the ElementFactory.
+
+This can be called as:
+    python -m utils.benchmark.factory_scaling [size ...]
+
+The time spent per element should be (more or less) constant.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+
+from gaphor.UML import uml2
+from gaphor.UML.elementfactory import ElementFactory
+from utils.benchmark import timed, report
+
+SIZES = (1000, 10000, 100000)
+
+
+def load(factory, size):
+    create_as = factory.create_as
+    for i in range(size):
+        create_as(uml2.Class, 'id%d' % i)
+
+
+def run(sizes=SIZES):
+    rows = []
+    for size in sizes:
+        factory = ElementFactory()
+        t_load, _ = timed(load, factory, size)
+        assert factory.size() == size
+        t_flush, _ = timed(factory.flush)
+        assert factory.size() == 0
+        rows.append((size, t_load, t_flush,
+                     t_load * 1e6 / size, t_flush * 1e6 / size))
+    report('ElementFactory load/flush scaling',
+           ('elements', 'load (s)', 'flush (s)', 'load (us/el)', 'flush (us/el)'),
+           rows)
+
+
+if __name__ == '__main__':
+    run([int(a) for a in sys.argv[1:]] or SIZES)
+
+# vim:sw=4:et:ai
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measure how fast the component registry delivers AttributeChangeEvents.
+
+The dispatch table of ZopeComponentRegistry.handle() is compared with
+zope.component's Components.handle(), which looks up the handlers for
+every event. A number of handlers is registered for other kinds of
+events, like the services of a running Gaphor do. Delivery is measured
+while editing and while loading a model, when the events are blocked by
+an event filter.
+
+This can be called as:
+    python -m utils.benchmark.handler_dispatch [events]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+
+from zope import component
+
+from gaphor.interfaces import IEventFilter
+from gaphor.UML import uml2
+from gaphor.UML.elementfactory import ElementChangedEventBlocker
+from gaphor.UML.event import AttributeChangeEvent
+from gaphor.UML.interfaces import IAttributeChangeEvent, IElementChangeEvent, \
+        IAssociationChangeEvent, IElementCreateEvent, IElementDeleteEvent, \
+        IModelFactoryEvent, IFlushFactoryEvent
+from gaphor.services.componentregistry import ZopeComponentRegistry
+from utils.benchmark import timed, report
+
+EVENTS = 100000
+
+OTHER_EVENTS = (IAssociationChangeEvent, IElementCreateEvent,
+                IElementDeleteEvent, IModelFactoryEvent, IFlushFactoryEvent)
+
+
+def handler_for(iface):
+    @component.adapter(iface)
+    def handler(event):
+        pass
+    return handler
+
+
+def deliver(handle, events):
+    for event in events:
+        handle(event)
+
+
+def run(events=EVENTS):
+    registry = ZopeComponentRegistry()
+    registry.init(None)
+    registry.register_handler(handler_for(IAttributeChangeEvent))
+    registry.register_handler(handler_for(IElementChangeEvent))
+    for iface in OTHER_EVENTS:
+        for i in range(4):
+            registry.register_handler(handler_for(iface))
+
+    element = uml2.Class()
+    event_list = [AttributeChangeEvent(element, uml2.Class.name, None, str(i))
+                  for i in range(events)]
+
+    def zope_handle(event):
+        for adapter in registry.subscribers((event,), IEventFilter):
+            if adapter.filter():
+                return
+        registry._components.handle(event)
+
+    def measure(situation):
+        for name, handle in (('zope lookup', zope_handle),
+                             ('dispatch table', registry.handle)):
+            seconds, _ = timed(deliver, handle, event_list)
+            rows.append((situation, name, events, seconds, events / seconds))
+
+    rows = []
+    measure('editing')
+    # While a model is loaded, change events are blocked
+    registry.register_subscription_adapter(ElementChangedEventBlocker)
+    measure('loading')
+    registry.unregister_subscription_adapter(ElementChangedEventBlocker)
+    registry.shutdown()
+    report('Delivery of %d AttributeChangeEvents' % events,
+           ('situation', 'path', 'events', 'time (s)', 'events/s'), rows)
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:2]])
+
+# vim:sw=4:et:ai
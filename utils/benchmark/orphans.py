@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measure the orphan reference check that is done before a model is saved.
+
+This can be called as:
+    python -m utils.benchmark.orphans [size]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+
+from gaphor.UML import uml2
+from gaphor.UML.elementfactory import ElementFactory
+from gaphor.storage.verify import orphan_references
+from utils.benchmark import timed, report
+from utils.benchmark.derived_cache import create_model
+
+SIZE = 50000
+
+
+def run(size=SIZE):
+    factory = ElementFactory()
+    create_model(factory, size)
+    t_clean, orphans = timed(orphan_references, factory)
+    assert not orphans
+
+    # Refer to an element that is not part of the factory
+    c = uml2.Comment()
+    c.annotatedElement = next(factory.select_type(uml2.Class))
+    t_orphan, orphans = timed(orphan_references, factory)
+    assert orphans == [c]
+
+    report('Orphan reference check',
+           ('elements', 'clean (s)', 'orphan (s)'),
+           [(factory.size(), t_clean, t_orphan)])
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:2]])
+
+# vim:sw=4:et:ai
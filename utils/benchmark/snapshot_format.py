@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2017 Arjan Molenaar <gaphor@gmail.com>
+#                    Dan Yeaw <dan@yeaw.me>
+#
+# This file is part of Gaphor.
+#
+# Gaphor is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Library General Public License as published by the Free
+# Software Foundation, either version 2 of the License, or (at your option)
+# any later version.
+#
+# Gaphor is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Library General Public License 
+# more details.
+#
+# You should have received a copy of the GNU Library General Public 
+# along with Gaphor.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compare the XML model format with the binary snapshot format.
+
+A model is created with the same layout as in derived_cache, with names
+for all elements. It is saved in both formats and loaded again. Save, parse and
+load times and the file sizes are reported. Load includes parsing.
+
+This can be called as:
+    python -m utils.benchmark.snapshot_format [size]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+from cStringIO import StringIO
+
+from gaphor.UML import uml2
+from gaphor.UML.elementfactory import ElementFactory
+from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.storage import storage, snapshot, parser
+from utils.benchmark import timed, report
+from utils.benchmark.derived_cache import create_model
+
+SIZE = 20000
+
+
+def save_xml(factory):
+    out = StringIO()
+    storage.save(XMLWriter(out, buffered=True), factory)
+    return out.getvalue()
+
+
+def save_snapshot(factory):
+    out = StringIO()
+    snapshot.save(out, factory)
+    return out.getvalue()
+
+
+def run(size=SIZE):
+    factory = ElementFactory()
+    create_model(factory, size)
+    for i, e in enumerate(factory.select_type(uml2.NamedElement)):
+        e.name = 'element%d' % i
+
+    rows = []
+    for title, save, parse in (('xml', save_xml, parser.parse),
+                               ('snapshot', save_snapshot, snapshot.parse)):
+        t_save, data = timed(save, factory)
+        t_parse, _ = timed(parse, StringIO(data))
+        loaded = ElementFactory()
+        t_load, _ = timed(storage.load, StringIO(data), loaded)
+        assert loaded.size() == factory.size()
+        rows.append((title, t_save, t_parse, t_load, len(data)))
+
+    report('Save and load %d elements' % factory.size(),
+           ('format', 'save (s)', 'parse (s)', 'load (s)', 'size (bytes)'),
+           rows)
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:2]])
+
+# vim:sw=4:et:ai